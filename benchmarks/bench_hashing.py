@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Compares peak RSS and throughput of the streaming HashGenerator against
+reading the whole file into memory before hashing.
+
+Usage: python benchmarks/bench_hashing.py [SIZE_MB] [CHUNK_SIZE]
+"""
+
+__docformat__ = 'restructuredtext'
+
+import hashlib
+import os
+import sys
+import tempfile
+
+from benchutil import make_file, peak_rss, run_isolated, timed
+
+from victims import HashGenerator, DEFAULT_CHUNK_SIZE
+
+
+def read_all(path):
+    """
+    The pre-streaming implementation: one read of the entire file.
+
+    :Parameters:
+       - `path`: file to hash
+    """
+    f_obj = open(path, 'rb')
+    hash = hashlib.sha512(f_obj.read()).hexdigest()
+    f_obj.close()
+    return hash
+
+
+def child(mode, path, chunk_size):
+    """
+    Hashes path with one implementation and prints "seconds peak_rss_kb".
+
+    :Parameters:
+       - `mode`: either readall or stream
+       - `path`: file to hash
+       - `chunk_size`: chunk size for the streaming implementation
+    """
+    if mode == 'readall':
+        func = read_all
+    else:
+        func = HashGenerator(chunk_size=chunk_size)
+    hash, seconds = timed(func, path)
+    print('%f %d %s' % (seconds, peak_rss(), hash))
+
+
+def main():
+    """
+    Runs both implementations in separate interpreters and prints a table.
+    """
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        return
+
+    size_mb = 256
+    chunk_size = DEFAULT_CHUNK_SIZE
+    if len(sys.argv) > 1:
+        size_mb = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        chunk_size = int(sys.argv[2])
+
+    path = make_file(os.path.join(
+        tempfile.gettempdir(), 'victims-bench-%dmb.bin' % size_mb),
+        size_mb * 1024 * 1024)
+
+    print('%-10s %10s %12s %10s' % ('mode', 'seconds', 'peak RSS KB', 'MB/s'))
+    hashes = set()
+    for mode in ('readall', 'stream'):
+        seconds, rss, hash = run_isolated(
+            __file__, '--child', mode, path, chunk_size).split()
+        hashes.add(hash)
+        seconds = float(seconds)
+        print('%-10s %10.3f %12s %10.1f' % (
+            mode, seconds, rss, size_mb / max(seconds, 1e-9)))
+    if len(hashes) != 1:
+        raise SystemExit('Implementations disagree on the digest!')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Compares peak RSS and time of looking inside an rpm with the streaming
+RPMArchive against buffering the whole payload and every member.
+
+Usage: python benchmarks/bench_rpm.py [RPM]
+
+Without an rpm a synthetic payload is generated and read with cat in place
+of rpm2cpio.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import os
+import subprocess
+import sys
+import tempfile
+
+from StringIO import StringIO
+
+from benchutil import peak_rss, run_isolated, timed, write_cpio
+
+from victims import HashGenerator
+from victims.archivers import RPMArchive
+from victims.archivers.cpio import iter_cpio
+
+SUFFIXES = ('jar', 'war', 'egg', 'zip', 'tar.gz', 'rpm')
+
+
+def buffered(path):
+    """
+    The pre-streaming approach: the whole payload is read into memory and
+    a copy of every member is made before any hashing.
+
+    :Parameters:
+       - `path`: rpm to look inside of
+    """
+    p = subprocess.Popen([RPMArchive.RPM2CPIO, path], stdout=subprocess.PIPE)
+    payload = StringIO(p.communicate()[0])
+    members = {}
+    for name, member in iter_cpio(payload):
+        members[name] = StringIO(member.read())
+    hasher = HashGenerator()
+    return [hasher(members[x]) for x in members if x.endswith(SUFFIXES)]
+
+
+def streamed(path):
+    """
+    Hashes matching members straight from the rpm2cpio pipe.
+
+    :Parameters:
+       - `path`: rpm to look inside of
+    """
+    hasher = HashGenerator()
+    return [hasher(member) for name, member in RPMArchive(path).members(
+        lambda x: x.endswith(SUFFIXES))]
+
+
+def main():
+    """
+    Runs both approaches in separate interpreters and prints a table.
+    """
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        mode, path = sys.argv[2:4]
+        if len(sys.argv) > 4:
+            RPMArchive.RPM2CPIO = sys.argv[4]
+        func = {'buffered': buffered, 'streamed': streamed}[mode]
+        hashes, seconds = timed(func, path)
+        print('%f %d %d' % (seconds, peak_rss(), len(hashes)))
+        return
+
+    extra = []
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        path = os.path.join(tempfile.gettempdir(), 'victims-bench.cpio')
+        if not os.path.isfile(path):
+            # A payload dominated by non package files, like most rpms
+            write_cpio(path, [
+                ('./usr/share/java/lib%d.jar' % x, 2 * 1024 * 1024)
+                for x in range(16)] + [
+                ('./usr/lib/data%d.bin' % x, 16 * 1024 * 1024)
+                for x in range(16)])
+        extra = ['cat']
+
+    size_mb = os.path.getsize(path) / (1024.0 * 1024)
+    print('%s (%.1f MB)' % (path, size_mb))
+    print('%-10s %10s %12s %10s %8s' % (
+        'mode', 'seconds', 'peak RSS KB', 'MB/s', 'members'))
+    for mode in ('buffered', 'streamed'):
+        seconds, rss, count = run_isolated(
+            __file__, '--child', mode, path, *extra).split()
+        seconds = float(seconds)
+        print('%-10s %10.3f %12s %10.1f %8s' % (
+            mode, seconds, rss, size_mb / max(seconds, 1e-9), count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+#
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Per rpm latency of listing and hashing rpm members with the in process
+payload reader against running rpm2cpio.
+
+Usage: python benchmarks/bench_rpm_reader.py [RPM ...]
+
+Without rpms a set of small synthetic rpms is generated. rpm2cpio is only
+measured when it is installed.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import os
+import sys
+import tempfile
+
+from benchutil import percentile, timed, write_rpm
+
+from victims import HashGenerator
+from victims.archivers import RPMArchive
+
+SUFFIXES = ('jar', 'war', 'egg', 'zip', 'tar.gz', 'rpm')
+
+
+def scan(path):
+    """
+    Hashes every package inside an rpm.
+
+    :Parameters:
+       - `path`: the rpm
+    """
+    hasher = HashGenerator()
+    return [hasher(member) for name, member in RPMArchive(path).members(
+        lambda x: x.endswith(SUFFIXES))]
+
+
+def has_rpm2cpio():
+    """
+    Checks if rpm2cpio is on the PATH.
+    """
+    for directory in os.environ.get('PATH', '').split(os.pathsep):
+        if os.access(os.path.join(directory, RPMArchive.RPM2CPIO), os.X_OK):
+            return True
+    return False
+
+
+def main():
+    """
+    Times each reader over every rpm and prints latency percentiles.
+    """
+    paths = sys.argv[1:]
+    if not paths:
+        tmp = tempfile.gettempdir()
+        paths = [write_rpm(os.path.join(tmp, 'victims-bench-%d.rpm' % x), [
+            ('./usr/share/java/lib%d.jar' % y, 32 * 1024) for y in range(4)
+        ] + [('./usr/share/doc/README', 4096)]) for x in range(200)]
+
+    readers = [('native', True)]
+    if has_rpm2cpio():
+        readers.append(('rpm2cpio', False))
+    else:
+        print('rpm2cpio not found, only timing the native reader')
+
+    print('%-10s %8s %10s %10s %10s' % (
+        'reader', 'rpms', 'p50 ms', 'p90 ms', 'p99 ms'))
+    for name, native in readers:
+        RPMArchive.NATIVE = native
+        times = [timed(scan, path)[1] * 1000 for path in paths]
+        print('%-10s %8d %10.2f %10.2f %10.2f' % (
+            name, len(paths), percentile(times, 50),
+            percentile(times, 90), percentile(times, 99)))
+
+
+if __name__ == '__main__':
+    main()
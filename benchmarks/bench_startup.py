@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+#
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Start up cost of the command line entry points. Each module is imported in
+a fresh interpreter and the wall time of the whole process is reported
+along with whether SQLAlchemy was loaded.
+
+Usage: python benchmarks/bench_startup.py [RUNS]
+       python benchmarks/bench_startup.py --importtime MODULE
+
+--importtime prints a per module report like python -X importtime, which
+older interpreters don't have.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import os
+import subprocess
+import sys
+
+from benchutil import SRC_DIR, percentile, timed
+
+#: Modules behind the command line scripts, cheapest first
+MODULES = (
+    'victims',
+    'victims.daemon',
+    'victims.scripts.version_check',
+    'victims.scripts.scan_packages',
+    'victims.scripts.update_db',
+)
+
+# Run in the child so nothing but the target is imported before timing
+_CHILD = '''
+import sys
+import time
+start = time.time()
+import %s
+print('%%f %%d %%d' %% (
+    time.time() - start, len(sys.modules), 'sqlalchemy' in sys.modules))
+'''
+
+# Wraps __import__ to time each module the first time it is imported
+_IMPORTTIME = '''
+import __builtin__
+import sys
+import time
+
+_import = __builtin__.__import__
+_stack = []
+_report = []
+
+
+def _timed_import(name, *args, **kwargs):
+    if name in sys.modules:
+        return _import(name, *args, **kwargs)
+    _stack.append(0.0)
+    start = time.time()
+    try:
+        return _import(name, *args, **kwargs)
+    finally:
+        cumulative = time.time() - start
+        children = _stack.pop()
+        if _stack:
+            _stack[-1] += cumulative
+        _report.append((len(_stack), name, cumulative - children, cumulative))
+
+__builtin__.__import__ = _timed_import
+import %s
+__builtin__.__import__ = _import
+print('import time: self [us] | cumulative | imported package')
+for depth, name, own, cumulative in _report:
+    print('import time: %%9d | %%10d | %%s%%s' %% (
+        own * 1e6, cumulative * 1e6, '  ' * depth, name))
+'''
+
+
+def _run(code):
+    """
+    Runs code in a fresh interpreter using the in tree sources and returns
+    its stdout.
+
+    :Parameters:
+       - `code`: python source to run
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [SRC_DIR] + [x for x in [env.get('PYTHONPATH')] if x])
+    p = subprocess.Popen(
+        [sys.executable, '-c', code], stdout=subprocess.PIPE, env=env)
+    out = p.communicate()[0]
+    if p.returncode != 0:
+        raise SystemExit('Running %r failed' % code)
+    return out
+
+
+def import_time(module):
+    """
+    Returns the -X importtime style report for importing module.
+
+    :Parameters:
+       - `module`: name of the module to import
+    """
+    return _run(_IMPORTTIME % module)
+
+
+def measure(module):
+    """
+    Imports module in a fresh interpreter and returns (process seconds,
+    import seconds, modules loaded, if SQLAlchemy was loaded).
+
+    :Parameters:
+       - `module`: name of the module to import
+    """
+    out, seconds = timed(_run, _CHILD % module)
+    import_seconds, modules, sqlalchemy = out.split()
+    return (seconds, float(import_seconds), int(modules), sqlalchemy == '1')
+
+
+def main():
+    """
+    Measures every module and prints a table.
+    """
+    if len(sys.argv) > 2 and sys.argv[1] == '--importtime':
+        sys.stdout.write(import_time(sys.argv[2]))
+        return
+
+    runs = 10
+    if len(sys.argv) > 1:
+        runs = int(sys.argv[1])
+
+    print('%-32s %9s %9s %9s %8s %10s' % (
+        'module', 'p50 ms', 'p90 ms', 'import ms', 'modules', 'sqlalchemy'))
+    for module in MODULES:
+        results = [measure(module) for x in range(runs)]
+        print('%-32s %9.1f %9.1f %9.1f %8d %10s' % (
+            module,
+            percentile([x[0] for x in results], 50) * 1000,
+            percentile([x[0] for x in results], 90) * 1000,
+            percentile([x[1] for x in results], 50) * 1000,
+            results[0][2], results[0][3] and 'yes' or 'no'))
+
+
+if __name__ == '__main__':
+    main()
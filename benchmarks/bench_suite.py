@@ -0,0 +1,493 @@
+#!/usr/bin/env python
+#
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Benchmark suite over synthetic corpora. Measures walking, finding,
+hashing, reading archives and database lookups, each case in a fresh
+interpreter so peak RSS belongs to that case alone. Results can be saved
+as a baseline and later runs compared against it.
+
+Usage: python benchmarks/bench_suite.py [--scale SCALE] [--runs N]
+           [--save FILE] [--compare FILE] [--threshold PERCENT] [CASE ...]
+
+Corpora are built once per scale under the temporary directory and reused,
+see corpus.py. The exit code is 1 when --compare finds a regression beyond
+the threshold.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from argparse import ArgumentParser
+
+import corpus
+from benchutil import peak_rss, percentile, run_isolated
+
+from victims import HashGenerator, PackageFinder
+from victims.archivers import Archive
+from victims.metrics import METRICS
+
+#: Hashes looked up per query by the batch lookup measurements
+LOOKUP_BATCH = 500
+
+#: Default percent a metric may get worse by before it is a regression
+DEFAULT_THRESHOLD = 10.0
+
+#: Version of the results layout
+RESULTS_VERSION = 1
+
+
+def _mb(size):
+    """
+    Returns size bytes in megabytes.
+
+    :Parameters:
+       - `size`: number of bytes
+    """
+    return size / (1024.0 * 1024.0)
+
+
+def _rate(count, seconds):
+    """
+    Returns count per second.
+
+    :Parameters:
+       - `count`: number of things done
+       - `seconds`: time it took
+    """
+    return count / max(seconds, 1e-9)
+
+
+def case_walk_os(description):
+    """
+    Walks the tree with the os walker.
+
+    :Parameters:
+       - `description`: the corpus description
+    """
+    return _walk(description, 'os')
+
+
+def case_walk_threaded(description):
+    """
+    Walks the tree with the threaded walker.
+
+    :Parameters:
+       - `description`: the corpus description
+    """
+    return _walk(description, 'threaded')
+
+
+def _walk(description, name):
+    """
+    Walks the tree with a walker from victims.walkers.WALKERS.
+
+    :Parameters:
+       - `description`: the corpus description
+       - `name`: name of the walker
+    """
+    from victims.walkers import WALKERS
+    walker = WALKERS[name]()
+    start = time.time()
+    for root, files in walker(description['tree']):
+        pass
+    seconds = time.time() - start
+    return {
+        'seconds': seconds,
+        'files': walker.files,
+        'files_per_sec': _rate(walker.files, seconds),
+        'dirs_per_sec': _rate(walker.dirs, seconds),
+    }
+
+
+def case_find(description):
+    """
+    Finds the packages of the tree without hashing them.
+
+    :Parameters:
+       - `description`: the corpus description
+    """
+    start = time.time()
+    found = len(list(PackageFinder().iter(description['tree'])))
+    seconds = time.time() - start
+    return {
+        'seconds': seconds,
+        'packages': found,
+        'files_per_sec': _rate(description['tree_files'], seconds),
+    }
+
+
+def case_scan(description):
+    """
+    Scans the tree end to end: find, hash and look up every package.
+
+    :Parameters:
+       - `description`: the corpus description
+    """
+    from victims.lite import LiteConnection
+    from victims.scanner import Scanner
+
+    scanner = Scanner(
+        {}, LiteConnection(description['database']), cache=False, jobs=1)
+    start = time.time()
+    for match in scanner.scan([description['tree']], scanner.finder()):
+        pass
+    seconds = time.time() - start
+    return {
+        'seconds': seconds,
+        'packages': scanner.scanned,
+        'files_per_sec': _rate(description['tree_files'], seconds),
+        'packages_per_sec': _rate(scanner.scanned, seconds),
+    }
+
+
+def case_hash(description):
+    """
+    Hashes the large jar as a file.
+
+    :Parameters:
+       - `description`: the corpus description
+    """
+    start = time.time()
+    HashGenerator()(description['jar'])
+    seconds = time.time() - start
+    return {
+        'seconds': seconds,
+        'mb_per_sec': _rate(_mb(os.path.getsize(description['jar'])),
+                            seconds),
+    }
+
+
+def case_members(description):
+    """
+    Inflates and hashes every member of the large jar.
+
+    :Parameters:
+       - `description`: the corpus description
+    """
+    return _hash_members(description['jar'])
+
+
+def case_tarball(description):
+    """
+    Decompresses and hashes every jar in the tarball.
+
+    :Parameters:
+       - `description`: the corpus description
+    """
+    return _hash_members(description['tarball'])
+
+
+def _hash_members(path):
+    """
+    Hashes every member of an archive.
+
+    :Parameters:
+       - `path`: path to the archive
+    """
+    METRICS.reset()
+    start = time.time()
+    members = len(list(Archive(path).hash_members(HashGenerator())))
+    seconds = time.time() - start
+    return {
+        'seconds': seconds,
+        'members': members,
+        'members_per_sec': _rate(members, seconds),
+        'mb_per_sec': _rate(_mb(METRICS.counters['bytes_hashed']), seconds),
+    }
+
+
+def case_nested(description):
+    """
+    Looks two levels deep into the war of nested jars.
+
+    :Parameters:
+       - `description`: the corpus description
+    """
+    METRICS.reset()
+    finder = PackageFinder(look_inside=True, depth=2)
+    start = time.time()
+    found = len(list(finder.iter(description['war'])))
+    seconds = time.time() - start
+    return {
+        'seconds': seconds,
+        'packages': found,
+        'packages_per_sec': _rate(found, seconds),
+        'mb_per_sec': _rate(_mb(METRICS.counters['bytes_hashed']), seconds),
+    }
+
+
+def case_lookup_lite(description):
+    """
+    Looks hashes up through victims.lite.LiteConnection.
+
+    :Parameters:
+       - `description`: the corpus description
+    """
+    from victims.lite import LiteConnection
+    return _lookups(description, LiteConnection(description['database']))
+
+
+def case_lookup_orm(description):
+    """
+    Looks hashes up through the SQLAlchemy victims.db.Connection.
+
+    :Parameters:
+       - `description`: the corpus description
+    """
+    from victims.db import Connection
+    return _lookups(description, Connection(
+        {'database': {'url': 'sqlite:///' + description['database']}}))
+
+
+def _lookups(description, connection):
+    """
+    Measures latency of single hash lookups, half of which match, and of
+    lookups of LOOKUP_BATCH hashes at a time.
+
+    :Parameters:
+       - `description`: the corpus description
+       - `connection`: connection to look up with
+    """
+    rows = description['params']['cvemap_rows']
+    lookups = min(description['params']['lookups'], rows)
+    matching = [corpus.package_hash('package%d' % x)
+                for x in range(0, rows, rows / lookups)][:lookups]
+    missing = [corpus.package_hash('missing%d' % x)
+               for x in range(len(matching))]
+    latencies = []
+    found = 0
+    for hashes in zip(matching, missing):
+        for hash in hashes:
+            start = time.time()
+            found += len(list(connection.lookup([hash], ['JAR'])))
+            latencies.append(time.time() - start)
+    made_up = [corpus.package_hash('package%d' % x)
+               for x in range(description['params']['cvemap_rows'])]
+    batch_latencies = []
+    for x in range(0, min(len(made_up), LOOKUP_BATCH * 20), LOOKUP_BATCH):
+        batch = made_up[x:x + LOOKUP_BATCH]
+        start = time.time()
+        found += len(list(connection.lookup(batch, ['JAR'])))
+        batch_latencies.append(time.time() - start)
+    return {
+        'lookups': len(latencies),
+        'found': found,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'batch_p50_ms': percentile(batch_latencies, 50) * 1000,
+        'lookups_per_sec': _rate(
+            len(latencies) + len(batch_latencies) * LOOKUP_BATCH,
+            sum(latencies) + sum(batch_latencies)),
+    }
+
+
+#: Benchmark cases by name, in the order they run
+CASES = (
+    ('walk_os', case_walk_os),
+    ('walk_threaded', case_walk_threaded),
+    ('find', case_find),
+    ('hash', case_hash),
+    ('members', case_members),
+    ('tarball', case_tarball),
+    ('nested', case_nested),
+    ('lookup_lite', case_lookup_lite),
+    ('lookup_orm', case_lookup_orm),
+    ('scan', case_scan),
+)
+
+
+def better(metric):
+    """
+    Returns 1 when a bigger value of metric is better, -1 when a smaller
+    one is and 0 for counts which are not compared.
+
+    :Parameters:
+       - `metric`: name of the metric
+    """
+    if metric.endswith('_per_sec'):
+        return 1
+    if metric.endswith(('_ms', '_kb')) or metric == 'seconds':
+        return -1
+    return 0
+
+
+def child(case, description_path):
+    """
+    Runs one case and prints its results as json.
+
+    :Parameters:
+       - `case`: name of the case
+       - `description_path`: path to the corpus.json of the corpus
+    """
+    description = json.load(open(description_path))
+    results = dict(CASES)[case](description)
+    results['peak_rss_kb'] = peak_rss()
+    print(json.dumps(results))
+
+
+def run_case(case, description_path, runs):
+    """
+    Runs a case runs times, each in a fresh interpreter, and returns the
+    median of every metric.
+
+    :Parameters:
+       - `case`: name of the case
+       - `description_path`: path to the corpus.json of the corpus
+       - `runs`: how many times to run the case
+    """
+    script = os.path.realpath(__file__)
+    results = [json.loads(run_isolated(
+        script, '--child', case, description_path)) for x in range(runs)]
+    return dict((metric, percentile([x[metric] for x in results], 50))
+                for metric in results[0])
+
+
+def commit():
+    """
+    Returns the short id of the checked out commit, or None outside of a
+    git checkout.
+    """
+    try:
+        p = subprocess.Popen(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.realpath(__file__)),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError:
+        return None
+    out = p.communicate()[0].strip()
+    return p.returncode == 0 and out or None
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Returns a list of (case, metric, before, after, percent change,
+    regressed) for every metric of current which baseline also has.
+    percent change is positive when the metric got better.
+
+    :Parameters:
+       - `baseline`: results loaded from an earlier run
+       - `current`: results of this run
+       - `threshold`: percent a metric may get worse by before it regressed
+    """
+    rows = []
+    for case, metrics in sorted(current['cases'].items()):
+        before_metrics = baseline['cases'].get(case, {})
+        for metric, after in sorted(metrics.items()):
+            direction = better(metric)
+            before = before_metrics.get(metric)
+            if not direction or before is None:
+                continue
+            if before:
+                change = direction * (after - before) * 100.0 / before
+            else:
+                change = 0.0
+            rows.append((case, metric, before, after, change,
+                         change < -threshold))
+    return rows
+
+
+def main():
+    """
+    Builds the corpus, runs the cases and saves or compares the results.
+    """
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2], sys.argv[3])
+        return
+
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--scale", dest="scale", default="small",
+        choices=sorted(corpus.SCALES.keys()),
+        help="Size of the corpus (default: small)")
+    parser.add_argument(
+        "--corpus-dir", dest="corpus_dir", default=corpus.default_root(),
+        metavar="DIR", help="Where corpora are built and kept")
+    parser.add_argument(
+        "--runs", dest="runs", type=int, default=3, metavar="N",
+        help="Runs of each case, the median is kept (default: 3)")
+    parser.add_argument(
+        "--save", dest="save", default=None, metavar="FILE",
+        help="Save the results as a baseline")
+    parser.add_argument(
+        "--compare", dest="compare", default=None, metavar="FILE",
+        help="Compare the results against a saved baseline")
+    parser.add_argument(
+        "--threshold", dest="threshold", type=float,
+        default=DEFAULT_THRESHOLD, metavar="PERCENT",
+        help="Percent worse a metric may get before it is a regression")
+    parser.add_argument(
+        'cases', metavar='CASE', nargs='*',
+        help='Cases to run: %s (default: all)' % ', '.join(
+            x[0] for x in CASES))
+    args = parser.parse_args()
+
+    cases = args.cases or [x[0] for x in CASES]
+    unknown = set(cases) - set(dict(CASES))
+    if unknown:
+        parser.error('unknown cases: %s' % ', '.join(sorted(unknown)))
+    start = time.time()
+    description = corpus.build(args.corpus_dir, args.scale)
+    description_path = os.path.join(
+        args.corpus_dir, args.scale, 'corpus.json')
+    sys.stderr.write('Corpus ready in %.1f seconds\n' % (
+        time.time() - start))
+
+    results = {
+        'version': RESULTS_VERSION,
+        'scale': args.scale,
+        'commit': commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'cases': {},
+    }
+    for case in cases:
+        metrics = results['cases'][case] = run_case(
+            case, description_path, args.runs)
+        print('%-14s %s' % (case, '  '.join(
+            '%s=%.6g' % x for x in sorted(metrics.items()))))
+
+    if args.save:
+        out = open(args.save, 'w')
+        json.dump(results, out, indent=1, sort_keys=True)
+        out.close()
+
+    if args.compare:
+        baseline = json.load(open(args.compare))
+        if baseline['scale'] != args.scale:
+            raise SystemExit('%s was made with --scale %s' % (
+                args.compare, baseline['scale']))
+        print('')
+        print('Compared to %s (%s)' % (
+            args.compare, baseline.get('commit') or 'unknown commit'))
+        print('%-14s %-16s %12s %12s %9s' % (
+            'case', 'metric', 'baseline', 'current', 'change'))
+        regressions = 0
+        for row in compare(baseline, results, args.threshold):
+            case, metric, before, after, change, regressed = row
+            regressions += regressed
+            print('%-14s %-16s %12.6g %12.6g %+8.1f%%%s' % (
+                case, metric, before, after, change,
+                regressed and ' REGRESSED' or ''))
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
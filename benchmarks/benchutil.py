@@ -0,0 +1,192 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Helpers shared by the benchmark scripts.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import os
+import resource
+import struct
+import subprocess
+import sys
+import time
+import zlib
+
+# Make the in tree sources importable without installing them
+SRC_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src')
+sys.path.insert(0, SRC_DIR)
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of the current process in kilobytes.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # OSX reports bytes, everything else kilobytes
+    if sys.platform == 'darwin':
+        return usage / 1024
+    return usage
+
+
+def make_file(path, size, block=1024 * 1024):
+    """
+    Writes size bytes of random data to path unless it already exists with
+    the right size.
+
+    :Parameters:
+       - `path`: where to write the file
+       - `size`: size of the file in bytes
+       - `block`: bytes of random data written at a time
+    """
+    if os.path.isfile(path) and os.path.getsize(path) == size:
+        return path
+    out = open(path, 'wb')
+    try:
+        remaining = size
+        while remaining > 0:
+            out.write(os.urandom(min(block, remaining)))
+            remaining -= block
+    finally:
+        out.close()
+    return path
+
+
+def timed(func, *args, **kwargs):
+    """
+    Calls func and returns a tuple of (result, wall seconds).
+
+    :Parameters:
+       - `func`: callable to time
+       - `args`: positional arguments for func
+       - `kwargs`: keyword arguments for func
+    """
+    start = time.time()
+    result = func(*args, **kwargs)
+    return (result, time.time() - start)
+
+
+def run_isolated(script, *args):
+    """
+    Runs script in a fresh interpreter so peak RSS is not shared between
+    measurements and returns its stripped stdout.
+
+    :Parameters:
+       - `script`: path to the python script to run
+       - `args`: arguments passed to the script
+    """
+    p = subprocess.Popen(
+        [sys.executable, script] + [str(x) for x in args],
+        stdout=subprocess.PIPE)
+    out = p.communicate()[0]
+    if p.returncode != 0:
+        raise SystemExit('%s failed' % script)
+    return out.strip()
+
+
+def write_cpio(path, entries, block=1024 * 1024):
+    """
+    Writes a newc cpio archive, the rpm payload format, of random data.
+    rpm2cpio can be swapped for cat to read it as if it were an rpm.
+
+    :Parameters:
+       - `path`: where to write the archive
+       - `entries`: list of (name, size) regular files
+       - `block`: bytes of random data written at a time
+    """
+    out = open(path, 'wb')
+    try:
+        written = [0]
+
+        def write(data):
+            out.write(data)
+            written[0] += len(data)
+
+        def pad():
+            write('\0' * ((4 - written[0] % 4) % 4))
+
+        for ino, (name, size) in enumerate(entries + [('TRAILER!!!', 0)]):
+            name += '\0'
+            write('070701' + ''.join('%08x' % x for x in (
+                ino, 0100644, 0, 0, 1, 0, size, 0, 0, 0, 0, len(name), 0)))
+            write(name)
+            pad()
+            remaining = size
+            while remaining > 0:
+                write(os.urandom(min(block, remaining)))
+                remaining -= block
+            pad()
+    finally:
+        out.close()
+    return path
+
+
+def _rpm_header(tags):
+    """
+    Returns an rpm header structure holding string tags.
+
+    :Parameters:
+       - `tags`: dict of tag number to string value
+    """
+    index = ''
+    store = ''
+    for tag, value in sorted(tags.items()):
+        index += struct.pack('>iiii', tag, 6, len(store), 1)
+        store += value + '\0'
+    return ('\x8e\xad\xe8\x01\0\0\0\0' +
+            struct.pack('>II', len(tags), len(store)) + index + store)
+
+
+def write_rpm(path, entries, block=1024 * 1024):
+    """
+    Writes a minimal rpm with a gzip compressed cpio payload of random
+    data. Enough for victims to read, not for rpm to install.
+
+    :Parameters:
+       - `path`: where to write the rpm
+       - `entries`: list of (name, size) regular files
+       - `block`: bytes compressed at a time
+    """
+    cpio_path = write_cpio(path + '.cpio', entries, block)
+    signature = _rpm_header({})
+    signature += '\0' * ((8 - len(signature) % 8) % 8)
+    out = open(path, 'wb')
+    try:
+        out.write('\xed\xab\xee\xdb' + '\0' * 92 + signature)
+        out.write(_rpm_header({1124: 'cpio', 1125: 'gzip'}))
+        gz = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        cpio = open(cpio_path, 'rb')
+        try:
+            for data in iter(lambda: cpio.read(block), ''):
+                out.write(gz.compress(data))
+        finally:
+            cpio.close()
+        out.write(gz.flush())
+    finally:
+        out.close()
+    os.unlink(cpio_path)
+    return path
+
+
+def percentile(values, percent):
+    """
+    Returns the value below which percent of the sorted values fall.
+
+    :Parameters:
+       - `values`: list of numbers
+       - `percent`: 0 to 100
+    """
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = int(round((len(values) - 1) * percent / 100.0))
+    return values[index]
@@ -0,0 +1,419 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Synthetic corpora for the benchmark suite. Every byte comes from a fixed
+seed so the same scale builds the same files, and the same hashes, on
+every machine and every run.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import zipfile
+
+from StringIO import StringIO
+
+# Puts the in tree sources on the path
+import benchutil
+
+from victims.lite import CVEMAP_COLUMNS, SCHEMA_TABLE, SCHEMA_VERSION
+
+#: Bumped whenever the builders change what they write
+CORPUS_VERSION = 2
+
+#: Parameters of each corpus size
+SCALES = {
+    'tiny': {
+        'tree_depth': 2, 'tree_fanout': 2, 'files_per_dir': 4,
+        'jar_mb': 1, 'jar_members': 16, 'war_jars': 4,
+        'nested_members': 4, 'tar_members': 8, 'cvemap_rows': 1000,
+        'lookups': 50,
+    },
+    'small': {
+        'tree_depth': 3, 'tree_fanout': 4, 'files_per_dir': 10,
+        'jar_mb': 16, 'jar_members': 200, 'war_jars': 100,
+        'nested_members': 20, 'tar_members': 200, 'cvemap_rows': 100000,
+        'lookups': 2000,
+    },
+    'medium': {
+        'tree_depth': 4, 'tree_fanout': 6, 'files_per_dir': 20,
+        'jar_mb': 128, 'jar_members': 1000, 'war_jars': 300,
+        'nested_members': 50, 'tar_members': 1000, 'cvemap_rows': 1000000,
+        'lookups': 5000,
+    },
+    'large': {
+        'tree_depth': 5, 'tree_fanout': 6, 'files_per_dir': 20,
+        'jar_mb': 512, 'jar_members': 4000, 'war_jars': 800,
+        'nested_members': 50, 'tar_members': 4000, 'cvemap_rows': 5000000,
+        'lookups': 10000,
+    },
+}
+
+#: Every nth file of the tree is a package, the rest are other files
+PACKAGE_EVERY = 5
+
+#: Size of the pseudo random block all file contents are cut from
+BLOCK_SIZE = 1024 * 1024
+
+#: Time stamp of every member of the generated zips
+FIXED_TIME = (2013, 1, 1, 0, 0, 0)
+
+#: Rows written per transaction when filling the cvemap
+ROWS_PER_COMMIT = 50000
+
+
+class Content(object):
+    """
+    Deterministic, incompressible file contents. A block is generated once
+    from a seed and contents are cut from it at an offset depending on a
+    name, so files with different names differ.
+    """
+
+    __slots__ = ['__block']
+
+    def __init__(self, seed='victims'):
+        """
+        Generates the block.
+
+        :Parameters:
+           - `seed`: string every byte is derived from
+        """
+        digests = []
+        digest = hashlib.sha512(seed).digest()
+        for x in range(BLOCK_SIZE / len(digest)):
+            digest = hashlib.sha512(digest).digest()
+            digests.append(digest)
+        self.__block = ''.join(digests)
+
+    def chunks(self, name, size):
+        """
+        Yields the size bytes of the contents for name in chunks.
+
+        :Parameters:
+           - `name`: what the contents are for
+           - `size`: number of bytes
+        """
+        header = name[:size]
+        yield header
+        size -= len(header)
+        offset = int(hashlib.md5(name).hexdigest(), 16) % BLOCK_SIZE
+        while size > 0:
+            chunk = self.__block[offset:offset + size]
+            yield chunk
+            size -= len(chunk)
+            offset = 0
+
+    def data(self, name, size):
+        """
+        Returns the size bytes of the contents for name.
+
+        :Parameters:
+           - `name`: what the contents are for
+           - `size`: number of bytes
+        """
+        return ''.join(self.chunks(name, size))
+
+
+def package_hash(name):
+    """
+    Returns the hash the cvemap holds for a made up package, package0 up
+    to the number of rows. Made up hashes never match a file of the
+    corpus.
+
+    :Parameters:
+       - `name`: name of the package
+    """
+    return hashlib.sha512('row:' + name).hexdigest()
+
+
+def build_tree(root, content, depth, fanout, files_per_dir):
+    """
+    Builds a tree of directories fanout wide and depth deep with
+    files_per_dir files in each directory. Returns the number of files
+    and the number of packages among them.
+
+    :Parameters:
+       - `root`: directory to build the tree in
+       - `content`: Content the files are cut from
+       - `depth`: levels of directories
+       - `fanout`: directories in each directory
+       - `files_per_dir`: files in each directory
+    """
+    files = packages = 0
+    dirs = [root]
+    for level in range(depth + 1):
+        next_dirs = []
+        for path in dirs:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            for x in range(files_per_dir):
+                if (files + x) % PACKAGE_EVERY == 0:
+                    name = 'lib%d.jar' % x
+                    packages += 1
+                else:
+                    name = 'Class%d.class' % x
+                name = os.path.join(path, name)
+                out = open(name, 'wb')
+                out.write(content.data(name[len(root):], 1024 + x * 64))
+                out.close()
+            files += files_per_dir
+            if level < depth:
+                next_dirs += [
+                    os.path.join(path, 'd%d' % x) for x in range(fanout)]
+        dirs = next_dirs
+    return (files, packages)
+
+
+def jar_data(content, name, members, member_size):
+    """
+    Returns the bytes of a jar with members deflated class files.
+
+    :Parameters:
+       - `content`: Content the members are cut from
+       - `name`: name of the jar, making its members unique
+       - `members`: number of members
+       - `member_size`: size of each member in bytes
+    """
+    out = StringIO()
+    write_jar(out, content, name, members, member_size)
+    return out.getvalue()
+
+
+def write_jar(f_obj, content, name, members, member_size):
+    """
+    Writes a jar with members deflated class files.
+
+    :Parameters:
+       - `f_obj`: path or file like object to write to
+       - `content`: Content the members are cut from
+       - `name`: name of the jar, making its members unique
+       - `members`: number of members
+       - `member_size`: size of each member in bytes
+    """
+    zf = zipfile.ZipFile(f_obj, 'w', zipfile.ZIP_DEFLATED)
+    _write_member(zf, 'META-INF/MANIFEST.MF', 'Manifest-Version: 1.0\n')
+    for x in range(members):
+        member = 'org/example/Class%d.class' % x
+        _write_member(
+            zf, member, content.data(name + '!/' + member, member_size))
+    zf.close()
+
+
+def _write_member(zf, name, data):
+    """
+    Adds a member to a zip with a fixed time stamp so the zip comes out
+    the same every time.
+
+    :Parameters:
+       - `zf`: zipfile.ZipFile open for writing
+       - `name`: name of the member
+       - `data`: contents of the member
+    """
+    info = zipfile.ZipInfo(name, FIXED_TIME)
+    info.compress_type = zf.compression
+    info.external_attr = 0644 << 16
+    zf.writestr(info, data)
+
+
+def build_war(path, content, jars, members, member_size):
+    """
+    Builds a war holding jars nested jars. Returns the sha512 of every
+    nested jar.
+
+    :Parameters:
+       - `path`: where to write the war
+       - `content`: Content the files are cut from
+       - `jars`: number of nested jars
+       - `members`: members of each nested jar
+       - `member_size`: size of each member in bytes
+    """
+    hashes = []
+    zf = zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED)
+    for x in range(jars):
+        name = 'WEB-INF/lib/lib%d.jar' % x
+        data = jar_data(content, name, members, member_size)
+        hashes.append(hashlib.sha512(data).hexdigest())
+        _write_member(zf, name, data)
+    zf.close()
+    return hashes
+
+
+def build_tarball(path, content, members, member_size):
+    """
+    Builds a gzip compressed tarball of jars. Returns the sha512 of every
+    jar.
+
+    :Parameters:
+       - `path`: where to write the tarball
+       - `content`: Content the files are cut from
+       - `members`: number of jars
+       - `member_size`: size of each jar in bytes
+    """
+    hashes = []
+    # A zero gzip time stamp keeps the tarball the same every time
+    gz = gzip.GzipFile(path, 'wb', mtime=0)
+    tf = tarfile.open(fileobj=gz, mode='w')
+    try:
+        for x in range(members):
+            name = 'lib/lib%d.jar' % x
+            data = content.data(name, member_size)
+            hashes.append(hashlib.sha512(data).hexdigest())
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, StringIO(data))
+    finally:
+        tf.close()
+        gz.close()
+    return hashes
+
+
+def build_cvemap(path, rows, hashes):
+    """
+    Builds a sqlite database in the current layout with rows made up cvemap
+    rows plus a row for each of hashes, so lookups of them match.
+
+    :Parameters:
+       - `path`: where to write the database
+       - `rows`: number of made up rows
+       - `hashes`: hashes of corpus packages to add rows for
+    """
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'CREATE TABLE cvemap (hash VARCHAR(128) PRIMARY KEY, '
+        'name VARCHAR(255), version VARCHAR(50), vendor VARCHAR(255), '
+        'cves TEXT, db_version INTEGER, format VARCHAR(10))')
+    conn.execute(
+        'CREATE TABLE hashcve (hash VARCHAR(128), cve VARCHAR(50), '
+        'PRIMARY KEY (hash, cve))')
+    conn.execute(
+        'CREATE TABLE %s (version INTEGER PRIMARY KEY)' % SCHEMA_TABLE)
+    conn.execute(
+        'INSERT INTO %s VALUES (?)' % SCHEMA_TABLE, (SCHEMA_VERSION,))
+
+    def made_up():
+        for x in xrange(rows):
+            name = 'package%d' % x
+            yield (package_hash(name), name, '1.%d' % (x % 50),
+                   'vendor%d' % (x % 100), 'CVE-2013-%04d' % (x % 10000),
+                   1, 'JAR')
+        for x, hash in enumerate(hashes):
+            yield (hash, 'corpus%d' % x, '1.0', 'vendor', 'CVE-2013-0001',
+                   1, 'JAR')
+
+    insert_cvemap = 'INSERT OR REPLACE INTO cvemap (%s) VALUES (%s)' % (
+        ', '.join(CVEMAP_COLUMNS), ', '.join('?' * len(CVEMAP_COLUMNS)))
+    for batch in _batches(made_up(), ROWS_PER_COMMIT):
+        conn.executemany(insert_cvemap, batch)
+        conn.executemany(
+            'INSERT OR REPLACE INTO hashcve VALUES (?, ?)',
+            [(x[0], x[4]) for x in batch])
+        conn.commit()
+    # The same indexes victims.db creates
+    conn.execute('CREATE INDEX ix_cvemap_format ON cvemap (format)')
+    conn.execute('CREATE INDEX ix_cvemap_name_version '
+                 'ON cvemap (name, version)')
+    conn.execute('CREATE INDEX ix_cvemap_vendor_name ON cvemap (vendor, name)')
+    conn.execute('CREATE INDEX ix_cvemap_db_version ON cvemap (db_version)')
+    conn.execute('CREATE INDEX ix_hashcve_cve ON hashcve (cve)')
+    conn.commit()
+    conn.close()
+
+
+def _batches(iterable, size):
+    """
+    Yields lists of at most size items from iterable.
+
+    :Parameters:
+       - `iterable`: items to batch
+       - `size`: most items per list
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build(root, scale):
+    """
+    Builds the corpus for scale under root unless an identical one is
+    already there. Returns the description written to corpus.json, which
+    holds the parameters, paths and hashes the benchmarks use.
+
+    :Parameters:
+       - `root`: directory holding the corpora of every scale
+       - `scale`: key of SCALES
+    """
+    params = SCALES[scale]
+    path = os.path.join(root, scale)
+    description_path = os.path.join(path, 'corpus.json')
+    if os.path.isfile(description_path):
+        description = json.load(open(description_path))
+        if (description['version'] == CORPUS_VERSION and
+                description['params'] == params):
+            return description
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    content = Content()
+
+    tree = os.path.join(path, 'tree')
+    files, packages = build_tree(
+        tree, content, params['tree_depth'], params['tree_fanout'],
+        params['files_per_dir'])
+
+    jar = os.path.join(path, 'large.jar')
+    write_jar(jar, content, 'large.jar', params['jar_members'],
+              params['jar_mb'] * 1024 * 1024 / params['jar_members'])
+
+    war = os.path.join(path, 'nested.war')
+    war_hashes = build_war(
+        war, content, params['war_jars'], params['nested_members'], 4096)
+
+    tarball = os.path.join(path, 'libs.tar.gz')
+    tar_hashes = build_tarball(
+        tarball, content, params['tar_members'], 64 * 1024)
+
+    database = os.path.join(path, 'victims.db')
+    build_cvemap(database, params['cvemap_rows'], war_hashes + tar_hashes)
+
+    description = {
+        'version': CORPUS_VERSION,
+        'scale': scale,
+        'params': params,
+        'tree': tree,
+        'tree_files': files,
+        'tree_packages': packages,
+        'jar': jar,
+        'war': war,
+        'tarball': tarball,
+        'database': database,
+    }
+    out = open(description_path, 'w')
+    json.dump(description, out, indent=1)
+    out.close()
+    return description
+
+
+def default_root():
+    """
+    Returns where corpora are kept between runs.
+    """
+    return os.path.join(tempfile.gettempdir(), 'victims-corpus')
@@ -20,6 +20,34 @@ requires_api_version = '2.4'
 plugin_type = (TYPE_CORE,)
 
 
+def _scan_with_daemon(paths):
+    """
+    Asks a running victims-daemon to scan paths, which skips the startup
+    cost of victims-scan. Returns True if issues were found, False if not
+    and None if no daemon could be asked.
+
+    :Parameters:
+       - `paths`: paths of the downloaded packages
+    """
+    try:
+        from victims.config import Config
+        from victims.daemon import DaemonError, scan
+        from victims.scripts import (
+            _get_daemon_timeout, _get_default_conf_loc, _get_socket_loc)
+    except ImportError:
+        return None
+    try:
+        conf = Config(_get_default_conf_loc())
+        response = scan(
+            _get_socket_loc(conf), paths, look_inside=True,
+            timeout=_get_daemon_timeout(conf))
+    except DaemonError:
+        return None
+    for match in response['matches']:
+        print(match['package'] + ": " + ','.join(match['cves']))
+    return bool(response['matches'])
+
+
 def postdownload_hook(conduit):
     """
     Hook to catch after download but before installation.
@@ -30,12 +58,12 @@ def postdownload_hook(conduit):
     # Only trigger on installs or updates
     (options, commands) = conduit.getCmdLine()
     if 'install' in commands or 'update' in commands:
-        # Create an executable command based off the package paths
-        exec_command = ['victims-scan', '-l'] + [
-            x.localpath for x in conduit.getDownloadPackages()]
-        # Execute and check the return code ... 1 means issues found
-        ret = subprocess.call(exec_command)
-        if ret == 1:
+        paths = [x.localpath for x in conduit.getDownloadPackages()]
+        found = _scan_with_daemon(paths)
+        if found is None:
+            # No daemon, so run the scanner ... 1 means issues found
+            found = (subprocess.call(['victims-scan', '-l'] + paths) == 1)
+        if found:
             # Warn the user and hope they don't continue ...
             install = conduit.promptYN(("At least one security issue has been "
                 "detected. Installing this set of packages could compromise "
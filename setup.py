@@ -47,6 +47,8 @@ setup(
             'victims-scan = victims.scripts.scan_packages:main',
             'victims-update-db = victims.scripts.update_db:main',
             'victims-find-hash = victims.scripts.find_hash:main',
+            'victims-daemon = victims.scripts.daemon:main',
+            'victims-cve-lookup = victims.scripts.cve_lookup:main',
             'victims-version-check = victims.scripts.version_check:main'],
     },
 
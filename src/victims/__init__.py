@@ -16,26 +16,160 @@ __version__ = '0.0.2.1'
 __author__ = "Steve 'Ashcrow' Milner"
 __license__ = 'GPLv3+'
 
+import collections
+import functools
 import hashlib
 import os
 
-from victims.archivers import Archive
+from StringIO import StringIO
+
+from victims.metrics import METRICS
+from victims.walkers import WALKERS
+
+
+#: Default number of bytes read per chunk when hashing
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+#: Default largest nested package held in memory to look inside of
+DEFAULT_MAX_MEMBER_SIZE = 256 * 1024 * 1024
+
+#: Default most bytes read from inside a package per byte on disk
+DEFAULT_MAX_RATIO = 100
+
+#: Default number of archives whose contents are remembered for their
+#: copies by PackageFinder
+DEFAULT_MEMO_SIZE = 10000
+
+#: Files modified this recently (in seconds) are not remembered by their
+#: fingerprint as a second change within the filesystem's mtime resolution
+#: would go unnoticed
+RACY_WINDOW = 2
+
+
+class ArchiveLimitError(Exception):
+    """
+    Raised when reading inside of a package goes over a safety limit.
+    """
+    pass
+
+
+class CompressionError(Exception):
+    """
+    Raised when a package is compressed in a way which can not be read
+    without a module which is not installed.
+    """
+    pass
+
+
+def fingerprint(path):
+    """
+    Returns the (device, inode, size, mtime) fingerprint for path.
+
+    :Parameters:
+       - `path`: path to the file
+    """
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+
+
+def checked_chunk_size(chunk_size):
+    """
+    Returns chunk_size as an int, raising ValueError when it is not at
+    least one byte. Nothing would be read with a size of 0, making every
+    input hash like an empty file.
+
+    :Parameters:
+       - `chunk_size`: number of bytes to read at a time.
+    """
+    chunk_size = int(chunk_size)
+    if chunk_size < 1:
+        raise ValueError(
+            'chunk_size must be at least 1 byte, not %d' % chunk_size)
+    return chunk_size
+
+
+def read_chunks(f_obj, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the contents of a file like object in chunks of at most
+    chunk_size bytes. Objects supporting readinto are read through a single
+    reused buffer so no new string is created per chunk.
+
+    :Parameters:
+       - `f_obj`: file like object to read from.
+       - `chunk_size`: maximum number of bytes per chunk.
+    """
+    chunk_size = checked_chunk_size(chunk_size)
+    readinto = getattr(f_obj, 'readinto', None)
+    if readinto is not None:
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        while True:
+            size = readinto(buf)
+            if not size:
+                break
+            yield view[:size]
+    else:
+        while True:
+            chunk = f_obj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def update_hashes(input, hashes, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Feeds the contents of input through every hash object in a single pass.
+    The input is closed once it has been read. Reading a file like object,
+    such as a member of an archive, is timed as the archive_read phase
+    rather than the hash phase.
+
+    :Parameters:
+       - `input`: the path to the file or a file like obj for hashing.
+       - `hashes`: hashlib objects to update.
+       - `chunk_size`: number of bytes to read at a time.
+    """
+    if getattr(input, 'read', False):
+        f_obj = input
+        chunks = METRICS.timed('archive_read', read_chunks(f_obj, chunk_size))
+    else:
+        f_obj = open(input, 'rb')
+        chunks = None
+    size = 0
+    try:
+        with METRICS.phase('hash') as hashing:
+            try:
+                for chunk in chunks or read_chunks(f_obj, chunk_size):
+                    size += len(chunk)
+                    for hash in hashes:
+                        hash.update(chunk)
+            finally:
+                if chunks is not None:
+                    chunks.close()
+                    hashing.exclude(chunks)
+    finally:
+        f_obj.close()
+        METRICS.count('files_hashed')
+        METRICS.count('bytes_hashed', size)
+    return hashes
 
 
 class HashGenerator(object):
     """
     Generates a hash baed on filename.
     """
-    __slots__ = ['__hash_cls']
+    __slots__ = ['__hash_cls', '__chunk_size']
 
-    def __init__(self, hash_cls=hashlib.sha512):
+    def __init__(
+            self, hash_cls=hashlib.sha512, chunk_size=DEFAULT_CHUNK_SIZE):
         """
         Creates an instance of the generator.
 
         :Parameters:
            - `hash_cls`: hashlib hash generating class to use.
+           - `chunk_size`: number of bytes to read at a time.
         """
         self.__hash_cls = hash_cls
+        self.__chunk_size = checked_chunk_size(chunk_size)
 
     def __call__(self, input):
         """
@@ -44,13 +178,71 @@ class HashGenerator(object):
         :Parameters:
            - `input`: the path to the file or a file like obj for hashing.
         """
-        if getattr(input, 'read', False):
-            f_obj = input
-        else:
-            f_obj = open(input, 'r')
-        hash = self.__hash_cls(f_obj.read()).hexdigest()
-        f_obj.close()
-        return hash
+        hash = self.__hash_cls()
+        update_hashes(input, [hash], self.__chunk_size)
+        return hash.hexdigest()
+
+    # Read-only properties
+    chunk_size = property(lambda s: s.__chunk_size)
+
+
+class Digests(dict):
+    """
+    Hex digests of one input keyed by hashlib algorithm name. Digests are
+    also available as attributes (digests.sha1).
+    """
+
+    def __getattr__(self, name):
+        """
+        Returns the digest for the algorithm name.
+
+        :Parameters:
+           - `name`: hashlib algorithm name
+        """
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class MultiHashGenerator(object):
+    """
+    Generates several hashes from a single read of the input.
+    """
+    __slots__ = ['__algorithms', '__chunk_size']
+
+    def __init__(
+            self, algorithms=('sha512', 'sha1', 'md5'),
+            chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Creates an instance of the generator.
+
+        :Parameters:
+           - `algorithms`: hashlib algorithm names to generate.
+           - `chunk_size`: number of bytes to read at a time.
+        """
+        # Fail early on names hashlib does not know about
+        for name in algorithms:
+            hashlib.new(name)
+        self.__algorithms = tuple(algorithms)
+        self.__chunk_size = checked_chunk_size(chunk_size)
+
+    def __call__(self, input):
+        """
+        Generates the digests based off the filename.
+
+        :Parameters:
+           - `input`: the path to the file or a file like obj for hashing.
+        """
+        hashes = [hashlib.new(name) for name in self.__algorithms]
+        update_hashes(input, hashes, self.__chunk_size)
+        return Digests(
+            [(name, hash.hexdigest()) for name, hash in zip(
+                self.__algorithms, hashes)])
+
+    # Read-only properties
+    algorithms = property(lambda s: s.__algorithms)
+    chunk_size = property(lambda s: s.__chunk_size)
 
 
 class Packages(dict):
@@ -66,7 +258,7 @@ class Packages(dict):
            - `hash`: hash which the package matches
            - `package`: package to associate with the hash
         """
-        if hash in self.keys():
+        if hash in self:
             self[hash] = self[hash] + [package]
         else:
             self[hash] = [package]
@@ -77,7 +269,7 @@ class Package(object):
     General abstraction of a package, either inside or out.
     """
 
-    def __init__(self, name, path, parent=None):
+    def __init__(self, name, path, parent=None, digests=None, kind=None):
         """
         Creates an instance of a packge information object.
 
@@ -85,10 +277,16 @@ class Package(object):
            - `name`: name of the package
            - `path`: full path of the package
            - `parent`: full path of the parent package if one exists
+           - `digests`: Digests computed while the package was read, if it
+             has already been read
+           - `kind`: kind of archive found by sniffing the package when its
+             name didn't give it away
         """
         self.name = name
         self.path = path
         self.parent = parent
+        self.digests = digests
+        self.kind = kind
 
     def __repr__(self):
         """
@@ -111,21 +309,78 @@ class PackageFinder(object):
     Finds package files starting from a root directory.
     """
 
-    __slots__ = ['__packages', '__look_inside']
+    __slots__ = [
+        '__packages', '__look_inside', '__walker', '__formats', '__depth',
+        '__algorithms', '__max_member_size', '__max_ratio', '__skipped',
+        '__sniff', '__hasher', '__memo', '__memo_size', '__manifest',
+        '__chunk_size']
 
     def __init__(
             self,
-            packages=('jar', 'war', 'egg', 'zip', 'tar.gz', 'rpm'),
-            look_inside=False):
+            packages=(
+                'jar', 'war', 'egg', 'zip', 'tar.gz', 'tgz', 'tar.bz2',
+                'tar.xz', 'rpm'),
+            look_inside=False, walker='os', depth=1,
+            algorithms=('sha512',), max_member_size=DEFAULT_MAX_MEMBER_SIZE,
+            max_ratio=DEFAULT_MAX_RATIO, sniff=False, dedup=False,
+            hasher=None, memo_size=DEFAULT_MEMO_SIZE, manifest=None,
+            chunk_size=DEFAULT_CHUNK_SIZE):
         """
         Creates the PackageFinder instance with suffix to look for.
 
         :Parameters:
            - `packages`: package suffixes to look for.
            - `look_inside`: Boolean on if we should look inside packages
+           - `walker`: name of a walker in victims.walkers.WALKERS or a
+             walker instance used to walk directories
+           - `depth`: how many levels of packages inside of packages to
+             look in when looking inside
+           - `algorithms`: hashlib algorithm names used to hash packages
+             read while looking deeper than one level
+           - `max_member_size`: largest package inside of a package which
+             is held in memory to look inside of
+           - `max_ratio`: most bytes read from inside a package per byte of
+             the package on disk, guards against decompression bombs
+           - `sniff`: if files without a package suffix should be checked
+             for archive magic bytes, costing one small read per file
+           - `dedup`: if packages found inside of an archive should be
+             remembered by the digest of the archive, so copies of it
+             anywhere in the scan are not opened again. Packages are then
+             hashed as they are found and yielded with their digests.
+           - `hasher`: callable returning the hex digest of a file on disk
+             with the first of algorithms, such as victims.cache.HashCache,
+             used to hash packages when dedup is on
+           - `memo_size`: most archives remembered when dedup is on
+           - `manifest`: optional victims.manifest.Manifest of an earlier
+             scan. Packages on disk which have not changed since then are
+             yielded with what the manifest says is inside of them without
+             being read. The rest are started in it, their digests are
+             for whoever hashes them to hand to Manifest.hashed.
+           - `chunk_size`: number of bytes to read at a time.
         """
         self.__packages = packages
         self.__look_inside = look_inside
+        if isinstance(walker, basestring):
+            walker = WALKERS[walker]()
+        self.__walker = walker
+        self.__formats = set()
+        self.__depth = int(depth)
+        self.__algorithms = tuple(algorithms)
+        self.__max_member_size = int(max_member_size)
+        self.__max_ratio = max_ratio
+        self.__skipped = []
+        self.__sniff = sniff
+        self.__chunk_size = checked_chunk_size(chunk_size)
+        self.__memo = None
+        if dedup:
+            self.__memo = collections.OrderedDict()
+        if hasher is None:
+            hasher = HashGenerator(
+                functools.partial(hashlib.new, self.__algorithms[0]),
+                self.__chunk_size)
+        self.__hasher = hasher
+        self.__memo_size = int(memo_size)
+        self.__manifest = manifest
 
     def __call__(self, path):
         """
@@ -134,66 +389,310 @@ class PackageFinder(object):
         :Parameters:
            - `path`: the path to start looking from.
         """
-        formats = []
+        found = list(self.iter(path))
+        return (found, self._find_formats(found))
+
+    def iter(self, path):
+        """
+        Yields packages as they are found. Formats of the packages yielded
+        so far are available from the formats property.
+
+        :Parameters:
+           - `path`: the path to start looking from.
+        """
         if os.path.isfile(path):
-            return self._scan('', [path])
+            walk = [('', [path])]
         else:
-            found = []
-            for root, dirs, files in os.walk(path):
-                found_in_scan, formats_found = self._scan(root, files)
-                formats += formats_found
-                found += found_in_scan
-            # Remove dupes
-            formats = [x for x in set(formats)]
-            return (found, formats)
+            walk = self.__walker(path)
+        for root, files in walk:
+            for package in self._scan(root, files):
+                self.__formats.update(self._find_formats([package]))
+                yield package
+
+    # Read-only properties
+    walker = property(lambda s: s.__walker)
+    formats = property(lambda s: sorted(s.__formats))
+    manifest = property(lambda s: s.__manifest)
+    chunk_size = property(lambda s: s.__chunk_size)
+    skipped = property(lambda s: list(s.__skipped))
+
+    def _look_inside(self, path, kind=None, digests=None):
+        """
+        Handles looking inside of the package or archive, yielding the
+        packages inside.
 
-    def _look_inside(self, path):
+        :Parameters:
+           - `path`: path to the package or archive
+           - `kind`: kind of archive when it was sniffed already
+           - `digests`: Digests of the package when dedup is on
         """
-        Handles looking inside of the package or archive.
+        budget = [self.__max_ratio * max(os.path.getsize(path), 1)]
+        try:
+            for package in self._remembered(
+                    digests, 1, path, self.__open_and_descend, path, kind,
+                    budget):
+                yield package
+        except (ArchiveLimitError, CompressionError), ex:
+            self.__skipped.append((path, str(ex)))
+
+    def __open_and_descend(self, path, kind, budget):
+        """
+        Opens a package on disk and yields the packages inside.
 
         :Parameters:
            - `path`: path to the package or archive
+           - `kind`: kind of archive when it was sniffed already
+           - `budget`: single item list of bytes left to read
         """
-        found = []
-        archive = Archive(path)
+        # Archive handling is only imported once something is looked into
+        from victims.archivers import Archive
+        archive = Archive(path, kind=kind)
         # If we can not handle it as an archive, then we don't handle
         # it as an archive to look inside of
         if not archive.handleable:
-            return found
-
-        for file_name in archive.file_list:
-            if file_name.endswith(self.__packages):
-                internal_file = archive.open(file_name)
-                # Zips use fileobj.name
-                try:
-                    found.append(Package(
-                        internal_file.name, internal_file,
-                        internal_file.fileobj.name))
-                # Tarballs use fileobj.fileobj.name
-                except:
-                    found.append(Package(
-                        internal_file.name, internal_file,
-                        internal_file.fileobj.fileobj.name))
-        return found
+            return
+
+        if self.__depth <= 1 and self.__memo is None:
+            # Members are left for the caller to read
+            for file_name, internal_file in archive.members(
+                    lambda x: x.endswith(self.__packages)):
+                yield Package(file_name, internal_file, path)
+            return
+
+        for package in self._descend(archive, path, 1, budget):
+            yield package
+
+    def _remembered(self, digests, level, parent, func, *args):
+        """
+        Yields the packages func yields for an archive, remembering them
+        by the digest of the archive when dedup is on. Copies of an archive
+        seen before at the same level yield what was remembered without
+        calling func.
+
+        :Parameters:
+           - `digests`: Digests of the archive or None
+           - `level`: how deep the archive is, as copies deeper down are
+             looked into fewer levels
+           - `parent`: name of the archive shown to users
+           - `func`: generator function yielding the packages inside
+           - `args`: arguments for func
+        """
+        if self.__memo is None or digests is None:
+            for package in func(*args):
+                yield package
+            return
+
+        key = (digests[self.__algorithms[0]], level)
+        memo = self.__memo.pop(key, None)
+        if memo is not None:
+            # Most recently used last, so the oldest are dropped first
+            self.__memo[key] = memo
+            packages, skipped = memo
+            METRICS.count('copies_reused')
+            METRICS.count('members_reused', len(packages))
+            for name, below, package_digests in packages:
+                yield Package(name, None, parent + below, package_digests)
+            for below, reason in skipped:
+                self.__skipped.append((parent + below, reason))
+            return
+
+        packages = []
+        skipped_before = len(self.__skipped)
+        for package in func(*args):
+            packages.append((
+                package.name, package.parent[len(parent):], package.digests))
+            yield package
+        # Only archives read to the end are remembered
+        skipped = [(name[len(parent):], reason) for name, reason in
+                   self.__skipped[skipped_before:]]
+        self.__memo[key] = (packages, skipped)
+        if len(self.__memo) > self.__memo_size:
+            self.__memo.popitem(last=False)
+
+    def _descend(self, archive, parent, level, budget):
+        """
+        Reads and hashes every package in an archive, looking inside of
+        each one until the depth is reached.
+
+        :Parameters:
+           - `archive`: the Archive to look inside of
+           - `parent`: name of the archive shown to users
+           - `level`: how deep archive is, 1 being a package on disk
+           - `budget`: single item list of bytes left to read
+        """
+        for file_name, internal_file in archive.members(
+                lambda x: x.endswith(self.__packages)):
+            descend = level < self.__depth
+            digests, data = self._read_member(
+                internal_file, parent, file_name, descend, budget)
+            yield Package(file_name, internal_file, parent, digests)
+            if data is None:
+                continue
+            nested_parent = parent + '!/' + file_name
+            try:
+                for package in self._remembered(
+                        digests, level + 1, nested_parent,
+                        self.__descend_nested,
+                        file_name, data, nested_parent, level + 1, budget):
+                    yield package
+            except ArchiveLimitError:
+                raise
+            except Exception, ex:
+                # A broken nested package shouldn't end the whole scan
+                self.__skipped.append((nested_parent, str(ex)))
+
+    def __descend_nested(self, name, data, parent, level, budget):
+        """
+        Opens a package read from inside of an archive and yields the
+        packages inside of it.
+
+        :Parameters:
+           - `name`: name of the package in its archive
+           - `data`: contents of the package
+           - `parent`: name of the package shown to users
+           - `level`: how deep the package is
+           - `budget`: single item list of bytes left to read
+        """
+        from victims.archivers import Archive
+        try:
+            nested = Archive(name, StringIO(data))
+        except Exception:
+            # Named like a package but not one we can read
+            return
+        if not nested.handleable:
+            return
+        METRICS.count('nested_archives')
+        for package in self._descend(nested, parent, level, budget):
+            yield package
+
+    def _read_member(self, f_obj, parent, name, keep, budget):
+        """
+        Reads a package inside of an archive once, hashing it as it goes.
+        Returns the Digests and the data when keep is True and it fits in
+        max_member_size, else None. Reading, which includes decompressing,
+        is timed as the archive_read phase and the rest as the hash phase.
+
+        :Parameters:
+           - `f_obj`: file like object of the package
+           - `parent`: name of the archive holding the package
+           - `name`: name of the package in the archive
+           - `keep`: if the data should be kept to look inside of
+           - `budget`: single item list of bytes left to read
+        """
+        hashes = [hashlib.new(x) for x in self.__algorithms]
+        kept = []
+        size = 0
+        chunks = METRICS.timed(
+            'archive_read', read_chunks(f_obj, self.__chunk_size))
+        with METRICS.phase('hash') as hashing:
+            try:
+                for chunk in chunks:
+                    size += len(chunk)
+                    budget[0] -= len(chunk)
+                    if budget[0] < 0:
+                        raise ArchiveLimitError(
+                            '%s!/%s expands past the ratio limit' % (
+                                parent, name))
+                    for hash in hashes:
+                        hash.update(chunk)
+                    if keep:
+                        if size > self.__max_member_size:
+                            self.__skipped.append((
+                                parent + '!/' + name,
+                                'too large to look inside of'))
+                            keep = False
+                            kept = []
+                        else:
+                            if isinstance(chunk, memoryview):
+                                # The buffer behind the view is reused
+                                chunk = chunk.tobytes()
+                            kept.append(chunk)
+            finally:
+                chunks.close()
+                hashing.exclude(chunks)
+                f_obj.close()
+                METRICS.count('files_hashed')
+                METRICS.count('bytes_hashed', size)
+        digests = Digests(
+            [(x, y.hexdigest()) for x, y in zip(self.__algorithms, hashes)])
+        if keep:
+            return (digests, ''.join(kept))
+        return (digests, None)
 
     def _scan(self, root, files):
         """
-        Does the heavy lifting looking for files.
+        Does the heavy lifting looking for files, yielding each package.
 
         :Parameters:
            - `root`: path to where we are looking.
            - `files`: list of files in the path.
         """
-        found = []
+        if self.__sniff:
+            from victims.archivers.sniff import sniff
         # for each package, check it
         for name in files:
+            kind = None
+            if not name.endswith(self.__packages):
+                if not self.__sniff:
+                    continue
+                METRICS.count('files_sniffed')
+                kind = sniff(os.path.join(root, name))
+                if kind is None:
+                    continue
             full_path = os.path.realpath(os.path.join(root, name))
-            if name.endswith(self.__packages):
-                found.append(Package(name, full_path))
-                if self.__look_inside:
-                    found += self._look_inside(full_path)
-        formats = self._find_formats(found)
-        return (found, formats)
+            package = Package(name, full_path, kind=kind)
+            if self.__manifest is not None:
+                unchanged = self._from_manifest(package)
+                if unchanged is not None:
+                    for package in unchanged:
+                        yield package
+                    continue
+            skipped_before = len(self.__skipped)
+            if self.__look_inside and self.__memo is not None:
+                # The digest says whether this is a copy of an archive
+                # which was already looked inside of
+                package.digests = Digests(
+                    [(self.__algorithms[0], self.__hasher(full_path))])
+            yield package
+            if self.__look_inside:
+                for package in self._look_inside(
+                        full_path, kind, package.digests):
+                    yield package
+            if self.__manifest is not None:
+                self.__manifest.skipped(full_path, [
+                    (x[len(full_path):], y)
+                    for x, y in self.__skipped[skipped_before:]])
+
+    def _from_manifest(self, package):
+        """
+        Returns a package on disk and the packages inside of it as the
+        manifest has them when the package has not changed, else starts
+        recording it in the manifest and returns None. Digests of changed
+        packages are left to the caller, which hands them to the manifest.
+
+        :Parameters:
+           - `package`: the Package on disk
+        """
+        algorithm = self.__algorithms[0]
+        path = package.path
+        fprint = fingerprint(path)
+        known = self.__manifest.known(path, fprint)
+        if known is None:
+            self.__manifest.seen(path, fprint)
+            return None
+        METRICS.count('files_unchanged')
+        hash, inside, skipped = known
+        package.digests = Digests([(algorithm, hash)])
+        packages = [package]
+        if self.__look_inside:
+            packages += [
+                Package(name, None, path + below,
+                        Digests([(algorithm, digest)]))
+                for name, below, digest in inside]
+            for below, reason in skipped:
+                self.__skipped.append((path + below, reason))
+        self.__manifest.remember(path, fprint, hash, inside, skipped)
+        return packages
 
     def _find_formats(self, found):
         """
@@ -207,4 +706,9 @@ class PackageFinder(object):
             for name in [x.name for x in found]:
                 if package in name:
                     formats.append(package)
+        # Sniffed packages could be any format of the same kind
+        from victims.archivers.sniff import kind_from_name
+        for kind in set([x.kind for x in found if x.kind]):
+            formats += [x for x in self.__packages
+                        if kind_from_name('.' + x) == kind]
         return [x.upper() for x in set(formats)]
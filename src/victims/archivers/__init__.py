@@ -13,11 +13,17 @@ Special archiving items.
 
 __docformat__ = 'restructuredtext'
 
+import collections
 import os
 import subprocess
 import zipfile
 
-from StringIO import StringIO
+from victims import CompressionError
+from victims.archivers.cpio import iter_cpio
+from victims.archivers.rpm import RPMError, open_payload, read_payload
+from victims.archivers.sniff import kind_from_name, sniff
+from victims.archivers.tar import TAR_KINDS, iter_tar
+from victims.metrics import METRICS
 
 
 class Archive(object):
@@ -26,52 +32,85 @@ class Archive(object):
     """
 
     __slots__ = [
-        '__file_path', '__name_func', '__open_func', '__archive_obj']
+        '__file_path', '__fileobj', '__name_func', '__open_func',
+        '__members_func', '__infos_func', '__archive_obj']
 
-    def __init__(self, path):
+    def __init__(self, path, fileobj=None, kind=None):
         """
-        Create an archive instance.
+        Create an archive instance. The kind of archive comes from the name
+        and, when the name doesn't say, from the first bytes of the file.
 
         :Parameters:
-           - `path`: path to the archive
+           - `path`: path to the archive, or its name when fileobj is given
+           - `fileobj`: optional file like object to read the archive from
+             instead of path
+           - `kind`: optional kind of archive from
+             victims.archivers.sniff when it is already known
         """
         self.__file_path = path
+        self.__fileobj = fileobj
         self.__name_func = None
         self.__open_func = None
+        self.__members_func = None
+        self.__infos_func = None
 
-        lower_file = os.path.basename(self.__file_path.lower())
-        if (lower_file.endswith('.jar') or lower_file.endswith('.zip') or
-                lower_file.endswith('.war')):
-            self.__handle_zip()
-        elif lower_file.endswith('.tar.gz'):
-            self.__handle_tarball()
-        elif lower_file.endswith('.rpm'):
-            self.__handle_rpm()
+        with METRICS.phase('archive_open'):
+            if kind is None:
+                kind = kind_from_name(os.path.basename(self.__file_path))
+            if kind is None:
+                # Renamed or extensionless, go by what is in it
+                kind = sniff(self.__fileobj or self.__file_path)
+            if kind == 'zip':
+                self.__handle_zip()
+            elif kind in TAR_KINDS:
+                self.__handle_tarball(TAR_KINDS[kind])
+            elif kind == 'rpm':
+                self.__handle_rpm()
+        if self.handleable:
+            METRICS.count('archives_opened')
 
     def __handle_zip(self):
         """
         Handle mapping methods for zipfiles.
         """
-        self.__archive_obj = zipfile.ZipFile(self.__file_path)
+        self.__archive_obj = zipfile.ZipFile(
+            self.__fileobj or self.__file_path)
         self.__name_func = self.__archive_obj.namelist
         self.__open_func = self.__archive_obj.open
+        self.__infos_func = self.__zip_infos
 
-    def __handle_tarball(self):
+    def __zip_infos(self):
+        """
+        Yields MemberInfo for the files of a zip from its central directory
+        without opening any of them.
+        """
+        for info in self.__archive_obj.infolist():
+            if not info.filename.endswith('/'):
+                yield MemberInfo(info.filename, info.file_size, info.CRC)
+
+    def __handle_tarball(self, compression):
         """
         Handle mapping methods for tarballs.
+
+        :Parameters:
+           - `compression`: compression used by the tarball or None
         """
-        import tarfile
-        self.__archive_obj = tarfile.open(self.__file_path, 'r:gz')
+        self.__archive_obj = TarArchive(
+            self.__file_path, compression, self.__fileobj)
         self.__name_func = self.__archive_obj.getnames
         self.__open_func = self.__archive_obj.extractfile
+        self.__members_func = self.__archive_obj.members
+        self.__infos_func = self.__archive_obj.infos
 
     def __handle_rpm(self):
         """
         Handle mapping methods for rpms.
         """
-        self.__archive_obj = RPMArchive(self.__file_path)
+        self.__archive_obj = RPMArchive(self.__file_path, self.__fileobj)
         self.__name_func = self.__archive_obj.getnames
         self.__open_func = self.__archive_obj.extractfile
+        self.__members_func = self.__archive_obj.members
+        self.__infos_func = self.__archive_obj.infos
 
     def open(self, name):
         """
@@ -82,76 +121,284 @@ class Archive(object):
         """
         return self.__open_func(name)
 
+    def members(self, match=None):
+        """
+        Yields (name, file obj) for every member whose name passes match.
+        Archives which can only be streamed, such as rpms and tarballs, read
+        each member as the iteration reaches it. Their file objects stay
+        readable after the iteration moves on, but closing one first lets
+        its data be skipped rather than kept in memory. Reaching each of
+        their members is timed as the archive_read phase.
+
+        :Parameters:
+           - `match`: optional callable taking a name and returning a boolean
+        """
+        if self.__members_func is not None:
+            streamed = METRICS.timed(
+                'archive_read', self.__members_func(match))
+            try:
+                for name, member in streamed:
+                    METRICS.count('members_visited')
+                    yield (name, member)
+            finally:
+                streamed.close()
+            return
+        for info in self.infos():
+            if match is None or match(info.name):
+                METRICS.count('members_visited')
+                # Opened on first read so unread members hold nothing open
+                yield (info.name, LazyMember(self.open, info.name))
+
+    def infos(self, match=None):
+        """
+        Yields MemberInfo (name, size, crc) for every regular file whose
+        name passes match without opening any member. crc is None for
+        formats which don't record one.
+
+        :Parameters:
+           - `match`: optional callable taking a name and returning a boolean
+        """
+        for info in self.__infos_func():
+            if match is None or match(info.name):
+                yield info
+
+    def hash_members(self, hasher, match=None):
+        """
+        Yields (name, hash) for every member whose name passes match. Each
+        member is opened, hashed and closed before the next one is opened.
+
+        :Parameters:
+           - `hasher`: callable taking a file like object, such as
+             victims.HashGenerator, which closes it when done
+           - `match`: optional callable taking a name and returning a boolean
+        """
+        for name, member in self.members(match):
+            try:
+                yield (name, hasher(member))
+            finally:
+                member.close()
+
     # Read-only properties
     file_list = property(lambda s: s.__name_func())
     handleable = property(
         lambda s: callable(s.__name_func) and callable(s.__open_func))
 
 
-class RPMFile(StringIO):
+#: Metadata about one member of an archive
+MemberInfo = collections.namedtuple('MemberInfo', 'name size crc')
+
+
+class LazyMember(object):
     """
-    Abstration of a file inside of the RPM making it look and feel like the
-    results that would come from zip or tarballs.
+    File like object which only opens an archive member when it is first
+    read and releases it as soon as it is closed.
     """
 
-    def __init__(self, info, parent_name):
+    def __init__(self, open_func, name):
         """
-        Creates an instance of the internal file based on the data in the
-        intenral file.
+        Creates the member.
 
-        :Paramters:
-           - `info`: cpioarchive item from ._infos
-           - `parent_name`: name of the parent file
+        :Parameters:
+           - `open_func`: callable opening the member by name
+           - `name`: name of the member in the archive
         """
-        StringIO.__init__(self, info.read())
-        self.name = info.name
+        self.name = name
+        self.closed = False
+        self.__open_func = open_func
+        self.__f_obj = None
 
-        class Dummy(object):
-            pass
+    def __file(self):
+        """
+        Returns the opened member, opening it if needed.
+        """
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        if self.__f_obj is None:
+            self.__f_obj = self.__open_func(self.name)
+        return self.__f_obj
 
-        self.fileobj = Dummy()
-        self.fileobj.name = parent_name
+    def read(self, size=-1):
+        """
+        Reads up to size bytes, or everything left when size is negative.
 
+        :Parameters:
+           - `size`: most bytes to read
+        """
+        return self.__file().read(size)
 
-class RPMArchive(object):
+    def close(self):
+        """
+        Closes the member releasing the underlying stream.
+        """
+        if self.__f_obj is not None:
+            self.__f_obj.close()
+            self.__f_obj = None
+        self.closed = True
+
+
+class StreamArchive(object):
     """
-    An archive abstrator for RPM.
+    Base for archives which can only be read front to back. Subclasses
+    provide members, everything else is built on top of it.
     """
 
-    def __init__(self, path):
+    def __init__(self):
         """
         Creates an instance.
+        """
+        self._names = None
 
-        :Paramteres:
-           - `path`: path to the rpm
+    def members(self, match=None):
         """
-        import cpioarchive
+        Yields (name, file obj) for each regular file in the archive whose
+        name passes match, in a single pass.
 
-        # XXX: HACK, but couldn't find a better way :-(
-        p = subprocess.Popen(["rpm2cpio", path], stdout=subprocess.PIPE)
-        self.__cpio_data = cpioarchive.CpioArchive(
-            fileobj=StringIO(p.communicate()[0][:-1]))
-        self.__file_map = {}
-        for idx in range(len(self.__cpio_data._infos)):
-            self.__file_map[self.__cpio_data._infos[idx].name] = (
-                RPMFile(self.__cpio_data._infos[idx], path))
+        :Parameters:
+           - `match`: optional callable taking a name and returning a boolean
+        """
+        raise NotImplementedError('members must be provided by a subclass')
+
+    def infos(self):
+        """
+        Yields MemberInfo for every regular file in the archive.
+        """
+        for name, member in self.members():
+            member.close()
+            yield MemberInfo(name, member.size, None)
 
     def getnames(self):
         """
-        Returns a list of all file names inside the rpm.
+        Returns a list of all file names inside the archive.
         """
-        return self.__file_map.keys()
+        if self._names is None:
+            # Closing each member skips its data instead of keeping it
+            self._names = []
+            for name, member in self.members():
+                member.close()
+                self._names.append(name)
+        return self._names
 
     def extractfile(self, path):
         """
-        Extracts a file from the rpm archive.
+        Extracts a file from the archive.
 
         :Paramteres:
            - `path`: path to the internal file
         """
-        if path in self.__file_map.keys():
-            return self.__file_map[path]
+        for name, member in self.members(lambda x: x == path):
+            member.detach()
+            return member
         raise Exception('File not found')
 
     # Read-only properties
     names = property(getnames)
+
+
+class TarArchive(StreamArchive):
+    """
+    An archive abstrator for tarballs. The tarball is decompressed once
+    while members are handed out, instead of once to list it and again for
+    every member read.
+    """
+
+    def __init__(self, path, compression, fileobj=None):
+        """
+        Creates an instance.
+
+        :Parameters:
+           - `path`: path to the tarball
+           - `compression`: compression used by the tarball or None
+           - `fileobj`: optional file like object to read the tarball from.
+             It can only be read once.
+        """
+        StreamArchive.__init__(self)
+        self.__path = path
+        self.__compression = compression
+        self.__fileobj = fileobj
+
+    def members(self, match=None):
+        """
+        Yields (name, file obj) for each regular file in the tarball whose
+        name passes match, in a single pass over the tarball.
+
+        :Parameters:
+           - `match`: optional callable taking a name and returning a boolean
+        """
+        if self.__fileobj is not None:
+            for name, member in iter_tar(
+                    self.__fileobj, self.__compression, match):
+                yield (name, member)
+            return
+
+        f_obj = open(self.__path, 'rb')
+        try:
+            for name, member in iter_tar(f_obj, self.__compression, match):
+                yield (name, member)
+        finally:
+            f_obj.close()
+
+
+class RPMArchive(StreamArchive):
+    """
+    An archive abstrator for RPM. The payload is streamed, read in process
+    when the compression is supported or else from rpm2cpio, so only
+    members which are asked for are ever held in memory.
+    """
+
+    #: Command used to turn an rpm into a cpio stream
+    RPM2CPIO = 'rpm2cpio'
+
+    #: If the payload should be read in process when possible
+    NATIVE = True
+
+    def __init__(self, path, fileobj=None):
+        """
+        Creates an instance.
+
+        :Paramteres:
+           - `path`: path to the rpm
+           - `fileobj`: optional file like object to read the rpm from. It
+             can only be read once and never through rpm2cpio.
+        """
+        StreamArchive.__init__(self)
+        self.__path = path
+        self.__fileobj = fileobj
+
+    def members(self, match=None):
+        """
+        Yields (name, file obj) for each regular file in the rpm whose name
+        passes match, in a single pass over the payload.
+
+        :Parameters:
+           - `match`: optional callable taking a name and returning a boolean
+        """
+        if self.__fileobj is not None:
+            for name, member in iter_cpio(
+                    read_payload(self.__fileobj), match):
+                yield (name, member)
+            return
+
+        payload = None
+        if self.NATIVE:
+            try:
+                payload = open_payload(self.__path)
+            except (RPMError, CompressionError):
+                # Fall back to rpm2cpio for anything we can't read
+                pass
+        if payload is not None:
+            try:
+                for name, member in iter_cpio(payload, match):
+                    yield (name, member)
+            finally:
+                payload.close()
+            return
+
+        p = subprocess.Popen(
+            [self.RPM2CPIO, self.__path], stdout=subprocess.PIPE,
+            bufsize=-1)
+        try:
+            for name, member in iter_cpio(p.stdout, match):
+                yield (name, member)
+        finally:
+            p.stdout.close()
+            p.wait()
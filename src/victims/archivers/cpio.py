@@ -0,0 +1,173 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Streaming reader for the cpio "newc" format used in rpm payloads.
+"""
+
+__docformat__ = 'restructuredtext'
+
+from StringIO import StringIO
+
+#: Magic numbers of newc headers without and with checksums
+MAGICS = ('070701', '070702')
+
+#: Size of a newc header
+HEADER_SIZE = 110
+
+#: Name of the last entry of an archive
+TRAILER = 'TRAILER!!!'
+
+# File type bits of the mode
+_S_IFMT = 0170000
+_S_IFREG = 0100000
+
+#: Number of bytes read at a time while skipping data
+SKIP_CHUNK_SIZE = 64 * 1024
+
+
+def _read_exactly(stream, size):
+    """
+    Reads size bytes from stream raising if it ends early.
+
+    :Parameters:
+       - `stream`: file like object to read from
+       - `size`: number of bytes to read
+    """
+    data = stream.read(size)
+    while len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            raise IOError('Truncated cpio archive')
+        data += more
+    return data
+
+
+def _skip(stream, size):
+    """
+    Reads and throws away size bytes of a stream which can not seek.
+
+    :Parameters:
+       - `stream`: file like object to read from
+       - `size`: number of bytes to skip
+    """
+    while size > 0:
+        data = stream.read(min(size, SKIP_CHUNK_SIZE))
+        if not data:
+            raise IOError('Truncated cpio archive')
+        size -= len(data)
+
+
+def _pad(size):
+    """
+    Returns the padding needed to bring size to a multiple of 4.
+
+    :Parameters:
+       - `size`: size of the data
+    """
+    return (4 - size % 4) % 4
+
+
+class StreamMember(object):
+    """
+    File like view of one member of an archive being read as a stream.
+    Reads come straight from the stream until the stream moves on to the
+    next member. At that point anything not yet read is kept in memory if
+    the member is still open, or skipped if it was closed.
+    """
+
+    def __init__(self, name, stream, size):
+        """
+        Creates the member.
+
+        :Parameters:
+           - `name`: name of the member in the archive
+           - `stream`: stream positioned at the start of the member data
+           - `size`: size of the member data
+        """
+        self.name = name
+        self.size = size
+        self.closed = False
+        self.__stream = stream
+        self.__remaining = size
+
+    def read(self, size=-1):
+        """
+        Reads up to size bytes, or everything left when size is negative.
+
+        :Parameters:
+           - `size`: most bytes to read
+        """
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        if size is None or size < 0 or size > self.__remaining:
+            size = self.__remaining
+        if not size:
+            return ''
+        data = self.__stream.read(size)
+        if not data:
+            raise IOError('Truncated archive')
+        self.__remaining -= len(data)
+        return data
+
+    def close(self):
+        """
+        Closes the member. Unread data is skipped instead of kept.
+        """
+        self.closed = True
+
+    def detach(self):
+        """
+        Called when the stream moves past this member. Consumes what is
+        left of the member from the stream.
+        """
+        if self.__remaining:
+            if self.closed:
+                _skip(self.__stream, self.__remaining)
+            else:
+                self.__stream = StringIO(
+                    _read_exactly(self.__stream, self.__remaining))
+        else:
+            self.__stream = StringIO()
+
+
+def iter_cpio(stream, match=None):
+    """
+    Yields (name, StreamMember) for each regular file in a newc cpio stream
+    whose name passes match. Only data of matching members is read by the
+    caller, everything else is skipped as it goes by.
+
+    :Parameters:
+       - `stream`: file like object positioned at the start of the archive
+       - `match`: optional callable taking a name and returning a boolean
+    """
+    while True:
+        header = stream.read(HEADER_SIZE)
+        if not header:
+            return
+        if len(header) < HEADER_SIZE:
+            header += _read_exactly(stream, HEADER_SIZE - len(header))
+        if header[:6] not in MAGICS:
+            raise IOError('Unsupported cpio format')
+        mode = int(header[14:22], 16)
+        size = int(header[54:62], 16)
+        name_size = int(header[94:102], 16)
+        name = _read_exactly(stream, name_size)[:-1]
+        _skip(stream, _pad(HEADER_SIZE + name_size))
+        if name == TRAILER:
+            return
+
+        if (mode & _S_IFMT == _S_IFREG and
+                (match is None or match(name))):
+            member = StreamMember(name, stream, size)
+            yield (name, member)
+            member.detach()
+        else:
+            _skip(stream, size)
+        _skip(stream, _pad(size))
@@ -0,0 +1,213 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+In process reader for rpm payloads.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import struct
+import zlib
+
+from victims import CompressionError
+
+#: Size of the rpm lead
+LEAD_SIZE = 96
+
+#: Magic number starting the rpm lead
+LEAD_MAGIC = '\xed\xab\xee\xdb'
+
+#: Magic number starting the signature and main headers
+HEADER_MAGIC = '\x8e\xad\xe8\x01'
+
+#: Header tags used to find the payload format
+TAG_PAYLOADFORMAT = 1124
+TAG_PAYLOADCOMPRESSOR = 1125
+
+#: Header type of a string
+TYPE_STRING = 6
+
+#: Number of compressed bytes read at a time
+READ_SIZE = 64 * 1024
+
+
+class RPMError(Exception):
+    """
+    Raised when an rpm can not be read in process.
+    """
+    pass
+
+
+def _gzip():
+    """
+    Returns a decompressor for gzip payloads.
+    """
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+def _bzip2():
+    """
+    Returns a decompressor for bzip2 payloads.
+    """
+    import bz2
+    return bz2.BZ2Decompressor()
+
+
+def _xz():
+    """
+    Returns a decompressor for xz and lzma payloads.
+    """
+    try:
+        import lzma
+    except ImportError:
+        try:
+            from backports import lzma
+        except ImportError:
+            raise CompressionError('xz needs the lzma module')
+    return lzma.LZMADecompressor()
+
+
+def _zstd():
+    """
+    Returns a decompressor for zstd payloads.
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise CompressionError('zstd needs the zstandard module')
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+#: Decompressor factories by PAYLOADCOMPRESSOR value
+DECOMPRESSORS = {
+    'gzip': _gzip,
+    'bzip2': _bzip2,
+    'xz': _xz,
+    'lzma': _xz,
+    'zstd': _zstd,
+}
+
+
+class PayloadReader(object):
+    """
+    File like object returning the decompressed payload of an rpm.
+    """
+
+    def __init__(self, f_obj, decompressor):
+        """
+        Creates the reader.
+
+        :Parameters:
+           - `f_obj`: rpm file positioned at the start of the payload
+           - `decompressor`: object with a decompress method
+        """
+        self.__f_obj = f_obj
+        self.__decompressor = decompressor
+        self.__buffer = ''
+        self.__pos = 0
+        self.__eof = False
+
+    def read(self, size=-1):
+        """
+        Reads up to size decompressed bytes, or all of them when size is
+        negative.
+
+        :Parameters:
+           - `size`: most bytes to read
+        """
+        # Slicing from a position avoids copying the buffer on small reads
+        while not self.__eof and (
+                size < 0 or len(self.__buffer) - self.__pos < size):
+            data = self.__f_obj.read(READ_SIZE)
+            if not data:
+                self.__eof = True
+                break
+            self.__buffer = (
+                self.__buffer[self.__pos:] +
+                self.__decompressor.decompress(data))
+            self.__pos = 0
+        if size < 0:
+            size = len(self.__buffer) - self.__pos
+        data = self.__buffer[self.__pos:self.__pos + size]
+        self.__pos += len(data)
+        return data
+
+    def close(self):
+        """
+        Closes the underlying rpm file.
+        """
+        self.__f_obj.close()
+
+
+def _read_header(f_obj):
+    """
+    Reads an rpm header structure returning a dict of string tags.
+
+    :Parameters:
+       - `f_obj`: rpm file positioned at the start of the header
+    """
+    intro = f_obj.read(16)
+    if len(intro) != 16 or intro[:4] != HEADER_MAGIC:
+        raise RPMError('Bad rpm header')
+    count, size = struct.unpack('>II', intro[8:])
+    index = f_obj.read(count * 16)
+    store = f_obj.read(size)
+    if len(index) != count * 16 or len(store) != size:
+        raise RPMError('Truncated rpm header')
+    tags = {}
+    for x in range(count):
+        tag, type, offset, items = struct.unpack(
+            '>iiii', index[x * 16:(x + 1) * 16])
+        if type == TYPE_STRING:
+            tags[tag] = store[offset:store.index('\0', offset)]
+    return (tags, 16 + count * 16 + size)
+
+
+def read_payload(f_obj):
+    """
+    Reads past the rpm headers of f_obj and returns a PayloadReader for the
+    cpio payload. Raises RPMError when the rpm or its compression is not
+    understood and victims.CompressionError when the module reading its
+    compression is missing.
+
+    :Parameters:
+       - `f_obj`: file like object positioned at the start of the rpm
+    """
+    lead = f_obj.read(LEAD_SIZE)
+    if len(lead) != LEAD_SIZE or lead[:4] != LEAD_MAGIC:
+        raise RPMError('Not an rpm')
+    tags, size = _read_header(f_obj)
+    # The signature is padded out to a multiple of 8 bytes
+    f_obj.read((8 - size % 8) % 8)
+    tags, size = _read_header(f_obj)
+
+    payload_format = tags.get(TAG_PAYLOADFORMAT, 'cpio')
+    if payload_format != 'cpio':
+        raise RPMError('Unsupported payload format ' + payload_format)
+    compressor = tags.get(TAG_PAYLOADCOMPRESSOR, 'gzip')
+    if compressor not in DECOMPRESSORS:
+        raise RPMError('Unsupported payload compressor ' + compressor)
+    return PayloadReader(f_obj, DECOMPRESSORS[compressor]())
+
+
+def open_payload(path):
+    """
+    Opens the cpio payload of an rpm without running rpm2cpio. Raises
+    RPMError or victims.CompressionError like read_payload.
+
+    :Parameters:
+       - `path`: path to the rpm
+    """
+    f_obj = open(path, 'rb')
+    try:
+        return read_payload(f_obj)
+    except:
+        f_obj.close()
+        raise
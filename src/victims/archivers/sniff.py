@@ -0,0 +1,161 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Works out what kind of archive a file is from its name or its first bytes.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import collections
+import os
+import zlib
+
+from victims.archivers.rpm import LEAD_MAGIC
+
+#: Archive kinds by file name suffix, longest suffixes first
+SUFFIX_KINDS = (
+    ('.jar', 'zip'),
+    ('.war', 'zip'),
+    ('.ear', 'zip'),
+    ('.aar', 'zip'),
+    ('.egg', 'zip'),
+    ('.zip', 'zip'),
+    ('.tar.gz', 'tar.gz'),
+    ('.tgz', 'tar.gz'),
+    ('.tar.bz2', 'tar.bz2'),
+    ('.tbz2', 'tar.bz2'),
+    ('.tar.xz', 'tar.xz'),
+    ('.txz', 'tar.xz'),
+    ('.tar', 'tar'),
+    ('.rpm', 'rpm'),
+)
+
+#: Number of bytes read from the start of a file to sniff it
+SNIFF_SIZE = 4096
+
+#: Number of sniffed files remembered
+SNIFF_CACHE_SIZE = 4096
+
+# Offset and value of the ustar magic in a tar header
+_TAR_MAGIC_OFFSET = 257
+_TAR_MAGIC = 'ustar'
+
+_cache = collections.OrderedDict()
+
+
+def kind_from_name(name):
+    """
+    Returns the kind of archive name looks like or None.
+
+    :Parameters:
+       - `name`: file name to check
+    """
+    name = name.lower()
+    for suffix, kind in SUFFIX_KINDS:
+        if name.endswith(suffix):
+            return kind
+    return None
+
+
+def _is_tar(data):
+    """
+    Returns True if data starts with a ustar header.
+
+    :Parameters:
+       - `data`: the first bytes of a possible tarball
+    """
+    return data[_TAR_MAGIC_OFFSET:_TAR_MAGIC_OFFSET + 5] == _TAR_MAGIC
+
+
+def _decompress_head(decompressor, head):
+    """
+    Returns as much of head as decompresses, or '' when it doesn't.
+
+    :Parameters:
+       - `decompressor`: object with a decompress method
+       - `head`: the first bytes of a compressed file
+    """
+    try:
+        return decompressor.decompress(head)
+    except Exception:
+        return ''
+
+
+def sniff_data(head):
+    """
+    Returns the kind of archive head is the start of, or None. Compressed
+    files only count as tarballs when enough decompresses to see the tar
+    header, which bzip2 rarely allows for in the bytes sniffed.
+
+    :Parameters:
+       - `head`: the first bytes of a file
+    """
+    if head[:4] in ('PK\x03\x04', 'PK\x05\x06'):
+        return 'zip'
+    if head[:4] == LEAD_MAGIC:
+        return 'rpm'
+    if _is_tar(head):
+        return 'tar'
+    if head[:2] == '\x1f\x8b':
+        if _is_tar(_decompress_head(
+                zlib.decompressobj(16 + zlib.MAX_WBITS), head)):
+            return 'tar.gz'
+    elif head[:3] == 'BZh':
+        import bz2
+        if _is_tar(_decompress_head(bz2.BZ2Decompressor(), head)):
+            return 'tar.bz2'
+    elif head[:6] == '\xfd7zXZ\x00':
+        try:
+            import lzma
+        except ImportError:
+            try:
+                from backports import lzma
+            except ImportError:
+                return None
+        if _is_tar(_decompress_head(lzma.LZMADecompressor(), head)):
+            return 'tar.xz'
+    return None
+
+
+def sniff(source):
+    """
+    Returns the kind of archive source is from its first few KB, or None.
+    Results for paths are cached until the file changes size or mtime.
+    File objects are only sniffed when they can seek back.
+
+    :Parameters:
+       - `source`: path or file like object to sniff
+    """
+    if not isinstance(source, basestring):
+        try:
+            pos = source.tell()
+            head = source.read(SNIFF_SIZE)
+            source.seek(pos)
+        except (AttributeError, IOError):
+            return None
+        return sniff_data(head)
+
+    try:
+        stat = os.stat(source)
+        key = (source, stat.st_size, stat.st_mtime)
+        if key in _cache:
+            kind = _cache.pop(key)
+        else:
+            f_obj = open(source, 'rb')
+            try:
+                kind = sniff_data(f_obj.read(SNIFF_SIZE))
+            finally:
+                f_obj.close()
+    except (IOError, OSError):
+        return None
+    _cache[key] = kind
+    if len(_cache) > SNIFF_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return kind
@@ -0,0 +1,51 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Single pass reader for compressed tarballs.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import tarfile
+
+from victims.archivers.cpio import StreamMember
+from victims.archivers.rpm import DECOMPRESSORS, PayloadReader
+
+#: Compression used by each kind of tarball
+TAR_KINDS = {
+    'tar': None,
+    'tar.gz': 'gzip',
+    'tar.bz2': 'bzip2',
+    'tar.xz': 'xz',
+}
+
+
+def iter_tar(f_obj, compression, match=None):
+    """
+    Yields (name, StreamMember) for each regular file in a tarball whose
+    name passes match. The tarball is decompressed once, front to back,
+    and members which don't match are skipped as they go by.
+
+    :Parameters:
+       - `f_obj`: file like object positioned at the start of the tarball
+       - `compression`: name of the compression in
+         victims.archivers.rpm.DECOMPRESSORS or None
+       - `match`: optional callable taking a name and returning a boolean
+    """
+    if compression is not None:
+        f_obj = PayloadReader(f_obj, DECOMPRESSORS[compression]())
+    tar = tarfile.open(mode='r|', fileobj=f_obj)
+    for info in tar:
+        if not info.isfile() or (match is not None and not match(info.name)):
+            continue
+        member = StreamMember(info.name, tar.extractfile(info), info.size)
+        yield (info.name, member)
+        # The stream moves on to the next header after this
+        member.detach()
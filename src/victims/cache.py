@@ -0,0 +1,250 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Persistent cache of package digests.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import time
+import warnings
+
+import sqlalchemy
+import sqlalchemy.exc
+
+from victims import HashGenerator, RACY_WINDOW, fingerprint
+from victims.db import CachedHash, upsert
+from victims.metrics import METRICS
+
+#: Default maximum number of cached digests kept in the database
+DEFAULT_MAX_ENTRIES = 1000000
+
+#: Number of queued digests written to the database at a time
+FLUSH_EVERY = 1000
+
+
+class HashCache(object):
+    """
+    Callable which returns cached digests for unchanged files and only
+    hashes files which are new or have changed since they were cached.
+    When the database can not be written to, such as a read-only cvemap,
+    the cache warns once and stops remembering digests.
+    """
+
+    __slots__ = [
+        '__connection', '__hasher', '__algorithm', '__max_entries',
+        '__pending', '__touched', '__table', '__hits', '__misses',
+        '__read_only']
+
+    def __init__(
+            self, connection, hasher=None, algorithm='sha512',
+            max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Creates the cache.
+
+        :Parameters:
+           - `connection`: victims.db.Connection to store digests with
+           - `hasher`: callable used to hash files missing from the cache
+           - `algorithm`: name of the algorithm hasher produces
+           - `max_entries`: number of digests to keep, least recently used
+             digests are evicted first
+        """
+        if hasher is None:
+            hasher = HashGenerator()
+        self.__connection = connection
+        self.__hasher = hasher
+        self.__algorithm = algorithm
+        self.__max_entries = int(max_entries)
+        self.__table = CachedHash.__table__
+        self.__pending = {}
+        self.__touched = set()
+        self.__hits = 0
+        self.__misses = 0
+        self.__read_only = False
+
+    def __call__(self, input):
+        """
+        Returns the digest for input, hashing it only when needed.
+
+        :Parameters:
+           - `input`: the path to the file or a file like obj for hashing.
+        """
+        # Only files on disk have a fingerprint
+        if getattr(input, 'read', False):
+            return self.__hasher(input)
+
+        before, hash = self.lookup(input)
+        if hash is None:
+            hash = self.__hasher(input)
+            self.store(before, fingerprint(input), hash)
+        return hash
+
+    def lookup(self, path):
+        """
+        Returns a tuple of the fingerprint of path and its cached digest or
+        None if it must be hashed.
+
+        :Parameters:
+           - `path`: path to the file
+        """
+        fprint = fingerprint(path)
+        hash = self.get(fprint)
+        if hash is None:
+            self.__misses += 1
+            METRICS.count('cache_misses')
+        else:
+            self.__hits += 1
+            METRICS.count('cache_hits')
+        return (fprint, hash)
+
+    def store(self, before, after, hash):
+        """
+        Queues the digest of a file unless it changed while being hashed.
+
+        :Parameters:
+           - `before`: fingerprint taken before hashing
+           - `after`: fingerprint taken after hashing
+           - `hash`: digest of the file
+        """
+        if before == after:
+            self.set(before, hash)
+
+    def get(self, fprint):
+        """
+        Returns the cached digest for a fingerprint or None.
+
+        :Parameters:
+           - `fprint`: fingerprint as returned by fingerprint()
+        """
+        device, inode, size, mtime = fprint
+        key = (device, inode)
+        if key in self.__pending:
+            pending = self.__pending[key]
+            if (pending['size'], pending['mtime']) == (size, mtime):
+                return pending['hash']
+            return None
+
+        t = self.__table
+        with METRICS.phase('cache_lookup'):
+            row = self.__connection.engine.execute(
+                sqlalchemy.select([t.c.size, t.c.mtime, t.c.hash]).where(
+                    sqlalchemy.and_(
+                        t.c.device == device, t.c.inode == inode,
+                        t.c.algorithm == self.__algorithm))).first()
+        METRICS.count('db_queries')
+        if row is None or (row.size, row.mtime) != (size, mtime):
+            return None
+        self.__touched.add(key)
+        return row.hash
+
+    def set(self, fprint, hash):
+        """
+        Queues a digest to be written on the next flush.
+
+        :Parameters:
+           - `fprint`: fingerprint as returned by fingerprint()
+           - `hash`: digest of the file
+        """
+        device, inode, size, mtime = fprint
+        if self.__read_only or mtime > time.time() - RACY_WINDOW:
+            return
+        self.__pending[(device, inode)] = {
+            'device': device,
+            'inode': inode,
+            'algorithm': self.__algorithm,
+            'size': size,
+            'mtime': mtime,
+            'hash': hash,
+        }
+        if len(self.__pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes queued digests, refreshes the last use of hits and evicts
+        the least recently used digests beyond max_entries. Scans go on
+        without remembering digests when the writes fail.
+        """
+        if self.__read_only:
+            return
+        try:
+            with METRICS.phase('cache_flush'):
+                self.__flush()
+        except sqlalchemy.exc.DBAPIError, de:
+            self.__read_only = True
+            self.__pending = {}
+            self.__touched = set()
+            warnings.warn(
+                'Not caching package hashes, the database can not be '
+                'written to: %s' % de.orig, RuntimeWarning)
+        METRICS.count('db_queries')
+
+    def __flush(self):
+        """
+        Does the writing for flush.
+        """
+        t = self.__table
+        now = time.time()
+        conn = self.__connection.engine.connect()
+        trans = conn.begin()
+        try:
+            if self.__touched:
+                conn.execute(
+                    t.update().where(sqlalchemy.and_(
+                        t.c.device == sqlalchemy.bindparam('b_device'),
+                        t.c.inode == sqlalchemy.bindparam('b_inode'),
+                        t.c.algorithm == self.__algorithm)).values(
+                            last_used=now),
+                    [{'b_device': d, 'b_inode': i}
+                     for d, i in self.__touched])
+            if self.__pending:
+                rows = self.__pending.values()
+                for row in rows:
+                    row['last_used'] = now
+                upsert(conn, t, rows)
+            self.__evict(conn)
+            trans.commit()
+        except:
+            trans.rollback()
+            raise
+        finally:
+            conn.close()
+        self.__pending = {}
+        self.__touched = set()
+
+    def __evict(self, conn):
+        """
+        Removes the least recently used digests beyond max_entries.
+
+        :Parameters:
+           - `conn`: connection with an open transaction
+        """
+        t = self.__table
+        # Last use of the oldest digest which is kept
+        cutoff = conn.execute(
+            sqlalchemy.select([t.c.last_used]).order_by(
+                t.c.last_used.desc()).offset(
+                    max(self.__max_entries - 1, 0)).limit(1)).scalar()
+        if cutoff is not None:
+            # Digests used in the same flush share a timestamp, keep ties
+            conn.execute(t.delete().where(t.c.last_used < cutoff))
+
+    def clear(self):
+        """
+        Drops every cached digest.
+        """
+        self.__connection.engine.execute(self.__table.delete())
+        self.__pending = {}
+        self.__touched = set()
+
+    # Read-only properties
+    hits = property(lambda s: s.__hits)
+    misses = property(lambda s: s.__misses)
+    read_only = property(lambda s: s.__read_only)
@@ -0,0 +1,261 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Long running scan server and its client. Requests and responses are one
+JSON object per line over a Unix socket. The client side only needs the
+standard library so thin clients such as the yum plugin start quickly.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import errno
+import json
+import os
+import socket
+import SocketServer
+
+#: Bytes read from the socket at a time
+READ_SIZE = 64 * 1024
+
+#: Seconds a client waits on the daemon to accept, take or answer a request
+#: before giving up on it. Scans answer once they are done, so this bounds
+#: how long a scan through the daemon may take.
+DEFAULT_TIMEOUT = 300
+
+
+class DaemonError(Exception):
+    """
+    Raised when the daemon can not be reached or a request fails.
+    """
+    pass
+
+
+def request(socket_path, message, timeout=DEFAULT_TIMEOUT):
+    """
+    Sends a request to the daemon and returns its response. A daemon which
+    stops responding for timeout seconds raises DaemonError, like one which
+    can not be reached.
+
+    :Parameters:
+       - `socket_path`: path of the daemon socket
+       - `message`: dict to send, its command key says what to do
+       - `timeout`: seconds to wait for the daemon, None waits forever
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(message) + '\n')
+            sock.shutdown(socket.SHUT_WR)
+            chunks = []
+            while True:
+                chunk = sock.recv(READ_SIZE)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        except socket.timeout:
+            raise DaemonError('The daemon at %s did not answer in %s '
+                              'seconds' % (socket_path, timeout))
+        except socket.error, se:
+            raise DaemonError('Can not talk to the daemon at %s: %s' % (
+                socket_path, se))
+    finally:
+        sock.close()
+    try:
+        response = json.loads(''.join(chunks))
+    except ValueError:
+        raise DaemonError('Bad response from the daemon')
+    if 'error' in response:
+        raise DaemonError(response['error'])
+    return response
+
+
+def scan(socket_path, paths, look_inside=False, depth=1, sniff=False,
+         walker='os', timeout=DEFAULT_TIMEOUT, dedup=True):
+    """
+    Asks the daemon to scan paths. Returns a dict holding scanned, the
+    number of packages looked at, matches, a list of the
+    victims.report.finding records of each match, and skipped, a list of
+    (name, reason) for packages which were not looked inside of.
+
+    :Parameters:
+       - `socket_path`: path of the daemon socket
+       - `paths`: paths to look in, relative ones are made absolute here
+       - `look_inside`: if packages should be scanned for hidden packages
+       - `depth`: how many levels of packages inside of packages to look
+       - `sniff`: if files without a package suffix should be sniffed
+       - `walker`: name of a walker in victims.walkers.WALKERS
+       - `timeout`: seconds to wait for the daemon, None waits forever
+       - `dedup`: if copies of an archive should reuse what was found
+         inside of the first one
+    """
+    return request(socket_path, {
+        'command': 'scan',
+        'paths': [os.path.abspath(x) for x in paths],
+        'look_inside': look_inside,
+        'depth': depth,
+        'sniff': sniff,
+        'walker': walker,
+        'dedup': dedup}, timeout)
+
+
+def stats(socket_path, reset=False, timeout=DEFAULT_TIMEOUT):
+    """
+    Returns the victims.metrics snapshot of everything the daemon scanned
+    since it started or was last reset.
+
+    :Parameters:
+       - `socket_path`: path of the daemon socket
+       - `reset`: if the daemon should start counting again afterwards
+       - `timeout`: seconds to wait for the daemon, None waits forever
+    """
+    return request(
+        socket_path, {'command': 'stats', 'reset': reset}, timeout)
+
+
+def ping(socket_path, timeout=DEFAULT_TIMEOUT):
+    """
+    Returns True if a daemon answers on socket_path.
+
+    :Parameters:
+       - `socket_path`: path of the daemon socket
+       - `timeout`: seconds to wait for the daemon, None waits forever
+    """
+    try:
+        request(socket_path, {'command': 'ping'}, timeout)
+    except DaemonError:
+        return False
+    return True
+
+
+def _listening(socket_path):
+    """
+    Returns True unless nothing is listening on socket_path. A daemon busy
+    with a long scan still accepts connections, and one whose queue is full
+    makes connecting time out, so both count as listening.
+
+    :Parameters:
+       - `socket_path`: path of the daemon socket
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(1)
+        try:
+            sock.connect(socket_path)
+        except socket.timeout:
+            return True
+        except socket.error, se:
+            if se.errno in (errno.ECONNREFUSED, errno.ENOENT):
+                return False
+            raise DaemonError('Can not tell if a daemon is listening on '
+                              '%s: %s' % (socket_path, se))
+    finally:
+        sock.close()
+    return True
+
+
+class ScanHandler(SocketServer.StreamRequestHandler):
+    """
+    Answers one request on a connection to the daemon.
+    """
+
+    def handle(self):
+        """
+        Reads the request line and writes back the response line.
+        """
+        try:
+            message = json.loads(self.rfile.readline())
+            command = message.get('command', 'scan')
+            if command == 'ping':
+                response = {'ok': True}
+            elif command == 'scan':
+                response = self.server.do_scan(message)
+            elif command == 'clear_cache':
+                self.server.scanner.clear_cache()
+                response = {'ok': True}
+            elif command == 'stats':
+                metrics = self.server.scanner.metrics
+                response = metrics.snapshot()
+                if message.get('reset', False):
+                    metrics.reset()
+            else:
+                response = {'error': 'Unknown command %s' % command}
+        except Exception, ex:
+            # One bad request shouldn't take the daemon down
+            response = {'error': '%s: %s' % (ex.__class__.__name__, ex)}
+        self.wfile.write(json.dumps(response) + '\n')
+
+
+class ScanServer(SocketServer.UnixStreamServer):
+    """
+    Unix socket server handing requests to a victims.scanner.Scanner. One
+    request is served at a time so the connection and cache are never
+    shared between threads.
+    """
+
+    def __init__(self, socket_path, scanner):
+        """
+        Binds the socket, replacing it only if nothing is listening on it.
+        Only the owner may connect as requests name paths to read.
+
+        :Parameters:
+           - `socket_path`: path of the socket to listen on
+           - `scanner`: victims.scanner.Scanner doing the work
+        """
+        self.scanner = scanner
+        self.socket_path = socket_path
+        if os.path.exists(socket_path):
+            if _listening(socket_path):
+                raise DaemonError(
+                    'A daemon is already listening on %s' % socket_path)
+            os.unlink(socket_path)
+        old_umask = os.umask(0177)
+        try:
+            SocketServer.UnixStreamServer.__init__(
+                self, socket_path, ScanHandler)
+        finally:
+            os.umask(old_umask)
+
+    def do_scan(self, message):
+        """
+        Runs a scan request and returns the response.
+
+        :Parameters:
+           - `message`: the scan request
+        """
+        finder = self.scanner.finder(
+            look_inside=bool(message.get('look_inside', False)),
+            depth=int(message.get('depth', 1)),
+            sniff=bool(message.get('sniff', False)),
+            walker=message.get('walker', 'os'),
+            dedup=bool(message.get('dedup', True)))
+        from victims.report import finding
+        before = self.scanner.metrics.snapshot()
+        matches = []
+        for package, result in self.scanner.scan(
+                message.get('paths', []), finder):
+            matches.append(finding(package, result))
+        return {
+            'scanned': self.scanner.scanned,
+            'matches': matches,
+            'skipped': finder.skipped,
+            'metrics': self.scanner.metrics.since(before)}
+
+    def server_close(self):
+        """
+        Closes the socket and removes it from the file system.
+        """
+        SocketServer.UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self.socket_path)
+        except OSError, oe:
+            if oe.errno != errno.ENOENT:
+                raise
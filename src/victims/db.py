@@ -14,12 +14,75 @@ Database related classes.
 __docformat__ = 'restructuredtext'
 
 import sqlalchemy
+import sqlalchemy.exc
 import sqlalchemy.orm
 import sqlalchemy.ext.declarative
 
+from victims.lite import (
+    batches, split_cves, unique, MAX_LOOKUP_PARAMETERS, SCHEMA_TABLE,
+    SCHEMA_VERSION)
+from victims.metrics import METRICS
+
 # Create the base class
 Base = sqlalchemy.ext.declarative.declarative_base()
 
+#: Default number of rows written per transaction by bulk writes
+DEFAULT_WRITE_BATCH_SIZE = 1000
+
+
+def _pg_upsert(table):
+    """
+    Returns a PostgreSQL INSERT ... ON CONFLICT statement replacing rows of
+    table with the same primary key, or None when SQLAlchemy is too old to
+    build one. Rows of tables whose columns are all part of the key are
+    left as they are.
+
+    :Parameters:
+       - `table`: sqlalchemy Table to write to
+    """
+    try:
+        from sqlalchemy.dialects.postgresql import insert
+    except ImportError:
+        return None
+    keys = list(table.primary_key.columns)
+    stmt = insert(table)
+    values = dict((c.name, stmt.excluded[c.name])
+                  for c in table.columns if c not in keys)
+    if not values:
+        return stmt.on_conflict_do_nothing(index_elements=keys)
+    return stmt.on_conflict_do_update(index_elements=keys, set_=values)
+
+
+def upsert(conn, table, rows):
+    """
+    Inserts rows replacing any existing rows with the same primary key in
+    one executemany. Uses the dialect's native upsert where there is one
+    and falls back to deleting the keys first. Transactions are left to the
+    caller.
+
+    :Parameters:
+       - `conn`: sqlalchemy connection to execute on
+       - `table`: sqlalchemy Table to write to
+       - `rows`: list of dicts with a value for every column
+    """
+    if not rows:
+        return
+    keys = list(table.primary_key.columns)
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        conn.execute(table.insert().prefix_with('OR REPLACE'), rows)
+        return
+    if dialect == 'postgresql':
+        stmt = _pg_upsert(table)
+        if stmt is not None:
+            conn.execute(stmt, rows)
+            return
+    conn.execute(
+        table.delete().where(sqlalchemy.and_(*[
+            c == sqlalchemy.bindparam('pk_' + c.name) for c in keys])),
+        [dict(('pk_' + c.name, row[c.name]) for c in keys) for row in rows])
+    conn.execute(table.insert(), rows)
+
 
 class CVEMap(Base):
     """
@@ -35,6 +98,12 @@ class CVEMap(Base):
     db_version = sqlalchemy.Column(sqlalchemy.Integer)
     format = sqlalchemy.Column(sqlalchemy.String(10), index=True)
 
+    __table_args__ = (
+        sqlalchemy.Index('ix_cvemap_name_version', 'name', 'version'),
+        sqlalchemy.Index('ix_cvemap_vendor_name', 'vendor', 'name'),
+        sqlalchemy.Index('ix_cvemap_db_version', 'db_version'),
+    )
+
     def __init__(self, hash, name, version, vendor, cves, db_version, format):
         """
         Creates the CVEMap instance.
@@ -63,6 +132,123 @@ class CVEMap(Base):
         return "<CVEMap(%s)>" % self.hash
 
 
+class CachedHash(Base):
+    """
+    Digest of a file on disk keyed by its stat fingerprint.
+    """
+    __tablename__ = 'hashcache'
+
+    device = sqlalchemy.Column(
+        sqlalchemy.Integer, primary_key=True, autoincrement=False)
+    inode = sqlalchemy.Column(
+        sqlalchemy.Integer, primary_key=True, autoincrement=False)
+    algorithm = sqlalchemy.Column(sqlalchemy.String(16), primary_key=True)
+    size = sqlalchemy.Column(sqlalchemy.Integer)
+    mtime = sqlalchemy.Column(sqlalchemy.Float)
+    hash = sqlalchemy.Column(sqlalchemy.String(512))
+    last_used = sqlalchemy.Column(sqlalchemy.Float, index=True)
+
+    def __repr__(self):
+        """
+        String representation of the instance.
+        """
+        return "<CachedHash(%s:%s)>" % (self.device, self.inode)
+
+
+class HashCVE(Base):
+    """
+    One CVE affecting a hash, the cves of CVEMap split out so hashes can
+    be found by CVE through an index.
+    """
+    __tablename__ = 'hashcve'
+
+    hash = sqlalchemy.Column(sqlalchemy.String(512), primary_key=True)
+    cve = sqlalchemy.Column(sqlalchemy.String(32), primary_key=True,
+                            index=True)
+
+    def __repr__(self):
+        """
+        String representation of the instance.
+        """
+        return "<HashCVE(%s:%s)>" % (self.cve, self.hash)
+
+
+def hashcve_rows(rows):
+    """
+    Returns the hashcve rows for cvemap rows.
+
+    :Parameters:
+       - `rows`: list of dicts with at least hash and cves
+    """
+    return [{'hash': x['hash'], 'cve': cve}
+            for x in rows for cve in split_cves(x['cves'])]
+
+
+class SchemaVersion(Base):
+    """
+    Version of the database layout, a single row.
+    """
+    __tablename__ = SCHEMA_TABLE
+
+    version = sqlalchemy.Column(
+        sqlalchemy.Integer, primary_key=True, autoincrement=False)
+
+    def __repr__(self):
+        """
+        String representation of the instance.
+        """
+        return "<SchemaVersion(%s)>" % self.version
+
+
+def _add_lookup_indexes(engine):
+    """
+    Schema 2: indexes for name/version and vendor/name lookups on cvemap.
+    Schema 4: index on db_version for rows written since an update.
+
+    :Parameters:
+       - `engine`: sqlalchemy engine of the database
+    """
+    existing = set(
+        x['name'] for x in sqlalchemy.inspect(engine).get_indexes('cvemap'))
+    for index in CVEMap.__table__.indexes:
+        if index.name not in existing:
+            index.create(engine)
+
+
+def _fill_hashcve(engine):
+    """
+    Schema 3: fills hashcve from the cves of every cvemap row.
+
+    :Parameters:
+       - `engine`: sqlalchemy engine of the database
+    """
+    t = CVEMap.__table__
+    # Read up front, sqlite can't commit while a read is still open
+    rows = engine.execute(sqlalchemy.select([t.c.hash, t.c.cves])).fetchall()
+    conn = engine.connect()
+    try:
+        for batch in batches(rows, DEFAULT_WRITE_BATCH_SIZE):
+            trans = conn.begin()
+            try:
+                upsert(conn, HashCVE.__table__, hashcve_rows(
+                    [{'hash': x[0], 'cves': x[1]} for x in batch]))
+                trans.commit()
+            except:
+                trans.rollback()
+                raise
+    finally:
+        conn.close()
+
+
+#: Steps bringing a database up to each schema version from the one before.
+#: create_all only adds missing tables, anything else needs a step here.
+MIGRATIONS = {
+    2: _add_lookup_indexes,
+    3: _fill_hashcve,
+    4: _add_lookup_indexes,
+}
+
+
 class Connection(object):
     """
     Database connection.
@@ -79,6 +265,211 @@ class Connection(object):
         self.engine = sqlalchemy.engine_from_config(
             config['database'], prefix='')
         self.metadata = Base.metadata
-        self.metadata.create_all(self.engine)
+        self.ensure_schema()
         self.session = sqlalchemy.orm.sessionmaker(
             autoflush=True, autocommit=True, bind=self.engine)()
+
+    def schema_version(self):
+        """
+        Returns the version of the database layout, 0 when unknown.
+        """
+        t = SchemaVersion.__table__
+        try:
+            row = self.engine.execute(
+                sqlalchemy.select([t.c.version])).first()
+        except sqlalchemy.exc.DBAPIError:
+            return 0
+        return row and row[0] or 0
+
+    def ensure_schema(self):
+        """
+        Creates the tables and runs the migrations unless the database
+        already has the current layout. Checking one row is much cheaper
+        than create_all looking at every table on every run.
+        """
+        version = self.schema_version()
+        if version >= SCHEMA_VERSION:
+            return
+        self.metadata.create_all(self.engine)
+        for step in range(version + 1, SCHEMA_VERSION + 1):
+            if step in MIGRATIONS:
+                MIGRATIONS[step](self.engine)
+        t = SchemaVersion.__table__
+        conn = self.engine.connect()
+        try:
+            trans = conn.begin()
+            try:
+                conn.execute(t.delete())
+                conn.execute(t.insert(), version=SCHEMA_VERSION)
+                trans.commit()
+            except:
+                trans.rollback()
+                raise
+        finally:
+            conn.close()
+
+    def lookup(self, hashes, formats=None, batch_size=MAX_LOOKUP_PARAMETERS):
+        """
+        Yields the CVEMap rows matching hashes. Hashes are looked up in
+        batches so the number of bound parameters per query stays bounded
+        and each query is executed exactly once.
+
+        :Parameters:
+           - `hashes`: iterable of hashes to look for
+           - `formats`: optional list of formats the rows must have
+           - `batch_size`: most parameters bound into a single query
+        """
+        if formats is not None:
+            formats = list(formats)
+            if not formats:
+                return
+        per_query = max(batch_size - len(formats or []), 1)
+        for batch in batches(hashes, per_query):
+            query = self.session.query(CVEMap).filter(CVEMap.hash.in_(batch))
+            if formats is not None:
+                query = query.filter(CVEMap.format.in_(formats))
+            with METRICS.phase('db_lookup'):
+                results = query.all()
+            METRICS.count('db_queries')
+            METRICS.count('db_rows', len(results))
+            for result in results:
+                yield result
+
+    def db_state(self, formats=None):
+        """
+        Returns (max db_version, row count) of the cvemap rows for formats,
+        which change whenever rows are added, updated or removed.
+
+        :Parameters:
+           - `formats`: optional list of formats
+        """
+        t = CVEMap.__table__
+        query = sqlalchemy.select([
+            sqlalchemy.func.max(t.c.db_version), sqlalchemy.func.count()])
+        if formats is not None:
+            query = query.where(t.c.format.in_(list(formats)))
+        version, count = self.engine.execute(query).first()
+        return (version or 0, count)
+
+    def since(self, db_version):
+        """
+        Yields the CVEMap rows written by updates after db_version, found
+        through the index on cvemap.db_version.
+
+        :Parameters:
+           - `db_version`: db_version of the last update already seen
+        """
+        METRICS.count('db_queries')
+        for result in self.session.query(CVEMap).filter(
+                CVEMap.db_version > db_version):
+            yield result
+
+    def find(self, name, version):
+        """
+        Returns the CVEMap rows for a package name and version.
+
+        :Parameters:
+           - `name`: name of the package
+           - `version`: version of the package
+        """
+        return self.session.query(CVEMap).filter(
+            CVEMap.name == name).filter(CVEMap.version == version).all()
+
+    def find_many(self, pairs, batch_size=MAX_LOOKUP_PARAMETERS):
+        """
+        Yields the CVEMap rows for many (name, version) pairs using one
+        query per batch of pairs. Repeated pairs are only looked up once.
+
+        :Parameters:
+           - `pairs`: iterable of (name, version)
+           - `batch_size`: most parameters bound into a single query
+        """
+        for batch in batches(unique(pairs), max(batch_size // 2, 1)):
+            wanted = set(batch)
+            query = self.session.query(CVEMap).filter(
+                CVEMap.name.in_(set(x[0] for x in batch))).filter(
+                    CVEMap.version.in_(set(x[1] for x in batch)))
+            for result in query:
+                # Names and versions are matched separately by the query
+                if (result.name, result.version) in wanted:
+                    yield result
+
+    def affected(self, cves, batch_size=MAX_LOOKUP_PARAMETERS):
+        """
+        Yields (cve, CVEMap row) for every hash affected by one of cves,
+        found through the index on hashcve.cve.
+
+        :Parameters:
+           - `cves`: iterable of CVE ids
+           - `batch_size`: most parameters bound into a single query
+        """
+        for batch in batches(unique(cves), batch_size):
+            query = self.session.query(HashCVE.cve, CVEMap).join(
+                CVEMap, CVEMap.hash == HashCVE.hash).filter(
+                    HashCVE.cve.in_(batch)).order_by(HashCVE.cve)
+            for cve, result in query:
+                yield (cve, result)
+
+    def update_cvemap(self, rows, batch_size=DEFAULT_WRITE_BATCH_SIZE):
+        """
+        Writes cvemap rows along with their hashcve rows, committing every
+        batch_size rows. Returns the number of cvemap rows written.
+
+        :Parameters:
+           - `rows`: iterable of dicts with a value for every cvemap column
+           - `batch_size`: number of cvemap rows per transaction
+        """
+        hashcve = HashCVE.__table__
+        count = 0
+        conn = self.engine.connect()
+        try:
+            for batch in batches(rows, batch_size):
+                trans = conn.begin()
+                try:
+                    upsert(conn, CVEMap.__table__, batch)
+                    # The cves of a hash may have changed
+                    for keys in batches(
+                            [x['hash'] for x in batch],
+                            MAX_LOOKUP_PARAMETERS):
+                        conn.execute(hashcve.delete().where(
+                            hashcve.c.hash.in_(keys)))
+                    upsert(conn, hashcve, hashcve_rows(batch))
+                    trans.commit()
+                except:
+                    trans.rollback()
+                    raise
+                count += len(batch)
+        finally:
+            conn.close()
+        return count
+
+    def remove_hashes(self, hashes, batch_size=DEFAULT_WRITE_BATCH_SIZE):
+        """
+        Deletes cvemap rows and their hashcve rows, committing every
+        batch_size hashes like update_cvemap. Returns the number of cvemap
+        rows deleted.
+
+        :Parameters:
+           - `hashes`: iterable of hashes to remove
+           - `batch_size`: number of hashes per transaction
+        """
+        cvemap = CVEMap.__table__
+        hashcve = HashCVE.__table__
+        count = 0
+        conn = self.engine.connect()
+        try:
+            for batch in batches(hashes, batch_size):
+                trans = conn.begin()
+                try:
+                    for keys in batches(batch, MAX_LOOKUP_PARAMETERS):
+                        conn.execute(hashcve.delete().where(
+                            hashcve.c.hash.in_(keys)))
+                        count += conn.execute(cvemap.delete().where(
+                            cvemap.c.hash.in_(keys))).rowcount
+                    trans.commit()
+                except:
+                    trans.rollback()
+                    raise
+        finally:
+            conn.close()
+        return count
@@ -0,0 +1,100 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Incremental reading of update service feeds.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import json
+import os.path
+import re
+import urllib
+
+#: Default number of bytes read from a feed at a time
+DEFAULT_FEED_CHUNK_SIZE = 64 * 1024
+
+# Whitespace and the commas between array items
+_SKIP = re.compile(r'[\s,]*')
+
+
+def open_feed(source):
+    """
+    Opens a feed from a URL (including file://) or a local path.
+
+    :Parameters:
+       - `source`: where the feed lives
+    """
+    if os.path.exists(source):
+        return open(source, 'rb')
+    return urllib.urlopen(source)
+
+
+def iter_records(f_obj, chunk_size=DEFAULT_FEED_CHUNK_SIZE):
+    """
+    Yields the items of a JSON array one at a time while reading f_obj in
+    chunks, so only the current item is ever held in memory rather than
+    the whole document.
+
+    :Parameters:
+       - `f_obj`: file like object holding a JSON array
+       - `chunk_size`: number of bytes to read at a time
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    started = False
+    while True:
+        pos = _SKIP.match(buf, pos).end()
+        if not started:
+            if pos < len(buf):
+                if buf[pos] != '[':
+                    raise ValueError('Feed is not a JSON array')
+                started = True
+                pos += 1
+                continue
+        elif pos < len(buf):
+            if buf[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # Most likely only part of the item has been read so far
+                if eof:
+                    raise
+            else:
+                pos = end
+                yield item
+                continue
+        if eof:
+            raise ValueError('Feed ended before the JSON array did')
+        chunk = f_obj.read(chunk_size)
+        if not chunk:
+            eof = True
+        # Drop what has been parsed so the buffer only holds one item
+        buf = buf[pos:] + chunk
+        pos = 0
+
+
+def iter_fields(source, chunk_size=DEFAULT_FEED_CHUNK_SIZE):
+    """
+    Yields the fields of every record in a feed.
+
+    :Parameters:
+       - `source`: URL or local path of the feed
+       - `chunk_size`: number of bytes to read at a time
+    """
+    f_obj = open_feed(source)
+    try:
+        for record in iter_records(f_obj, chunk_size):
+            yield record['fields']
+    finally:
+        f_obj.close()
@@ -0,0 +1,229 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Compact in-memory index of the hashes in the cvemap table.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import binascii
+import mmap
+import os
+
+import sqlalchemy
+
+from victims.db import CVEMap
+from victims.lite import database_key
+
+#: Size of a raw sha512 digest
+RECORD_SIZE = 64
+
+#: Size of the header of a saved index, a multiple of RECORD_SIZE
+HEADER_SIZE = 128
+
+#: First field of the header of a saved index
+MAGIC = 'VICTIMSIDX2'
+
+
+def index_key(connection, formats=None):
+    """
+    Returns what an index built from the database now would be keyed on:
+    (database_key of the database, max db_version, row count, sum of
+    db_version) of the cvemap rows for formats. The sum changes when rows
+    are replaced by rows of another update even if the row count and the
+    newest update stay the same.
+
+    :Parameters:
+       - `connection`: victims.db.Connection to read from
+       - `formats`: optional list of formats
+    """
+    t = CVEMap.__table__
+    query = sqlalchemy.select([
+        sqlalchemy.func.max(t.c.db_version), sqlalchemy.func.count(),
+        sqlalchemy.func.sum(t.c.db_version)])
+    if formats is not None:
+        query = query.where(t.c.format.in_(list(formats)))
+    version, count, total = connection.engine.execute(query).first()
+    return (database_key(str(connection.engine.url)), int(version or 0),
+            int(count), int(total or 0))
+
+
+class HashIndex(object):
+    """
+    Sorted array of raw sha512 digests supporting membership tests with a
+    binary search. Answers "could this hash be in cvemap" without creating
+    any ORM objects; rows only need to be fetched for hits.
+    """
+
+    __slots__ = ['__data', '__offset', '__count', '__key']
+
+    def __init__(self, data, key=('', 0, 0, 0), offset=0):
+        """
+        Creates the index.
+
+        :Parameters:
+           - `data`: string or mmap of sorted raw digests
+           - `key`: index_key of the database the data was built from
+           - `offset`: where the digests start in data
+        """
+        self.__data = data
+        self.__offset = offset
+        self.__count = (len(data) - offset) // RECORD_SIZE
+        self.__key = tuple(key)
+
+    @classmethod
+    def load(cls, connection, formats=None):
+        """
+        Builds an index from the cvemap table. Hashes which are not sha512
+        hex digests can never match a scanned package and are left out.
+
+        :Parameters:
+           - `connection`: victims.db.Connection to read from
+           - `formats`: optional list of formats to load
+        """
+        key = index_key(connection, formats)
+        t = CVEMap.__table__
+        query = sqlalchemy.select([t.c.hash])
+        if formats is not None:
+            query = query.where(t.c.format.in_(list(formats)))
+        digests = set()
+        for row in connection.engine.execute(query):
+            if row[0] and len(row[0]) == RECORD_SIZE * 2:
+                try:
+                    digests.add(binascii.unhexlify(row[0]))
+                except TypeError:
+                    pass
+        return cls(''.join(sorted(digests)), key)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Memory maps an index saved with save().
+
+        :Parameters:
+           - `path`: path to the saved index
+        """
+        f_obj = open(path, 'rb')
+        try:
+            header = f_obj.read(HEADER_SIZE).split()
+            if len(header) != 5 or header[0] != MAGIC:
+                raise ValueError('%s is not a hash index' % path)
+            key = (header[1], int(header[2]), int(header[3]), int(header[4]))
+            if os.path.getsize(path) == HEADER_SIZE:
+                # Empty files can not be mapped
+                return cls('', key)
+            data = mmap.mmap(f_obj.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f_obj.close()
+        return cls(data, key, HEADER_SIZE)
+
+    @classmethod
+    def cached(cls, connection, path):
+        """
+        Returns the index saved at path if it was built from the database
+        as it is now, else builds a new one from the database and saves it
+        to path.
+
+        :Parameters:
+           - `connection`: victims.db.Connection to read from
+           - `path`: path to the saved index
+        """
+        if os.path.isfile(path):
+            try:
+                index = cls.open(path)
+                if not index.stale(connection):
+                    return index
+            except (ValueError, EnvironmentError):
+                pass
+        index = cls.load(connection)
+        try:
+            index.save(path)
+        except EnvironmentError:
+            # Still usable from memory, it just won't be reused next time
+            pass
+        return index
+
+    def save(self, path):
+        """
+        Writes the index to path so it can be memory mapped with open().
+
+        :Parameters:
+           - `path`: where to save the index
+        """
+        header = ('%s %s %d %d %d' % ((MAGIC, ) + self.__key)).ljust(
+            HEADER_SIZE)
+        # Write to a temporary file so readers never see half an index
+        tmp_path = path + '.tmp'
+        out = open(tmp_path, 'wb')
+        try:
+            out.write(header)
+            out.write(self.__data[self.__offset:])
+        finally:
+            out.close()
+        os.rename(tmp_path, path)
+
+    def __contains__(self, hash):
+        """
+        Checks if a hex sha512 digest is in the index.
+
+        :Parameters:
+           - `hash`: hex digest to look for
+        """
+        try:
+            digest = binascii.unhexlify(hash)
+        except TypeError:
+            return False
+        if len(digest) != RECORD_SIZE:
+            return False
+        data = self.__data
+        offset = self.__offset
+        low = 0
+        high = self.__count
+        while low < high:
+            mid = (low + high) // 2
+            start = offset + mid * RECORD_SIZE
+            if data[start:start + RECORD_SIZE] < digest:
+                low = mid + 1
+            else:
+                high = mid
+        start = offset + low * RECORD_SIZE
+        return (low < self.__count and
+                data[start:start + RECORD_SIZE] == digest)
+
+    def __len__(self):
+        """
+        Number of digests in the index.
+        """
+        return self.__count
+
+    def filter(self, hashes):
+        """
+        Yields the hashes which are in the index.
+
+        :Parameters:
+           - `hashes`: iterable of hex digests
+        """
+        for hash in hashes:
+            if hash in self:
+                yield hash
+
+    def stale(self, connection):
+        """
+        Returns True when the index was built from another database or the
+        database has changed since.
+
+        :Parameters:
+           - `connection`: victims.db.Connection to check against
+        """
+        return self.__key != index_key(connection)
+
+    # Read-only properties
+    key = property(lambda s: s.__key)
+    db_state = property(lambda s: s.__key[1:3])
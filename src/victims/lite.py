@@ -0,0 +1,293 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Read only access to sqlite databases through the sqlite3 module. Importing
+SQLAlchemy costs more than most lookups, so commands which only read use
+this when they can.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import collections
+import hashlib
+import itertools
+import os
+import sys
+
+from victims.metrics import METRICS
+
+#: Version of the database layout. Bump it whenever tables change so the
+#: schema is created or migrated on the next connection.
+SCHEMA_VERSION = 4
+
+#: Table holding the version of the database layout
+SCHEMA_TABLE = 'victims_schema'
+
+#: Most values bound into one lookup query. Keeps well under SQLite's
+#: default limit of 999 host parameters.
+MAX_LOOKUP_PARAMETERS = 500
+
+#: Columns of the cvemap table in order
+CVEMAP_COLUMNS = (
+    'hash', 'name', 'version', 'vendor', 'cves', 'db_version', 'format')
+
+#: One cvemap row, with the same attributes as victims.db.CVEMap
+CVERow = collections.namedtuple('CVERow', CVEMAP_COLUMNS)
+
+
+def batches(iterable, size):
+    """
+    Yields lists of at most size items from iterable.
+
+    :Parameters:
+       - `iterable`: items to split up
+       - `size`: most items per list
+    """
+    iterable = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterable, size))
+        if not batch:
+            break
+        yield batch
+
+
+def split_cves(cves):
+    """
+    Returns the CVE ids of a comma separated cves value, each once.
+
+    :Parameters:
+       - `cves`: comma separated CVE ids, may be None
+    """
+    return list(unique(x.strip() for x in (cves or '').split(',')
+                       if x.strip()))
+
+
+def unique(iterable):
+    """
+    Yields the items of iterable skipping any seen before.
+
+    :Parameters:
+       - `iterable`: items which may repeat
+    """
+    seen = set()
+    for item in iterable:
+        if item not in seen:
+            seen.add(item)
+            yield item
+
+
+def sqlite_path(url):
+    """
+    Returns the file path of a sqlite database url, or None if the url is
+    for another database or an in-memory one.
+
+    :Parameters:
+       - `url`: database url from the config
+    """
+    prefix = 'sqlite:///'
+    if not url.startswith(prefix) or len(url) == len(prefix):
+        return None
+    path = url[len(prefix):]
+    if path.startswith(':memory:') or '?' in path:
+        return None
+    return path
+
+
+def database_key(url):
+    """
+    Returns a hex digest naming the database at url. Every url of one
+    sqlite file gives the same digest.
+
+    :Parameters:
+       - `url`: database url from the config
+    """
+    path = sqlite_path(url)
+    if path is not None:
+        url = 'sqlite:///' + os.path.realpath(path)
+    return hashlib.sha1(url).hexdigest()
+
+
+def database_errors():
+    """
+    Returns the tuple of operational errors the database layers in use can
+    raise, without importing SQLAlchemy just to catch its errors.
+    """
+    import sqlite3
+    errors = [sqlite3.OperationalError]
+    exc = sys.modules.get('sqlalchemy.exc')
+    if exc is not None:
+        errors.append(exc.OperationalError)
+    return tuple(errors)
+
+
+class LiteConnection(object):
+    """
+    Read only connection to a sqlite victims database.
+    """
+
+    def __init__(self, path):
+        """
+        Opens the database.
+
+        :Parameters:
+           - `path`: path to the sqlite database
+        """
+        import sqlite3
+        self.__conn = sqlite3.connect(path)
+
+    def schema_version(self):
+        """
+        Returns the version of the database layout, 0 when unknown.
+        """
+        import sqlite3
+        try:
+            row = self.__conn.execute(
+                'SELECT version FROM ' + SCHEMA_TABLE).fetchone()
+        except sqlite3.DatabaseError:
+            return 0
+        return row and row[0] or 0
+
+    def lookup(self, hashes, formats=None, batch_size=MAX_LOOKUP_PARAMETERS):
+        """
+        Yields the CVERow rows matching hashes, batching the hashes like
+        victims.db.Connection.lookup.
+
+        :Parameters:
+           - `hashes`: iterable of hashes to look for
+           - `formats`: optional list of formats the rows must have
+           - `batch_size`: most parameters bound into a single query
+        """
+        if formats is not None:
+            formats = list(formats)
+            if not formats:
+                return
+        per_query = max(batch_size - len(formats or []), 1)
+        for batch in batches(hashes, per_query):
+            sql = 'SELECT %s FROM cvemap WHERE hash IN (%s)' % (
+                ', '.join(CVEMAP_COLUMNS), ', '.join('?' * len(batch)))
+            if formats is not None:
+                sql += ' AND format IN (%s)' % ', '.join('?' * len(formats))
+                batch += formats
+            with METRICS.phase('db_lookup'):
+                rows = self.__conn.execute(sql, batch).fetchall()
+            METRICS.count('db_queries')
+            METRICS.count('db_rows', len(rows))
+            for row in rows:
+                yield CVERow(*row)
+
+    def find(self, name, version):
+        """
+        Returns the CVERow rows for a package name and version.
+
+        :Parameters:
+           - `name`: name of the package
+           - `version`: version of the package
+        """
+        return [CVERow(*x) for x in self.__conn.execute(
+            'SELECT %s FROM cvemap WHERE name = ? AND version = ?' % (
+                ', '.join(CVEMAP_COLUMNS)), (name, version))]
+
+    def find_many(self, pairs, batch_size=MAX_LOOKUP_PARAMETERS):
+        """
+        Yields the CVERow rows for many (name, version) pairs using one
+        query per batch of pairs. Repeated pairs are only looked up once.
+
+        :Parameters:
+           - `pairs`: iterable of (name, version)
+           - `batch_size`: most parameters bound into a single query
+        """
+        for batch in batches(unique(pairs), max(batch_size // 2, 1)):
+            wanted = set(batch)
+            names = list(set(x[0] for x in batch))
+            versions = list(set(x[1] for x in batch))
+            sql = ('SELECT %s FROM cvemap WHERE name IN (%s) '
+                   'AND version IN (%s)') % (
+                       ', '.join(CVEMAP_COLUMNS), ', '.join('?' * len(names)),
+                       ', '.join('?' * len(versions)))
+            for row in self.__conn.execute(sql, names + versions):
+                # Names and versions are matched separately by the query
+                if (row[1], row[2]) in wanted:
+                    yield CVERow(*row)
+
+    def affected(self, cves, batch_size=MAX_LOOKUP_PARAMETERS):
+        """
+        Yields (cve, CVERow) for every hash affected by one of cves, found
+        through the index on hashcve.cve.
+
+        :Parameters:
+           - `cves`: iterable of CVE ids
+           - `batch_size`: most parameters bound into a single query
+        """
+        for batch in batches(unique(cves), batch_size):
+            sql = ('SELECT hashcve.cve, %s FROM hashcve JOIN cvemap '
+                   'ON cvemap.hash = hashcve.hash WHERE hashcve.cve IN (%s) '
+                   'ORDER BY hashcve.cve') % (
+                       ', '.join('cvemap.' + x for x in CVEMAP_COLUMNS),
+                       ', '.join('?' * len(batch)))
+            for row in self.__conn.execute(sql, batch):
+                yield (row[0], CVERow(*row[1:]))
+
+    def db_state(self):
+        """
+        Returns (max db_version, row count) of the cvemap, which change
+        whenever rows are added, updated or removed.
+        """
+        version, count = self.__conn.execute(
+            'SELECT MAX(db_version), COUNT(*) FROM cvemap').fetchone()
+        return (version or 0, count)
+
+    def since(self, db_version):
+        """
+        Yields the CVERow rows written by updates after db_version, found
+        through the index on cvemap.db_version.
+
+        :Parameters:
+           - `db_version`: db_version of the last update already seen
+        """
+        METRICS.count('db_queries')
+        for row in self.__conn.execute(
+                'SELECT %s FROM cvemap WHERE db_version > ?' % (
+                    ', '.join(CVEMAP_COLUMNS)), (db_version,)):
+            yield CVERow(*row)
+
+    def query_plan(self, sql, parameters=()):
+        """
+        Returns the detail lines of sqlite's plan for a query.
+
+        :Parameters:
+           - `sql`: the query
+           - `parameters`: values bound into the query
+        """
+        return [x[-1] for x in self.__conn.execute(
+            'EXPLAIN QUERY PLAN ' + sql, parameters)]
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        self.__conn.close()
+
+
+def open_reader(conf):
+    """
+    Returns a LiteConnection when the configured database is a sqlite file
+    with the current layout, else a full victims.db.Connection.
+
+    :Parameters:
+       - `conf`: the configuration object
+    """
+    path = sqlite_path(conf['database']['url'])
+    if path is not None and os.path.isfile(path):
+        reader = LiteConnection(path)
+        if reader.schema_version() == SCHEMA_VERSION:
+            return reader
+        reader.close()
+    from victims.db import Connection
+    return Connection(conf)
@@ -0,0 +1,325 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+State kept between incremental scans. The manifest of a scan records the
+fingerprint and digest of each package on disk, what was found inside of
+it and the cvemap rows matching any of them, so the next scan only reads
+what changed.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import json
+import os
+import time
+import warnings
+
+from victims import RACY_WINDOW
+from victims.lite import CVEMAP_COLUMNS, CVERow
+
+#: Version of the layout of saved manifests
+MANIFEST_VERSION = 1
+
+
+def _utf8(value):
+    """
+    Returns JSON strings as the byte strings paths and names are made of.
+
+    :Parameters:
+       - `value`: string or list of strings as loaded from JSON
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [_utf8(x) for x in value]
+    return value
+
+
+def _storable(value):
+    """
+    Returns True if every string in value can be saved as JSON.
+
+    :Parameters:
+       - `value`: string or nested lists of strings
+    """
+    if isinstance(value, str):
+        try:
+            value.decode('utf-8')
+        except UnicodeDecodeError:
+            return False
+    elif isinstance(value, (list, tuple)):
+        return all(_storable(x) for x in value)
+    return True
+
+
+def _checked(state):
+    """
+    Returns (files, findings, db_state) of a loaded state file, raising
+    AttributeError, KeyError, TypeError or ValueError when they are not
+    laid out as save writes them.
+
+    :Parameters:
+       - `state`: dict loaded from a state file
+    """
+    files = {}
+    for path, entry in state['files'].items():
+        fprint, hash, inside, skipped = entry
+        if (len(fprint) != 4 or
+                any(len(x) != 3 for x in inside) or
+                any(len(x) != 2 for x in skipped)):
+            raise ValueError('bad entry for %s' % path)
+        files[_utf8(path)] = _utf8([fprint, hash, inside, skipped])
+    findings = state['findings']
+    for rows in findings.values():
+        if any(len(x) != len(CVEMAP_COLUMNS) for x in rows):
+            raise ValueError('bad findings')
+    db_state = state['db_state']
+    if db_state is not None:
+        db_state = tuple(db_state)
+        if len(db_state) != 2:
+            raise ValueError('bad db_state')
+    return (files, findings, db_state)
+
+
+class Manifest(object):
+    """
+    What an earlier scan found, loaded from a state file, and what the
+    current scan finds, saved back to it. Only the packages seen by the
+    current scan are saved, so removed files drop out. Packages which
+    changed are started by the finder with seen and completed by the
+    scanner with hashed as their digests come back, which may be from a
+    pool of worker processes.
+    """
+
+    __slots__ = [
+        '__path', '__options', '__files', '__findings', '__hashes',
+        '__previous_db_state', '__db_state', '__new_files', '__new_findings',
+        '__pending']
+
+    def __init__(self, path, options=None):
+        """
+        Loads the state file at path. The earlier scan is ignored when the
+        file is missing or was made with other options, and with a warning
+        when it is unreadable or malformed.
+
+        :Parameters:
+           - `path`: path of the state file
+           - `options`: dict of scan options which change what is found,
+             such as look_inside and depth
+        """
+        self.__path = path
+        self.__options = options or {}
+        self.__files = {}
+        self.__findings = {}
+        self.__hashes = None
+        self.__previous_db_state = None
+        self.__db_state = None
+        self.__new_files = {}
+        self.__new_findings = {}
+        self.__pending = {}
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as state_file:
+                state = json.load(state_file)
+        except (IOError, ValueError), ex:
+            warnings.warn(
+                'Ignoring the unreadable manifest %s: %s' % (path, ex),
+                RuntimeWarning)
+            return
+        if (isinstance(state, dict) and (
+                state.get('version') != MANIFEST_VERSION or
+                state.get('options') != self.__options)):
+            return
+        try:
+            files, findings, db_state = _checked(state)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            warnings.warn(
+                'Ignoring the malformed manifest %s' % path, RuntimeWarning)
+            return
+        self.__files = files
+        self.__findings = findings
+        self.__previous_db_state = db_state
+
+    def known(self, path, fprint):
+        """
+        Returns (hash, inside, skipped) for a package on disk which has not
+        changed since the earlier scan, otherwise None. inside is a list of
+        (name, parent below path, hash) of the packages inside of it and
+        skipped a list of (name below path, reason).
+
+        :Parameters:
+           - `path`: path of the package
+           - `fprint`: its fingerprint from victims.fingerprint
+        """
+        entry = self.__files.get(path)
+        if entry is None or tuple(entry[0]) != tuple(fprint):
+            return None
+        return (entry[1], entry[2], entry[3])
+
+    def remember(self, path, fprint, hash, inside, skipped):
+        """
+        Records a package on disk which has not changed since the earlier
+        scan along with what known returned for it. Packages modified too
+        recently to trust their fingerprint are left out so they are read
+        again next time.
+
+        :Parameters:
+           - `path`: path of the package
+           - `fprint`: its fingerprint from victims.fingerprint
+           - `hash`: its digest
+           - `inside`: list of (name, parent below path, hash) of the
+             packages inside of it
+           - `skipped`: list of (name below path, reason) of packages
+             inside of it which were not looked into
+        """
+        if fprint[3] > time.time() - RACY_WINDOW:
+            return
+        entry = [list(fprint), hash, [list(x) for x in inside],
+                 [list(x) for x in skipped]]
+        if _storable(path) and _storable(entry):
+            self.__new_files[path] = entry
+
+    def seen(self, path, fprint):
+        """
+        Starts recording a package on disk which is new or changed since
+        the earlier scan. Packages modified too recently to trust their
+        fingerprint are left out so they are read again next time.
+
+        :Parameters:
+           - `path`: path of the package
+           - `fprint`: its fingerprint from victims.fingerprint
+        """
+        if fprint[3] > time.time() - RACY_WINDOW or not _storable(path):
+            return
+        self.__pending[path] = [list(fprint), None, [], []]
+
+    def hashed(self, package, hash):
+        """
+        Records the digest of a package the current scan yielded when it
+        is, or is inside of, a package on disk started with seen.
+
+        :Parameters:
+           - `package`: victims.Package
+           - `hash`: its digest
+        """
+        if not package.internal:
+            entry = self.__pending.get(package.path)
+            if entry is not None:
+                entry[1] = hash
+            return
+        path, below = self.__on_disk(package.parent)
+        if path is not None:
+            self.__pending[path][2].append([package.name, below, hash])
+
+    def skipped(self, path, skipped):
+        """
+        Records what was not looked inside of in a package on disk started
+        with seen.
+
+        :Parameters:
+           - `path`: path of the package
+           - `skipped`: list of (name below path, reason)
+        """
+        entry = self.__pending.get(path)
+        if entry is not None:
+            entry[3] = [list(x) for x in skipped]
+
+    def __on_disk(self, parent):
+        """
+        Returns (path, name below path) of the package on disk started
+        with seen which holds parent, or (None, None).
+
+        :Parameters:
+           - `parent`: parent of a package inside of another
+        """
+        if parent in self.__pending:
+            return (parent, '')
+        end = parent.find('!/')
+        while end != -1:
+            if parent[:end] in self.__pending:
+                return (parent[:end], parent[end:])
+            end = parent.find('!/', end + 1)
+        return (None, None)
+
+    def checked(self, hash):
+        """
+        Returns True if the earlier scan looked hash up.
+
+        :Parameters:
+           - `hash`: digest of a package
+        """
+        if self.__hashes is None:
+            hashes = set()
+            for entry in self.__files.itervalues():
+                hashes.add(entry[1])
+                hashes.update(x[2] for x in entry[2])
+            self.__hashes = hashes
+        return hash in self.__hashes
+
+    def rows(self, hash):
+        """
+        Returns the cvemap rows which matched hash in the earlier scan as
+        victims.lite.CVERow.
+
+        :Parameters:
+           - `hash`: digest of a package
+        """
+        return [CVERow(*x) for x in self.__findings.get(hash, ())]
+
+    def found(self, row):
+        """
+        Records a cvemap row matched by the current scan.
+
+        :Parameters:
+           - `row`: victims.db.CVEMap or victims.lite.CVERow
+        """
+        values = [getattr(row, x) for x in CVEMAP_COLUMNS]
+        rows = self.__new_findings.setdefault(row.hash, [])
+        if values not in rows:
+            rows.append(values)
+
+    def start(self, db_state):
+        """
+        Sets the state of the database the current scan looks up in.
+
+        :Parameters:
+           - `db_state`: (max db_version, row count) of the cvemap
+        """
+        self.__db_state = tuple(db_state)
+
+    def save(self):
+        """
+        Writes what the current scan found to the state file, replacing it
+        in one step so an interrupted save keeps the earlier state.
+        """
+        for path, entry in self.__pending.items():
+            # Packages whose hashing did not finish are read next time
+            if entry[1] is not None and _storable(entry):
+                self.__new_files[path] = entry
+        self.__pending.clear()
+        temp = '%s.%d.tmp' % (self.__path, os.getpid())
+        out = open(temp, 'w')
+        try:
+            json.dump({
+                'version': MANIFEST_VERSION,
+                'options': self.__options,
+                'db_state': self.__db_state,
+                'files': self.__new_files,
+                'findings': self.__new_findings,
+            }, out, separators=(',', ':'))
+        finally:
+            out.close()
+        os.rename(temp, self.__path)
+
+    # Read-only properties
+    path = property(lambda s: s.__path)
+    previous_db_state = property(lambda s: s.__previous_db_state)
+    db_state = property(lambda s: s.__db_state)
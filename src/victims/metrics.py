@@ -0,0 +1,313 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Counters and per phase timings of scans. Everything scanning records into
+METRICS, which the scan script prints with --stats and the daemon hands
+out with its stats command.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import time
+
+#: Counters shown first by Metrics.report, in this order
+COUNTERS = (
+    'packages_scanned', 'files_unchanged', 'files_sniffed',
+    'archives_opened',
+    'members_visited', 'nested_archives', 'pool_tasks', 'files_hashed',
+    'bytes_hashed',
+    'cache_hits', 'cache_misses', 'db_queries', 'db_rows')
+
+#: Phases shown first by Metrics.report, in this order
+PHASES = (
+    'walk', 'archive_open', 'archive_read', 'hash', 'cache_lookup',
+    'db_lookup', 'cache_flush')
+
+
+class Phase(object):
+    """
+    Context manager adding the wall and CPU time of its block to a phase.
+    """
+
+    __slots__ = ['__metrics', '__name', '__wall', '__cpu', '__excluded']
+
+    def __init__(self, metrics, name):
+        """
+        Creates the timer.
+
+        :Parameters:
+           - `metrics`: the Metrics to add the time to
+           - `name`: name of the phase
+        """
+        self.__metrics = metrics
+        self.__name = name
+        self.__excluded = [0.0, 0.0]
+
+    def __enter__(self):
+        """
+        Starts timing.
+        """
+        self.__wall = time.time()
+        self.__cpu = time.clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        """
+        Stops timing and records the time, even when the block raised.
+        """
+        self.__metrics.add_time(
+            self.__name, time.time() - self.__wall - self.__excluded[0],
+            time.clock() - self.__cpu - self.__excluded[1])
+        return False
+
+    def exclude(self, timed):
+        """
+        Leaves the time already booked to another phase by a Timed iterable
+        used in the block out of this phase.
+
+        :Parameters:
+           - `timed`: the Timed iterable
+        """
+        self.__excluded[0] += timed.wall
+        self.__excluded[1] += timed.cpu
+
+
+class Timed(object):
+    """
+    Iterator adding the time an iterable spends producing its items to a
+    phase, as one call once it is exhausted or closed. Time the caller
+    spends on the items is not part of it.
+    """
+
+    __slots__ = ['__metrics', '__name', '__iterator', '__wall', '__cpu',
+                 '__closed']
+
+    def __init__(self, metrics, name, iterable):
+        """
+        Creates the iterator.
+
+        :Parameters:
+           - `metrics`: the Metrics to add the time to
+           - `name`: name of the phase
+           - `iterable`: what to iterate over
+        """
+        self.__metrics = metrics
+        self.__name = name
+        self.__iterator = iter(iterable)
+        self.__wall = 0.0
+        self.__cpu = 0.0
+        self.__closed = False
+
+    def __iter__(self):
+        """
+        Returns the iterator itself.
+        """
+        return self
+
+    def next(self):
+        """
+        Returns the next item of the iterable, timing how long it took.
+        """
+        wall = time.time()
+        cpu = time.clock()
+        done = False
+        try:
+            return self.__iterator.next()
+        except StopIteration:
+            done = True
+            raise
+        finally:
+            self.__wall += time.time() - wall
+            self.__cpu += time.clock() - cpu
+            if done:
+                self.close()
+
+    def close(self):
+        """
+        Closes the iterable when it can be and records the time spent so
+        far, once.
+        """
+        if not self.__closed:
+            self.__closed = True
+            close = getattr(self.__iterator, 'close', None)
+            if close is not None:
+                close()
+            self.__metrics.add_time(self.__name, self.__wall, self.__cpu)
+
+    # Read-only properties
+    wall = property(lambda s: s.__wall)
+    cpu = property(lambda s: s.__cpu)
+
+
+class Metrics(object):
+    """
+    Named counters and phase timings. Phases are timed independently and
+    may nest, so their times do not add up to the time of a scan.
+    """
+
+    __slots__ = ['__counters', '__phases']
+
+    def __init__(self):
+        """
+        Creates empty metrics.
+        """
+        self.__counters = {}
+        self.__phases = {}
+
+    def count(self, name, amount=1):
+        """
+        Adds to a counter.
+
+        :Parameters:
+           - `name`: name of the counter
+           - `amount`: how much to add
+        """
+        self.__counters[name] = self.__counters.get(name, 0) + amount
+
+    def add_time(self, name, wall, cpu=0.0, calls=1):
+        """
+        Adds time spent to a phase.
+
+        :Parameters:
+           - `name`: name of the phase
+           - `wall`: seconds of wall clock time
+           - `cpu`: seconds of CPU time of this process
+           - `calls`: how many times the phase ran
+        """
+        phase = self.__phases.get(name)
+        if phase is None:
+            phase = self.__phases[name] = [0, 0.0, 0.0]
+        phase[0] += calls
+        phase[1] += wall
+        phase[2] += cpu
+
+    def phase(self, name):
+        """
+        Returns a context manager timing its block as part of a phase.
+
+        :Parameters:
+           - `name`: name of the phase
+        """
+        return Phase(self, name)
+
+    def timed(self, name, iterable):
+        """
+        Returns an iterator over iterable timing how long producing its
+        items takes as part of a phase.
+
+        :Parameters:
+           - `name`: name of the phase
+           - `iterable`: what to iterate over
+        """
+        return Timed(self, name, iterable)
+
+    def snapshot(self):
+        """
+        Returns a copy of the metrics as a dict of plain types, ready to be
+        sent as JSON: {'counters': {name: n}, 'phases': {name: {'calls',
+        'wall', 'cpu'}}}.
+        """
+        return {
+            'counters': dict(self.__counters),
+            'phases': dict(
+                (name, {'calls': x[0], 'wall': x[1], 'cpu': x[2]})
+                for name, x in self.__phases.items())}
+
+    def merge(self, snapshot):
+        """
+        Adds a snapshot, such as one made in a worker process, to these
+        metrics.
+
+        :Parameters:
+           - `snapshot`: dict returned by snapshot
+        """
+        for name, amount in snapshot['counters'].items():
+            self.count(name, amount)
+        for name, phase in snapshot['phases'].items():
+            self.add_time(name, phase['wall'], phase['cpu'], phase['calls'])
+
+    def since(self, snapshot):
+        """
+        Returns a snapshot of what was recorded after an earlier snapshot,
+        such as the metrics of one scan in a long running process.
+
+        :Parameters:
+           - `snapshot`: dict returned by snapshot earlier
+        """
+        now = self.snapshot()
+        counters = now['counters']
+        for name, amount in snapshot['counters'].items():
+            counters[name] = counters.get(name, 0) - amount
+        phases = now['phases']
+        for name, before in snapshot['phases'].items():
+            phase = phases.get(name)
+            if phase is not None:
+                for key in ('calls', 'wall', 'cpu'):
+                    phase[key] -= before[key]
+        now['counters'] = dict(
+            (x, y) for x, y in counters.items() if y)
+        now['phases'] = dict(
+            (x, y) for x, y in phases.items() if y['calls'])
+        return now
+
+    def reset(self):
+        """
+        Sets every counter and phase back to nothing.
+        """
+        self.__counters.clear()
+        self.__phases.clear()
+
+    def report(self):
+        """
+        Returns the metrics as lines of text for people to read.
+        """
+        return report(self.snapshot())
+
+    # Read-only properties
+    counters = property(lambda s: dict(s.__counters))
+
+
+def report(snapshot):
+    """
+    Returns a snapshot as lines of text for people to read.
+
+    :Parameters:
+       - `snapshot`: dict returned by Metrics.snapshot
+    """
+    counters = snapshot['counters']
+    phases = snapshot['phases']
+    lines = []
+    for name in _ordered(counters, COUNTERS):
+        lines.append('%-18s %d' % (name, counters[name]))
+    if phases:
+        lines.append('%-18s %8s %10s %10s' % (
+            'phase', 'calls', 'wall (s)', 'cpu (s)'))
+    for name in _ordered(phases, PHASES):
+        phase = phases[name]
+        lines.append('%-18s %8d %10.3f %10.3f' % (
+            name, phase['calls'], phase['wall'], phase['cpu']))
+    return lines
+
+
+def _ordered(names, known):
+    """
+    Returns names with the known ones first in their order and the rest
+    sorted after them.
+
+    :Parameters:
+       - `names`: names to order
+       - `known`: names in the order they should come first
+    """
+    return [x for x in known if x in names] + sorted(
+        x for x in names if x not in known)
+
+
+#: Metrics every scan in this process records into
+METRICS = Metrics()
@@ -0,0 +1,302 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Hashing packages with a pool of worker processes.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import functools
+import hashlib
+import multiprocessing
+import os
+import Queue
+import traceback
+
+from victims import HashGenerator, DEFAULT_CHUNK_SIZE, checked_chunk_size
+from victims.archivers import Archive
+from victims.archivers.cpio import StreamMember
+from victims.metrics import METRICS
+
+#: Packages handed to the pool ahead of the caller per worker process
+IN_FLIGHT_PER_JOB = 4
+
+#: Most zip members hashed by one task, larger zips are split
+MEMBERS_PER_TASK = 64
+
+
+def _hasher(algorithm, chunk_size):
+    """
+    Returns a HashGenerator for the algorithm name.
+
+    :Parameters:
+       - `algorithm`: hashlib algorithm name
+       - `chunk_size`: number of bytes to read at a time
+    """
+    return HashGenerator(functools.partial(hashlib.new, algorithm), chunk_size)
+
+
+def _hash_file(task):
+    """
+    Worker: hashes a file on disk. Returns a list with a single
+    (index, hash, stat) tuple where stat is the fingerprint after hashing.
+
+    :Parameters:
+       - `task`: tuple of (algorithm, chunk_size, index, path)
+    """
+    algorithm, chunk_size, index, path = task
+    hash = _hasher(algorithm, chunk_size)(path)
+    st = os.stat(path)
+    return [(index, hash, (st.st_dev, st.st_ino, st.st_size, st.st_mtime))]
+
+
+def _hash_members(task):
+    """
+    Worker: opens an archive once and hashes the requested members. Returns
+    a list of (index, hash, None) tuples.
+
+    :Parameters:
+       - `task`: tuple of (algorithm, chunk_size, path, [(index, name)])
+    """
+    algorithm, chunk_size, path, members = task
+    hasher = _hasher(algorithm, chunk_size)
+    wanted = {}
+    for index, name in members:
+        wanted.setdefault(name, []).append(index)
+    results = []
+    # One pass over the archive covers every member of the task
+    for name, hash in Archive(path).hash_members(
+            hasher, lambda x: x in wanted):
+        results += [(index, hash, None) for index in wanted.pop(name)]
+    if wanted:
+        raise Exception('%s not found in %s' % (', '.join(wanted), path))
+    return results
+
+
+def _dispatch(task):
+    """
+    Worker: calls the worker function named in the task. Returns a tuple of
+    (results, None, metrics) or ([], traceback, metrics) as errors can not
+    reach the parent through apply_async callbacks. metrics is a snapshot
+    of what the task recorded for the parent to add to its own.
+
+    :Parameters:
+       - `task`: tuple of (function name, function task)
+    """
+    METRICS.reset()
+    try:
+        return (_WORKERS[task[0]](task[1]), None, METRICS.snapshot())
+    except Exception:
+        return ([], traceback.format_exc(), METRICS.snapshot())
+
+
+_WORKERS = {
+    'file': _hash_file,
+    'members': _hash_members,
+}
+
+
+def _check_workers(pool, workers):
+    """
+    Raises an Exception when a worker process of the pool died, such as
+    one killed by the OOM killer. The pool starts a new worker in its place
+    but the task the dead one held never finishes. workers keeps every
+    worker seen so replaced ones are watched too.
+
+    :Parameters:
+       - `pool`: the multiprocessing.Pool
+       - `workers`: set of worker processes seen so far
+    """
+    workers.update(pool._pool)
+    for worker in workers:
+        if worker.exitcode is not None:
+            raise Exception(
+                'A hashing worker process died with exit code %s' % (
+                    worker.exitcode))
+
+
+class ParallelHasher(object):
+    """
+    Hashes packages in worker processes. Top level files are hashed one per
+    task while members of a zip are hashed by the worker which opens that
+    zip, as open archive members can not be sent between processes. Members
+    of tarballs and rpms are hashed here as the stream goes by, a worker
+    would have to decompress the whole archive again to reach them.
+    """
+
+    __slots__ = ['__jobs', '__algorithm', '__chunk_size', '__cache']
+
+    def __init__(
+            self, jobs, algorithm='sha512', chunk_size=DEFAULT_CHUNK_SIZE,
+            cache=None):
+        """
+        Creates the hasher.
+
+        :Parameters:
+           - `jobs`: number of worker processes
+           - `algorithm`: hashlib algorithm name
+           - `chunk_size`: number of bytes to read at a time
+           - `cache`: optional victims.cache.HashCache for top level files
+        """
+        hashlib.new(algorithm)
+        self.__jobs = int(jobs)
+        self.__algorithm = algorithm
+        self.__chunk_size = checked_chunk_size(chunk_size)
+        self.__cache = cache
+
+    def __call__(self, packages):
+        """
+        Yields (package, hash) tuples in the order packages come in while
+        workers hash ahead. Only a bounded number of packages are in flight
+        so any iterable of packages, such as PackageFinder.iter, can be
+        streamed through.
+
+        :Parameters:
+           - `packages`: iterable of victims.Package instances
+        """
+        stream_hasher = _hasher(self.__algorithm, self.__chunk_size)
+        pool = multiprocessing.Pool(self.__jobs)
+        workers = set(pool._pool)
+        results = Queue.Queue()
+        limit = self.__jobs * IN_FLIGHT_PER_JOB
+        # index -> package for everything handed out and not yet yielded
+        waiting = {}
+        # index -> hash for finished packages waiting on earlier ones
+        done = {}
+        fingerprints = {}
+        members = []
+        in_flight = 0
+        next_index = 0
+        try:
+            for index, package in enumerate(packages):
+                waiting[index] = package
+                if members and (
+                        not package.internal or
+                        package.digests is not None or
+                        package.parent != members[0][1] or
+                        len(members) >= MEMBERS_PER_TASK):
+                    self.__submit_members(pool, members, results)
+                    in_flight += len(members)
+                    members = []
+                if package.digests is not None:
+                    # Already hashed while looking inside of its parent
+                    done[index] = package.digests[self.__algorithm]
+                elif isinstance(package.path, StreamMember):
+                    # Read in the single pass over its archive
+                    done[index] = stream_hasher(package.path)
+                elif package.internal:
+                    members.append((index, package.parent, package.name))
+                    # The worker opens its own copy of the member
+                    package.path.close()
+                elif self.__cache is not None:
+                    fprint, hash = self.__cache.lookup(package.path)
+                    if hash is None:
+                        fingerprints[index] = fprint
+                        self.__submit_file(pool, index, package, results)
+                        in_flight += 1
+                    else:
+                        done[index] = hash
+                else:
+                    self.__submit_file(pool, index, package, results)
+                    in_flight += 1
+
+                # Wait on the workers when too much is outstanding
+                while in_flight and (
+                        in_flight >= limit or len(waiting) >= limit * 4):
+                    in_flight -= self.__collect(
+                        results, done, fingerprints, True, pool, workers)
+                in_flight -= self.__collect(
+                    results, done, fingerprints, False, pool, workers)
+                while next_index in done:
+                    yield (waiting.pop(next_index), done.pop(next_index))
+                    next_index += 1
+
+            if members:
+                self.__submit_members(pool, members, results)
+            while waiting:
+                if next_index not in done:
+                    self.__collect(
+                        results, done, fingerprints, True, pool, workers)
+                while next_index in done:
+                    yield (waiting.pop(next_index), done.pop(next_index))
+                    next_index += 1
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def __submit_file(self, pool, index, package, results):
+        """
+        Queues hashing of a top level file.
+
+        :Parameters:
+           - `pool`: the worker pool
+           - `index`: index of the package
+           - `package`: the package to hash
+           - `results`: queue the results are put on
+        """
+        METRICS.count('pool_tasks')
+        pool.apply_async(_dispatch, (('file', (
+            self.__algorithm, self.__chunk_size, index, package.path)),),
+            callback=results.put)
+
+    def __submit_members(self, pool, members, results):
+        """
+        Queues hashing of members of one archive.
+
+        :Parameters:
+           - `pool`: the worker pool
+           - `members`: list of (index, archive path, member name)
+           - `results`: queue the results are put on
+        """
+        METRICS.count('pool_tasks')
+        pool.apply_async(_dispatch, (('members', (
+            self.__algorithm, self.__chunk_size, members[0][1],
+            [(index, name) for index, parent, name in members])),),
+            callback=results.put)
+
+    def __collect(self, results, done, fingerprints, block, pool, workers):
+        """
+        Moves finished results into done and returns how many packages
+        finished, waiting for at least one result when block is True.
+
+        :Parameters:
+           - `results`: queue the results are put on
+           - `done`: index -> hash of finished packages
+           - `fingerprints`: index -> fingerprint for cache misses
+           - `block`: if we should wait for a result
+           - `pool`: the worker pool, checked while waiting
+           - `workers`: worker processes seen so far
+        """
+        count = 0
+        while True:
+            try:
+                # A timeout keeps the wait interruptible with ctrl-c
+                finished, error, metrics = results.get(block, 1)
+            except Queue.Empty:
+                if block:
+                    # Results of a dead worker would never come
+                    _check_workers(pool, workers)
+                    continue
+                return count
+            METRICS.merge(metrics)
+            if error:
+                raise Exception('Hashing failed in a worker:\n' + error)
+            for index, hash, after in finished:
+                if index in fingerprints:
+                    self.__cache.store(fingerprints.pop(index), after, hash)
+                done[index] = hash
+            count += len(finished)
+            block = False
+
+    # Read-only properties
+    jobs = property(lambda s: s.__jobs)
@@ -0,0 +1,379 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Writers for scan findings. Each finding is written as soon as it is found
+so large scans never build their whole report in memory.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import collections
+import json
+import os
+import urllib
+
+from victims import __version__
+from victims.lite import split_cves
+
+#: Schema of SARIF reports
+SARIF_SCHEMA = (
+    'https://schemastore.azurewebsites.net/schemas/json/'
+    'sarif-2.1.0-rtm.5.json')
+
+#: Where users can read about victims
+INFORMATION_URI = 'https://github.com/victims/victims-client/'
+
+
+def finding(package, result):
+    """
+    Returns the record of a package matching a cvemap row.
+
+    :Parameters:
+       - `package`: the matching victims.Package
+       - `result`: the matching cvemap row
+    """
+    if package.internal:
+        # Packages inside of packages have no path of their own
+        path = package.name
+    else:
+        path = package.path
+    return {
+        'package': unicode(package),
+        'name': package.name,
+        'path': path,
+        'parent': package.parent,
+        'hash': result.hash,
+        'format': result.format,
+        'cves': split_cves(result.cves),
+        'project': result.name,
+        'version': result.version,
+        'vendor': result.vendor,
+    }
+
+
+def group_copies(records):
+    """
+    Returns records with the copies of each package folded into the
+    record of the first one found, in order of the first copies. The
+    other copies are listed by their package in its copies.
+
+    :Parameters:
+       - `records`: iterable of dicts made by finding()
+    """
+    groups = collections.OrderedDict()
+    for record in records:
+        first = groups.get(record['hash'])
+        if first is None:
+            record = dict(record, copies=[])
+            groups[record['hash']] = record
+        else:
+            first['copies'].append(record['package'])
+    return groups.values()
+
+
+def _file_uri(path):
+    """
+    Returns a file URI for absolute paths and a relative reference for the
+    rest.
+
+    :Parameters:
+       - `path`: path of a file
+    """
+    if isinstance(path, unicode):
+        path = path.encode('utf-8')
+    uri = urllib.pathname2url(path)
+    if os.path.isabs(path):
+        return 'file://' + uri
+    return uri
+
+
+class Reporter(object):
+    """
+    Base of the report writers. write is called with the record of each
+    finding and finish once the scan is over.
+    """
+
+    def __init__(self, out, conf=None):
+        """
+        Creates the reporter.
+
+        :Parameters:
+           - `out`: file like object to write the report to
+           - `conf`: optional configuration object
+        """
+        self.out = out
+        self.conf = conf
+        self.count = 0
+
+    def write(self, record):
+        """
+        Writes one finding.
+
+        :Parameters:
+           - `record`: dict made by finding()
+        """
+        self.count += 1
+
+    def finish(self, scanned, skipped):
+        """
+        Ends the report.
+
+        :Parameters:
+           - `scanned`: number of packages looked at
+           - `skipped`: list of (name, reason) for packages not looked into
+        """
+        self.out.flush()
+
+
+class TextReporter(Reporter):
+    """
+    The human readable report, with a link per configured CVE url.
+    """
+
+    def __init__(self, out, conf=None):
+        """
+        Creates the reporter.
+
+        :Parameters:
+           - `out`: file like object to write the report to
+           - `conf`: optional configuration object holding cveurls
+        """
+        Reporter.__init__(self, out, conf)
+        self.__cveurls = []
+        if conf is not None and 'cveurls' in conf:
+            self.__cveurls = conf['cveurls'].items()
+        self.__links = {}
+
+    def __link_lines(self, cve):
+        """
+        Returns the link lines of a CVE, formatting them only once.
+
+        :Parameters:
+           - `cve`: the CVE id
+        """
+        lines = self.__links.get(cve)
+        if lines is None:
+            lines = self.__links[cve] = ''.join(
+                "- %s: %s\n" % (name, (cveurl % cve))
+                for name, cveurl in self.__cveurls)
+        return lines
+
+    def write(self, record):
+        """
+        Writes one finding.
+
+        :Parameters:
+           - `record`: dict made by finding()
+        """
+        Reporter.write(self, record)
+        self.out.write(record['package'] + ": " +
+                       ','.join(record['cves']) + "\n")
+        for copy in record.get('copies', ()):
+            self.out.write("  copy: %s\n" % copy)
+        for cve in record['cves']:
+            self.out.write(self.__link_lines(cve))
+
+    def finish(self, scanned, skipped):
+        """
+        Ends the report with the number of packages scanned.
+
+        :Parameters:
+           - `scanned`: number of packages looked at
+           - `skipped`: list of (name, reason) for packages not looked into
+        """
+        self.out.write("Scanned " + str(scanned) + " packages\n")
+        Reporter.finish(self, scanned, skipped)
+
+
+class JSONLinesReporter(Reporter):
+    """
+    One JSON object per line for each finding.
+    """
+
+    def write(self, record):
+        """
+        Writes one finding.
+
+        :Parameters:
+           - `record`: dict made by finding()
+        """
+        Reporter.write(self, record)
+        self.out.write(json.dumps(record) + '\n')
+
+
+class JSONReporter(Reporter):
+    """
+    A single JSON document holding the findings and a summary. The findings
+    array is written as it grows.
+    """
+
+    def write(self, record):
+        """
+        Writes one finding.
+
+        :Parameters:
+           - `record`: dict made by finding()
+        """
+        if self.count:
+            self.out.write(',\n')
+        else:
+            self.out.write('{"findings": [\n')
+        Reporter.write(self, record)
+        self.out.write(json.dumps(record))
+
+    def finish(self, scanned, skipped):
+        """
+        Closes the findings array and writes the summary.
+
+        :Parameters:
+           - `scanned`: number of packages looked at
+           - `skipped`: list of (name, reason) for packages not looked into
+        """
+        if not self.count:
+            self.out.write('{"findings": [')
+        self.out.write('\n], "scanned": %s, "skipped": %s}\n' % (
+            json.dumps(scanned), json.dumps(skipped)))
+        Reporter.finish(self, scanned, skipped)
+
+
+class SARIFReporter(Reporter):
+    """
+    SARIF 2.1.0 log with one result per CVE of each finding, for code
+    scanning dashboards.
+    """
+
+    def __init__(self, out, conf=None):
+        """
+        Creates the reporter.
+
+        :Parameters:
+           - `out`: file like object to write the report to
+           - `conf`: optional configuration object
+        """
+        Reporter.__init__(self, out, conf)
+        self.__started = False
+
+    def __header(self):
+        """
+        Writes everything before the first result, once.
+        """
+        if self.__started:
+            return
+        self.__started = True
+        self.out.write(json.dumps({
+            'version': '2.1.0',
+            '$schema': SARIF_SCHEMA,
+        })[:-1] + ', "runs": [{"tool": ' + json.dumps({'driver': {
+            'name': 'victims',
+            'version': __version__,
+            'informationUri': INFORMATION_URI,
+        }}) + ', "results": [\n')
+
+    def write(self, record):
+        """
+        Writes the results of one finding.
+
+        :Parameters:
+           - `record`: dict made by finding()
+        """
+        self.__header()
+        # Packages inside of packages are located by the file on disk
+        path = (record['parent'] or record['path']).split('!/', 1)[0]
+        location = {'physicalLocation': {'artifactLocation': {
+            'uri': _file_uri(path)}}}
+        if record['parent']:
+            location['logicalLocations'] = [{
+                'name': record['name'],
+                'fullyQualifiedName': record['parent'] + '!/' + record['name'],
+                'kind': 'module'}]
+        properties = {
+            'hash': record['hash'],
+            'format': record['format'],
+            'parent': record['parent'],
+            'cves': record['cves'],
+        }
+        if 'copies' in record:
+            properties['copies'] = record['copies']
+        for cve in record['cves']:
+            if self.count:
+                self.out.write(',\n')
+            Reporter.write(self, record)
+            self.out.write(json.dumps({
+                'ruleId': cve,
+                'level': 'error',
+                'message': {'text': '%s is affected by %s' % (
+                    record['package'], cve)},
+                'locations': [location],
+                'partialFingerprints': {'sha512': record['hash']},
+                'properties': properties,
+            }))
+
+    def finish(self, scanned, skipped):
+        """
+        Closes the results and the log.
+
+        :Parameters:
+           - `scanned`: number of packages looked at
+           - `skipped`: list of (name, reason) for packages not looked into
+        """
+        self.__header()
+        self.out.write('\n], "properties": %s}]}\n' % json.dumps({
+            'scanned': scanned, 'skipped': skipped}))
+        Reporter.finish(self, scanned, skipped)
+
+
+class GroupingReporter(Reporter):
+    """
+    Holds the findings until the scan is over and hands them to another
+    reporter with the copies of each package grouped by group_copies.
+    """
+
+    def __init__(self, reporter):
+        """
+        Creates the reporter.
+
+        :Parameters:
+           - `reporter`: the Reporter writing the grouped findings
+        """
+        Reporter.__init__(self, reporter.out, reporter.conf)
+        self.__reporter = reporter
+        self.__records = []
+
+    def write(self, record):
+        """
+        Holds one finding.
+
+        :Parameters:
+           - `record`: dict made by finding()
+        """
+        Reporter.write(self, record)
+        self.__records.append(record)
+
+    def finish(self, scanned, skipped):
+        """
+        Writes the grouped findings and ends the report.
+
+        :Parameters:
+           - `scanned`: number of packages looked at
+           - `skipped`: list of (name, reason) for packages not looked into
+        """
+        for record in group_copies(self.__records):
+            self.__reporter.write(record)
+        self.__records = []
+        self.__reporter.finish(scanned, skipped)
+
+
+#: Reporters by the name given to --format
+REPORTERS = {
+    'text': TextReporter,
+    'jsonl': JSONLinesReporter,
+    'json': JSONReporter,
+    'sarif': SARIFReporter,
+}
@@ -0,0 +1,271 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Scanning of paths against the database, shared by victims-scan and the
+daemon so the connection, hash cache and index can outlive one scan.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import os.path
+
+from victims import (
+    PackageFinder, HashGenerator, Packages, DEFAULT_CHUNK_SIZE,
+    DEFAULT_MAX_MEMBER_SIZE, DEFAULT_MAX_RATIO, DEFAULT_MEMO_SIZE)
+from victims.metrics import METRICS
+from victims.walkers import WALKERS, ThreadedWalker, DEFAULT_THREADS
+from victims.scripts import _get_default_index_loc, _get_conf_int
+
+#: Default number of packages looked up per query
+DEFAULT_BATCH_SIZE = 500
+
+
+class Scanner(object):
+    """
+    Finds, hashes and looks up packages. Everything which is expensive to
+    set up is made once and reused by every scan.
+    """
+
+    def __init__(self, conf, connection=None, cache=True, jobs=None,
+                 index=False):
+        """
+        Creates the scanner.
+
+        :Parameters:
+           - `conf`: the configuration object
+           - `connection`: optional victims.db.Connection, made from conf
+             when not given. A victims.lite.LiteConnection is enough when
+             neither the cache nor the index is used.
+           - `cache`: if package hashes should be kept in the hash cache
+           - `jobs`: number of processes used to hash packages, taken from
+             the config when not given
+           - `index`: if hashes should be checked against a memory mapped
+             index of the database before querying it
+        """
+        self.__conf = conf
+        # The database layer and the pieces built on it are imported
+        # only when used, lookups alone can run without SQLAlchemy
+        if connection is None:
+            from victims.db import Connection
+            connection = Connection(conf)
+        self.__connection = connection
+        self.__chunk_size = _get_conf_int(
+            conf, 'scan', 'chunk_size', DEFAULT_CHUNK_SIZE, minimum=1)
+        self.__batch_size = _get_conf_int(
+            conf, 'scan', 'batch_size', DEFAULT_BATCH_SIZE)
+        self.__hasher = HashGenerator(chunk_size=self.__chunk_size)
+        self.__cache = None
+        if cache:
+            from victims.cache import HashCache, DEFAULT_MAX_ENTRIES
+            self.__hasher = self.__cache = HashCache(
+                connection, self.__hasher, max_entries=_get_conf_int(
+                    conf, 'scan', 'cache_max_entries', DEFAULT_MAX_ENTRIES))
+        if jobs is None:
+            jobs = _get_conf_int(conf, 'scan', 'jobs', 1)
+        self.__parallel = None
+        if jobs > 1:
+            from victims.parallel import ParallelHasher
+            self.__parallel = ParallelHasher(
+                jobs, chunk_size=self.__chunk_size, cache=self.__cache)
+        self.__use_index = index
+        self.__index = None
+        self.__scanned = 0
+
+    def finder(self, look_inside=False, depth=1, sniff=False, walker='os',
+               walker_threads=DEFAULT_THREADS, dedup=True, manifest=None):
+        """
+        Returns a PackageFinder using the limits from the config.
+
+        :Parameters:
+           - `look_inside`: if packages should be scanned for hidden packages
+           - `depth`: how many levels of packages inside of packages to look
+           - `sniff`: if files without a package suffix should be sniffed
+           - `walker`: name of a walker in victims.walkers.WALKERS
+           - `walker_threads`: directories listed at once by the threaded
+             walker
+           - `dedup`: if copies of an archive should reuse what was found
+             inside of the first one, hashing packages through the hash
+             cache as they are found. Ignored when hashing with more than
+             one job, as the digests would be made in this process instead
+             of the worker pool.
+           - `manifest`: optional victims.manifest.Manifest of an earlier
+             scan to take unchanged packages from, pass it to scan too
+        """
+        if walker == 'threaded':
+            walker = ThreadedWalker(walker_threads)
+        else:
+            walker = WALKERS[walker]()
+        return PackageFinder(
+            look_inside=look_inside, walker=walker, depth=depth,
+            sniff=sniff, dedup=dedup and self.__parallel is None,
+            hasher=self.__hasher, manifest=manifest,
+            chunk_size=self.__chunk_size,
+            memo_size=_get_conf_int(
+                self.__conf, 'scan', 'dedup_memo_size', DEFAULT_MEMO_SIZE),
+            max_member_size=_get_conf_int(
+                self.__conf, 'scan', 'max_member_size',
+                DEFAULT_MAX_MEMBER_SIZE),
+            max_ratio=_get_conf_int(
+                self.__conf, 'scan', 'max_ratio', DEFAULT_MAX_RATIO))
+
+    def index(self):
+        """
+        Returns the hash index, rebuilding it when the database changed
+        since it was loaded, or None when the index is not used.
+        """
+        if not self.__use_index:
+            return None
+        if self.__index is None or self.__index.stale(self.__connection):
+            index_path = _get_default_index_loc(
+                self.__conf['database']['url'])
+            if 'scan' in self.__conf:
+                index_path = self.__conf['scan'].get(
+                    'index_path', index_path)
+            from victims.index import HashIndex
+            self.__index = HashIndex.cached(
+                self.__connection, os.path.expanduser(index_path))
+        return self.__index
+
+    def _hashed(self, packages):
+        """
+        Yields (package, sha512) for each package.
+
+        :Parameters:
+           - `packages`: iterable of victims.Package
+        """
+        if self.__parallel is not None:
+            for item in self.__parallel(packages):
+                yield item
+            return
+        for package in packages:
+            if package.digests is not None:
+                yield (package, package.digests.sha512)
+            else:
+                yield (package, self.__hasher(package.path))
+
+    def _lookup(self, packages, formats, index, manifest=None):
+        """
+        Yields (package, CVEMap row) for every package in a batch which
+        matches a row.
+
+        :Parameters:
+           - `packages`: victims.Packages batch to look up
+           - `formats`: formats the packages may have
+           - `index`: optional victims.index.HashIndex to check first
+           - `manifest`: optional victims.manifest.Manifest recording the
+             matches
+        """
+        hashes = packages.iterkeys()
+        if index is not None:
+            # Only hashes in the index can have rows worth fetching
+            hashes = index.filter(hashes)
+        for result in self.__connection.lookup(hashes, formats):
+            if manifest is not None:
+                manifest.found(result)
+            # As we may have copies of the same package ... I'm looking at
+            # you JAVA
+            for package in packages[result.hash]:
+                yield (package, result)
+
+    def _unchanged(self, manifest):
+        """
+        Returns a function telling which cvemap rows match a hash looked
+        up by the scan which made manifest, or None when the hash must be
+        looked up again. Nothing is looked up again while the database is
+        unchanged. Once updates were made only hashes which matched before
+        are, rows for the rest come from the rows the updates wrote.
+
+        :Parameters:
+           - `manifest`: victims.manifest.Manifest of the scan
+        """
+        previous = manifest.previous_db_state
+        current = self.__connection.db_state()
+        manifest.start(current)
+        if previous is None or current[0] < previous[0] or (
+                current[0] == previous[0] and current[1] != previous[1]):
+            # Rows changed without an update being recorded
+            return lambda hash: None
+        if current == previous:
+            def unchanged(hash):
+                if manifest.checked(hash):
+                    return manifest.rows(hash)
+                return None
+            return unchanged
+
+        fresh = {}
+        for row in self.__connection.since(previous[0]):
+            fresh.setdefault(row.hash, []).append(row)
+
+        def updated(hash):
+            if not manifest.checked(hash) or manifest.rows(hash):
+                return None
+            return fresh.get(hash, [])
+        return updated
+
+    def scan(self, paths, finder, manifest=None):
+        """
+        Yields (package, CVEMap row) for every package under paths which
+        matches a row. Packages are hashed as they are found and looked up
+        in batches so the walk, hashing and queries overlap. The number of
+        packages looked at is available from scanned afterwards.
+
+        :Parameters:
+           - `paths`: paths to look in
+           - `finder`: victims.PackageFinder used to find packages
+           - `manifest`: optional victims.manifest.Manifest of an earlier
+             scan, also given to the finder. Hashes it looked up are only
+             looked up again when the database changed since. Digests and
+             matches are recorded in it to be saved for the next scan.
+        """
+        self.__scanned = 0
+        index = self.index()
+        unchanged = None
+        if manifest is not None:
+            unchanged = self._unchanged(manifest)
+        for check_path in paths:
+            packages = Packages()
+            for package, hash in self._hashed(finder.iter(check_path)):
+                self.__scanned += 1
+                METRICS.count('packages_scanned')
+                if manifest is not None:
+                    manifest.hashed(package, hash)
+                if unchanged is not None:
+                    rows = unchanged(hash)
+                    if rows is not None:
+                        for row in rows:
+                            if row.format in finder.formats:
+                                manifest.found(row)
+                                yield (package, row)
+                        continue
+                packages.append(hash, package)
+                if len(packages) >= self.__batch_size:
+                    for match in self._lookup(
+                            packages, finder.formats, index, manifest):
+                        yield match
+                    packages = Packages()
+            if packages:
+                for match in self._lookup(
+                        packages, finder.formats, index, manifest):
+                    yield match
+            if self.__cache is not None:
+                self.__cache.flush()
+
+    def clear_cache(self):
+        """
+        Drops every remembered package hash.
+        """
+        if self.__cache is not None:
+            self.__cache.clear()
+
+    # Read-only properties
+    connection = property(lambda s: s.__connection)
+    scanned = property(lambda s: s.__scanned)
+    #: victims.metrics.Metrics every scan in this process records into
+    metrics = property(lambda s: METRICS)
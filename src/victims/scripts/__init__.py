@@ -27,6 +27,55 @@ def _get_default_conf_loc():
     return default_conf
 
 
+def _get_default_index_loc(url):
+    """
+    Returns a default location for the saved hash index of a database, so
+    indexes of different databases never replace each other.
+
+    :Parameters:
+       - `url`: database url from the config
+    """
+    from victims.lite import database_key
+    return os.path.sep.join([
+        os.path.dirname(_get_default_conf_loc()),
+        'cvemap-%s.idx' % database_key(url)[:16]])
+
+
+def _get_default_socket_loc():
+    """
+    Returns a default location for the daemon socket.
+    """
+    return os.path.sep.join([
+        os.path.dirname(_get_default_conf_loc()), 'daemon.sock'])
+
+
+def _get_socket_loc(conf):
+    """
+    Returns where the daemon socket is from the config or the default.
+
+    :Parameters:
+       - `conf`: the configuration object
+    """
+    socket_path = _get_default_socket_loc()
+    if 'daemon' in conf:
+        socket_path = conf['daemon'].get('socket', socket_path)
+    return os.path.expanduser(socket_path)
+
+
+def _get_daemon_timeout(conf):
+    """
+    Returns the seconds to wait on the daemon from the config or the
+    default.
+
+    :Parameters:
+       - `conf`: the configuration object
+    """
+    from victims.daemon import DEFAULT_TIMEOUT
+    if 'daemon' in conf and 'timeout' in conf['daemon']:
+        return float(conf['daemon']['timeout'])
+    return DEFAULT_TIMEOUT
+
+
 def _require_conf(args, parser):
     """
     Checks to verify th config exists, else prints help and exists.
@@ -39,3 +88,31 @@ def _require_conf(args, parser):
         parser.print_help()
         print("\n" + args.config + " is not valid or does not exist ...")
         raise SystemExit(1)
+
+
+def _get_conf_int(conf, section, key, default, minimum=None):
+    """
+    Returns an integer option from the config or the default if the section
+    or key is not set. Raises ValueError naming the option when it is not
+    an integer or is below minimum.
+
+    :Parameters:
+       - `conf`: the configuration object
+       - `section`: name of the section holding the option
+       - `key`: name of the option
+       - `default`: value to use when the option is missing
+       - `minimum`: optional smallest value allowed
+    """
+    try:
+        value = conf[section][key]
+    except KeyError:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError('[%s] %s must be an integer, not %r' % (
+            section, key, value))
+    if minimum is not None and value < minimum:
+        raise ValueError('[%s] %s must be at least %d, not %d' % (
+            section, key, minimum, value))
+    return value
@@ -0,0 +1,106 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Finds the packages affected by CVEs.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import json
+import sys
+
+from argparse import ArgumentParser
+
+from victims.config import Config
+from victims.lite import CVEMAP_COLUMNS, database_errors, open_reader
+from victims.scripts import _get_default_conf_loc, _require_conf
+
+
+def _read_cves(f_obj):
+    """
+    Yields the CVE ids listed in a file, one or more per line split by
+    whitespace or commas. Lines starting with # are skipped.
+
+    :Parameters:
+       - `f_obj`: file like object to read lines from
+    """
+    for line in f_obj:
+        if line.strip().startswith('#'):
+            continue
+        for cve in line.replace(',', ' ').split():
+            yield cve
+
+
+def main():
+    """
+    Prints every known package affected by the given CVEs.
+    """
+    default_conf = _get_default_conf_loc()
+    parser = ArgumentParser()
+    parser.add_argument(
+        "-c", "--config", dest="config",
+        default=default_conf, help="what config file to use",
+        metavar="CONFIG")
+    parser.add_argument(
+        "-f", "--file", dest="file", metavar="FILE",
+        help="Also look up the CVEs listed in FILE, or on stdin when -")
+    parser.add_argument(
+        "-j", "--json-output", dest="json",
+        action="store_true", help="Output as json")
+    parser.add_argument(
+        'cves', metavar='CVE', type=str, nargs='*',
+        help='CVE ids to look up')
+
+    args = parser.parse_args()
+    if not args.cves and not args.file:
+        parser.print_help()
+        parser.error('You must provide a CVE id or a file')
+    _require_conf(args, parser)
+
+    conf = Config(args.config)
+    # Plain sqlite databases are read without loading SQLAlchemy
+    c = open_reader(conf)
+
+    cves = list(args.cves)
+    try:
+        if args.file:
+            f_obj = sys.stdin
+            if args.file != '-':
+                f_obj = open(args.file, 'r')
+            try:
+                cves += list(_read_cves(f_obj))
+            finally:
+                if f_obj is not sys.stdin:
+                    f_obj.close()
+
+        count = 0
+        if args.json:
+            data = []
+            for cve, result in c.affected(cves):
+                inst = dict((x, getattr(result, x)) for x in CVEMAP_COLUMNS)
+                inst['cve'] = cve
+                data.append(inst)
+            count = len(data)
+            print json.dumps(data)
+        else:
+            for cve, result in c.affected(cves):
+                count += 1
+                print("%s: %s %s (%s) %s" % (
+                    cve, result.name, result.version, result.vendor,
+                    result.hash))
+    except (database_errors() + (EnvironmentError, )), ex:
+        print('An error has occured: %s' % ex)
+        raise SystemExit(2)
+    if count:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
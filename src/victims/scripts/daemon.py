@@ -0,0 +1,92 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Runs the scan daemon.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import signal
+
+from argparse import ArgumentParser
+
+from victims.config import Config
+from victims.daemon import DaemonError, ScanServer
+from victims.scanner import Scanner
+from victims.scripts import (
+    _get_default_conf_loc, _get_socket_loc, _require_conf)
+
+
+def _stop(signum, frame):
+    """
+    Turns SIGTERM into a clean exit so the socket is removed.
+
+    :Parameters:
+       - `signum`: the signal number
+       - `frame`: the interrupted stack frame
+    """
+    raise SystemExit(0)
+
+
+def main():
+    """
+    Serves scan requests until stopped.
+    """
+    # Default items which must be generated
+    default_conf = _get_default_conf_loc()
+
+    parser = ArgumentParser()
+    parser.add_argument(
+        "-c", "--config", dest="config",
+        default=default_conf, help="what config file to use",
+        metavar="CONFIG")
+    parser.add_argument(
+        "-s", "--socket", dest="socket", default=None, metavar="PATH",
+        help="Socket to listen on (default: from the config)")
+    parser.add_argument(
+        "--no-cache", dest="no_cache",
+        action="store_true", default=False,
+        help="Hash every package instead of using the hash cache")
+    parser.add_argument(
+        "-j", "--jobs", dest="jobs", type=int, default=None,
+        help="Number of processes used to hash packages", metavar="N")
+    parser.add_argument(
+        "-i", "--index", dest="index",
+        action="store_true", default=False,
+        help="Check hashes against a memory mapped index of the database")
+
+    args = parser.parse_args()
+    _require_conf(args, parser)
+
+    conf = Config(args.config)
+    socket_path = args.socket or _get_socket_loc(conf)
+    scanner = Scanner(
+        conf, cache=not args.no_cache, jobs=args.jobs, index=args.index)
+    # Load the index now rather than on the first request
+    scanner.index()
+
+    try:
+        server = ScanServer(socket_path, scanner)
+    except (DaemonError, EnvironmentError), ex:
+        print("Unable to listen on %s: %s" % (socket_path, ex))
+        raise SystemExit(1)
+
+    signal.signal(signal.SIGTERM, _stop)
+    print("Listening on " + socket_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
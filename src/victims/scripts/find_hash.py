@@ -18,17 +18,35 @@ import re
 
 from argparse import ArgumentParser
 
-from victims import PackageFinder, HashGenerator
+from victims import PackageFinder, MultiHashGenerator
+from victims.walkers import WALKERS
 
 
 def main():
     """
-    Find sha512sum's in archives.
+    Find sha512sum's (or other digests) in archives.
     """
     parser = ArgumentParser()
     parser.add_argument(
         "-n", "--name", dest="name",
         help="name or regex of the file(s) to look for", metavar="NAME")
+    parser.add_argument(
+        "-a", "--algorithm", dest="algorithms", action="append",
+        help=("hashlib algorithm to print, may be given more than once "
+              "(default: sha512)"), metavar="ALGORITHM")
+    parser.add_argument(
+        "-d", "--depth", dest="depth", type=int, default=1,
+        help=("How many levels of packages inside of packages to look in "
+              "(default: 1)"), metavar="N")
+    parser.add_argument(
+        "-s", "--sniff", dest="sniff",
+        action="store_true", default=False,
+        help=("Also check files without a package suffix for archive "
+              "magic bytes"))
+    parser.add_argument(
+        "-w", "--walker", dest="walker", default="os",
+        choices=sorted(WALKERS.keys()),
+        help="How directories are walked (default: os)")
     parser.add_argument(
         'paths', metavar='PATHS', type=str, nargs='+',
         help='Paths to look in')
@@ -42,16 +60,31 @@ def main():
         print('\nYou must provide a string or valid regex with --name/-n')
         raise SystemExit(1)
 
-    finder = PackageFinder(look_inside=True)
-    hasher = HashGenerator()
+    algorithms = args.algorithms or ['sha512']
+    try:
+        hasher = MultiHashGenerator(algorithms)
+    except ValueError, ve:
+        parser.print_help()
+        print('\nUnsupported algorithm: ' + str(ve))
+        raise SystemExit(1)
+
+    finder = PackageFinder(
+        look_inside=True, walker=args.walker, depth=args.depth,
+        sniff=args.sniff,
+        algorithms=algorithms)
 
     # For each path ...
     for check_path in args.paths:
-        data, formats = finder(check_path)
-        for package in data:
+        # Print each match as soon as it is found
+        for package in finder.iter(check_path):
             result = rx.findall(os.path.basename(package.name))
             if result:
-                print("- " + " ".join([hasher(package.path), str(package)]))
+                # Every requested digest comes from the same read
+                digests = package.digests or hasher(package.path)
+                print("- " + " ".join(
+                    [digests[x] for x in algorithms] + [str(package)]))
+            elif package.internal:
+                package.path.close()
 
 
 if __name__ == '__main__':
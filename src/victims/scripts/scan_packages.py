@@ -13,21 +13,130 @@ Functions which will be exposed as command line scripts.
 
 __docformat__ = 'restructuredtext'
 
-from argparse import ArgumentParser
+import sys
 
-import sqlalchemy.orm
-import sqlalchemy.sql.expression
+from argparse import ArgumentParser
 
-from victims import PackageFinder, HashGenerator, Packages
 from victims.config import Config
-from victims.db import CVEMap, Connection
-from victims.scripts import _get_default_conf_loc, _require_conf
+from victims.daemon import DaemonError, scan as daemon_scan
+from victims.lite import database_errors, open_reader
+from victims.metrics import METRICS, report
+from victims.report import REPORTERS, GroupingReporter, finding
+from victims.walkers import WALKERS, DEFAULT_THREADS
+from victims.scripts import (
+    _get_daemon_timeout, _get_default_conf_loc, _get_socket_loc,
+    _require_conf)
 
 
 OK_EXIT = 0
 FOUND_VULNERABILITIES_EXIT = 1
 INTERNAL_ERROR_EXIT = 2
 
+#: Functions listed from the profile when scanning with --profile
+PROFILE_LINES = 30
+
+
+def _scan_with_daemon(args, conf, reporter):
+    """
+    Has a running victims-daemon do the scan. Returns (scanned, matches,
+    skipped, metrics) or None when no daemon answers.
+
+    :Parameters:
+       - `args`: the args the parser returned
+       - `conf`: the configuration object
+       - `reporter`: victims.report.Reporter to write findings to
+    """
+    try:
+        response = daemon_scan(
+            args.socket or _get_socket_loc(conf), args.paths,
+            look_inside=args.look_inside, depth=args.depth,
+            sniff=args.sniff, walker=args.walker, dedup=not args.no_dedup,
+            timeout=_get_daemon_timeout(conf))
+    except DaemonError, de:
+        sys.stderr.write("Scanning without the daemon: %s\n" % de)
+        return None
+    for match in response['matches']:
+        reporter.write(match)
+    return (response['scanned'], len(set(
+        x['hash'] for x in response['matches'])), response['skipped'],
+        response.get('metrics'))
+
+
+def _scan_locally(args, conf, reporter):
+    """
+    Does the scan in this process. Returns (scanned, matches, skipped,
+    walker).
+
+    :Parameters:
+       - `args`: the args the parser returned
+       - `conf`: the configuration object
+       - `reporter`: victims.report.Reporter to write findings to
+    """
+    from victims.scanner import Scanner
+
+    connection = None
+    if args.no_cache and not args.index:
+        # Only lookups are needed, which can skip SQLAlchemy
+        connection = open_reader(conf)
+    try:
+        scanner = Scanner(
+            conf, connection, cache=not args.no_cache, jobs=args.jobs,
+            index=args.index)
+    except ValueError, ve:
+        sys.stderr.write("Bad configuration: %s\n" % ve)
+        raise SystemExit(INTERNAL_ERROR_EXIT)
+    if args.rebuild_cache:
+        scanner.clear_cache()
+    manifest = None
+    if args.incremental:
+        from victims.manifest import Manifest
+        manifest = Manifest(args.incremental, {
+            'look_inside': args.look_inside, 'depth': args.depth,
+            'sniff': args.sniff})
+    finder = scanner.finder(
+        look_inside=args.look_inside, depth=args.depth,
+        sniff=args.sniff, walker=args.walker,
+        walker_threads=args.walker_threads, dedup=not args.no_dedup,
+        manifest=manifest)
+
+    hashes = set()
+    try:
+        for package, result in scanner.scan(args.paths, finder, manifest):
+            hashes.add(result.hash)
+            reporter.write(finding(package, result))
+    except database_errors(), oe:
+        print("\nError occured (bad database?)\n\nError:\n" + str(oe))
+        raise SystemExit(INTERNAL_ERROR_EXIT)
+    if manifest is not None:
+        try:
+            manifest.save()
+        except (IOError, OSError), ex:
+            sys.stderr.write("Could not save %s: %s\n" % (
+                manifest.path, ex))
+    return (scanner.scanned, len(hashes), finder.skipped, finder.walker)
+
+
+def _profiled(profile_path, func, *args):
+    """
+    Calls func under cProfile, saving the profile to profile_path and
+    writing the functions taking the most time to stderr.
+
+    :Parameters:
+       - `profile_path`: where the profile is saved for pstats
+       - `func`: function to call
+       - `args`: arguments for func
+    """
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        profiler.dump_stats(profile_path)
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        stats.sort_stats('cumulative').print_stats(PROFILE_LINES)
+
 
 def main():
     """
@@ -45,6 +154,80 @@ def main():
         "-l", "--look-inside", dest="look_inside",
         action="store_true", default=False,
         help="If packages should be scanned for hidden packages")
+    parser.add_argument(
+        "-s", "--sniff", dest="sniff",
+        action="store_true", default=False,
+        help=("Also check files without a package suffix for archive "
+              "magic bytes"))
+    parser.add_argument(
+        "-d", "--depth", dest="depth", type=int, default=1,
+        help=("How many levels of packages inside of packages to look in "
+              "with --look-inside (default: 1)"), metavar="N")
+    parser.add_argument(
+        "--no-dedup", dest="no_dedup",
+        action="store_true", default=False,
+        help=("Look inside of every copy of a package instead of reusing "
+              "what was found inside of the first, always the case with "
+              "--jobs"))
+    parser.add_argument(
+        "-g", "--group-copies", dest="group_copies",
+        action="store_true", default=False,
+        help=("Report each vulnerable package once, listing its copies, "
+              "once the scan is over"))
+    parser.add_argument(
+        "--incremental", dest="incremental", default=None,
+        metavar="STATE_FILE",
+        help=("Only hash packages changed since the scan which saved "
+              "STATE_FILE and save this scan to it. Scans here even with "
+              "--daemon"))
+    parser.add_argument(
+        "--no-cache", dest="no_cache",
+        action="store_true", default=False,
+        help="Hash every package instead of using the hash cache")
+    parser.add_argument(
+        "--rebuild-cache", dest="rebuild_cache",
+        action="store_true", default=False,
+        help="Drop the hash cache and rehash every package")
+    parser.add_argument(
+        "-j", "--jobs", dest="jobs", type=int, default=None,
+        help="Number of processes used to hash packages", metavar="N")
+    parser.add_argument(
+        "-i", "--index", dest="index",
+        action="store_true", default=False,
+        help="Check hashes against a memory mapped index of the database")
+    parser.add_argument(
+        "-w", "--walker", dest="walker", default="os",
+        choices=sorted(WALKERS.keys()),
+        help="How directories are walked (default: os)")
+    parser.add_argument(
+        "--walker-threads", dest="walker_threads", type=int,
+        default=DEFAULT_THREADS, metavar="N",
+        help="Directories listed at once by the threaded walker")
+    parser.add_argument(
+        "--walk-stats", dest="walk_stats",
+        action="store_true", default=False,
+        help="Print directory and file rates of the walk")
+    parser.add_argument(
+        "-D", "--daemon", dest="daemon",
+        action="store_true", default=False,
+        help=("Scan through a running victims-daemon, scanning here if "
+              "none answers"))
+    parser.add_argument(
+        "--socket", dest="socket", default=None, metavar="PATH",
+        help="Daemon socket to use, implies --daemon")
+    parser.add_argument(
+        "-f", "--format", dest="format", default="text",
+        choices=sorted(REPORTERS.keys()),
+        help=("How findings are written: text, json lines, one json "
+              "document or SARIF (default: text)"))
+    parser.add_argument(
+        "--stats", dest="stats",
+        action="store_true", default=False,
+        help="Print counters and time spent in each phase of the scan")
+    parser.add_argument(
+        "--profile", dest="profile", default=None, metavar="FILE",
+        help=("Profile the scan, saving the profile to FILE and printing "
+              "the slowest functions"))
     parser.add_argument(
         'paths', metavar='PATHS', type=str, nargs='+',
         help='Paths to look in')
@@ -53,43 +236,40 @@ def main():
     _require_conf(args, parser)
 
     conf = Config(args.config)
-    c = Connection(conf)
+    reporter = REPORTERS[args.format](sys.stdout, conf)
+    if args.group_copies:
+        reporter = GroupingReporter(reporter)
+    # Keep anything but the findings out of machine readable reports
+    info = sys.stdout
+    if args.format != 'text':
+        info = sys.stderr
 
-    finder = PackageFinder(look_inside=args.look_inside)
-    hasher = HashGenerator()
+    walker = None
+    metrics = None
+    from_daemon = None
+    if (args.daemon or args.socket) and not args.incremental:
+        from_daemon = _scan_with_daemon(args, conf, reporter)
+    if from_daemon is not None:
+        count, matches, skipped, metrics = from_daemon
+    else:
+        if args.profile:
+            scanned = _profiled(
+                args.profile, _scan_locally, args, conf, reporter)
+        else:
+            scanned = _scan_locally(args, conf, reporter)
+        count, matches, skipped, walker = scanned
+        metrics = METRICS.snapshot()
 
-    count = 0
-    # For each path ...
-    for check_path in args.paths:
-        data, formats = finder(check_path)
-        count += len(data)
-        # Add each package in a packages object so we can query faster
-        packages = Packages()
-        for package in data:
-            packages.append(hasher(package.path), package)
-
-        # Run the query in one execution
-        results = c.session.query(CVEMap).filter(CVEMap.hash.in_(
-            packages.keys())).filter(CVEMap.format.in_(formats))
-
-        try:
-            # Print result if we have a match
-            if results.count():
-                # For each result we have ...
-                for result in results:
-                    # For each package that matches the hash (as we may have
-                    # copies of the same package ... I'm looking at you JAVA)
-                    for package in packages[result.hash]:
-                        print(str(package) + ": " + result.cves)
-                        for cve in result.cves.split(','):
-                            for name, cveurl in conf['cveurls'].items():
-                                print "- %s: %s" % (name, (cveurl % cve))
-        except sqlalchemy.exc.OperationalError, oe:
-            print("\nError occured (bad database?)\n\nError:\n" + str(oe))
-            raise SystemExit(INTERNAL_ERROR_EXIT)
-
-    print("Scanned " + str(count) + " packages")
-    if results.count() > 0:
+    reporter.finish(count, skipped)
+    for name, reason in skipped:
+        sys.stderr.write("Did not look inside %s: %s\n" % (name, reason))
+    if args.walk_stats and walker is not None:
+        info.write("Walked %d dirs (%.1f/sec) and %d files (%.1f/sec)\n" % (
+            walker.dirs, walker.dirs_per_second,
+            walker.files, walker.files_per_second))
+    if args.stats and metrics is not None:
+        info.write('\n'.join(report(metrics)) + '\n')
+    if matches:
         raise SystemExit(FOUND_VULNERABILITIES_EXIT)
     raise SystemExit(OK_EXIT)
 
@@ -13,8 +13,7 @@ Functions which will be exposed as command line scripts.
 
 __docformat__ = 'restructuredtext'
 
-import json
-import urllib
+import time
 
 from argparse import ArgumentParser
 
@@ -22,8 +21,23 @@ import sqlalchemy.orm
 import sqlalchemy.sql.expression
 
 from victims.config import Config
-from victims.db import CVEMap, Connection
-from victims.scripts import _get_default_conf_loc, _require_conf
+from victims.db import CVEMap, Connection, DEFAULT_WRITE_BATCH_SIZE
+from victims.feed import iter_fields
+from victims.scripts import (
+    _get_default_conf_loc, _require_conf, _get_conf_int)
+
+#: Columns of cvemap filled from each update record
+CVEMAP_COLUMNS = [c.name for c in CVEMap.__table__.columns]
+
+
+def _cvemap_row(fields):
+    """
+    Returns the cvemap row for the fields of an update record.
+
+    :Parameters:
+       - `fields`: fields of one record from the update service
+    """
+    return dict((name, fields[name]) for name in CVEMAP_COLUMNS)
 
 
 def main():
@@ -40,6 +54,18 @@ def main():
         "-f", "--force-version", dest="version",
         help="Force update from a specific version",
         metavar="VERSION")
+    parser.add_argument(
+        "-b", "--batch-size", dest="batch_size", type=int,
+        help="Number of rows written or removed per transaction",
+        metavar="ROWS")
+    parser.add_argument(
+        "-u", "--update-source", dest="update_source",
+        help="URL or file to read updates from instead of the service",
+        metavar="SOURCE")
+    parser.add_argument(
+        "-r", "--remove-source", dest="remove_source",
+        help="URL or file to read removals from instead of the service",
+        metavar="SOURCE")
 
     args = parser.parse_args()
     _require_conf(args, parser)
@@ -57,45 +83,36 @@ def main():
         except (IndexError, sqlalchemy.orm.exc.NoResultFound):
             current_db = 0
 
-    # Get the update data
+    batch_size = args.batch_size
+    if batch_size is None:
+        batch_size = _get_conf_int(
+            conf, 'update', 'batch_size', DEFAULT_WRITE_BATCH_SIZE)
+
+    update_source = args.update_source
+    if update_source is None:
+        update_source = (
+            conf['service']['updateurl'] + str(current_db) + "/")
+
+    # Records are written in batches as they are read from the feed
     try:
-        data = urllib.urlopen(
-            conf['service']['updateurl'] + str(current_db) + "/").read()
-        for hash in [x['fields'] for x in json.loads(data)]:
-            try:
-                c.session.add(CVEMap(
-                    hash['hash'], hash['name'], hash['version'],
-                    hash['vendor'], hash['cves'], hash['db_version'],
-                    hash['format']))
-                c.session.flush()
-            except sqlalchemy.exc.IntegrityError:
-                # Hash already exists ... update it
-                cvemap = c.session.query(CVEMap).filter(
-                    CVEMap.hash == hash['hash']).one()
-                cvemap.name = hash['name']
-                cvemap.version = hash['version']
-                cvemap.vendor = hash['vendor']
-                cvemap.cves = hash['cves']
-                cvemap.db_version = hash['db_version']
-                cvemap.format = hash['format']
-                c.session.add(cvemap)
-                c.session.flush()
+        start = time.time()
+        count = c.update_cvemap((
+            _cvemap_row(x) for x in iter_fields(update_source)), batch_size)
+        print("Updated %d hashes (%.1f rows/sec)" % (
+            count, count / max(time.time() - start, 1e-6)))
     except Exception, ex:
         print("An error occured while trying to update.\n\nError:\n" + str(ex))
 
     try:
         # Get the data to remove
-        rm_url = conf['service']['removeurl'] + str(current_db) + "/"
-        rm_data = urllib.urlopen(rm_url).read()
-        for rm_hash in [x['fields'] for x in json.loads(rm_data)]:
-            try:
-                cvemap = c.session.query(CVEMap).filter(
-                    CVEMap.hash == hash['hash']).one()
-                c.session.delete(cvemap)
-                c.flush()
-            except Exception, ex:
-                # Could not remove an item ... already removed?
-                pass
+        rm_source = args.remove_source
+        if rm_source is None:
+            rm_source = conf['service']['removeurl'] + str(current_db) + "/"
+        start = time.time()
+        count = c.remove_hashes(
+            (x['hash'] for x in iter_fields(rm_source)), batch_size)
+        print("Removed %d hashes (%.1f rows/sec)" % (
+            count, count / max(time.time() - start, 1e-6)))
     except KeyError:
         # Removing is not configured
         pass
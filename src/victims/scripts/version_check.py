@@ -14,20 +14,38 @@ Searches for files and produces hashes from an archive.
 __docformat__ = 'restructuredtext'
 
 import json
+import sys
 
 from argparse import ArgumentParser
 
-import sqlalchemy.orm
-import sqlalchemy.sql.expression
-
 from victims.config import Config
-from victims.db import CVEMap, Connection
+from victims.lite import CVEMAP_COLUMNS, database_errors, open_reader
 from victims.scripts import _get_default_conf_loc, _require_conf
 
 
+def _read_pairs(f_obj):
+    """
+    Yields (name, version) from lines holding a name and a version split by
+    whitespace or a comma. Blank lines and lines starting with # are
+    skipped.
+
+    :Parameters:
+       - `f_obj`: file like object to read lines from
+    """
+    for line in f_obj:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        fields = line.replace(',', ' ').split()
+        if len(fields) != 2:
+            raise ValueError('Expected a name and a version: %s' % line)
+        yield tuple(fields)
+
+
 def main():
     """
-    Prints out metadata for a specific package-version.
+    Prints out metadata for a specific package-version, or for many of
+    them read from a file.
     """
     default_conf = _get_default_conf_loc()
     parser = ArgumentParser()
@@ -44,36 +62,52 @@ def main():
     parser.add_argument(
         "-j", "--json-output", dest="json",
         action="store_true", help="Outout as json")
+    parser.add_argument(
+        "-f", "--file", dest="file", metavar="FILE",
+        help=("Check every name and version pair listed in FILE, one per "
+              "line, or on stdin when FILE is -"))
 
     args = parser.parse_args()
 
-    if not args.name or not args.version:
+    if not args.file and (not args.name or not args.version):
         parser.print_help()
-        parser.error('You must provide a name and version')
+        parser.error('You must provide a name and version or a file')
 
     _require_conf(args, parser)
 
     conf = Config(args.config)
-    c = Connection(conf)
+    # Plain sqlite databases are read without loading SQLAlchemy
+    c = open_reader(conf)
 
+    f_obj = None
     try:
-        results = c.session.query(CVEMap).filter(
-            CVEMap.name == args.name).filter(
-                CVEMap.version == args.version)
+        if args.file:
+            f_obj = sys.stdin
+            if args.file != '-':
+                f_obj = open(args.file, 'r')
+            # Every pair is resolved with a query per batch of pairs
+            results = c.find_many(_read_pairs(f_obj))
+        else:
+            results = c.find(args.name, args.version)
         if args.json:
             data = []
             for result in results:
-                inst = result.__dict__
-                del inst['_sa_instance_state']
-                data.append(inst)
+                data.append(dict(
+                    (x, getattr(result, x)) for x in CVEMAP_COLUMNS))
             print json.dumps(data)
         else:
             for result in results:
+                if args.file:
+                    print("Name: %s\nVersion: %s" % (
+                        result.name, result.version))
                 print("Hash: %s\nVendor: %s\nCVES: %s" % (
                     result.hash, result.vendor, result.cves))
-    except (IndexError, sqlalchemy.orm.exc.NoResultFound), ex:
+    except (database_errors() + (EnvironmentError, ValueError)), ex:
         print('An error has occured: %s' % ex)
         raise SystemExit(1)
+    finally:
+        if f_obj is not None and f_obj is not sys.stdin:
+            f_obj.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,210 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Directory walkers used to find packages.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import collections
+import os
+import sys
+import time
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+from victims.metrics import METRICS
+
+#: Default number of threads listing directories at once
+DEFAULT_THREADS = 8
+
+#: Directory listings the threaded walker keeps ahead of its caller per
+#: thread, bounding the listings held in memory
+LISTINGS_PER_THREAD = 2
+
+
+class Walker(object):
+    """
+    Base walker. Calling a walker yields (root, files) tuples for every
+    directory under a path, where files are the names of all non directory
+    entries, and keeps count of what it has seen.
+    """
+
+    def __init__(self):
+        """
+        Creates the walker.
+        """
+        self.dirs = 0
+        self.files = 0
+        self.elapsed = 0.0
+
+    def __call__(self, path):
+        """
+        Walks the path.
+
+        :Parameters:
+           - `path`: the directory to start walking from.
+        """
+        walk = self._walk(path)
+        while True:
+            # Only time spent waiting on the walk counts, not the caller's
+            start = time.time()
+            cpu = time.clock()
+            try:
+                root, files = walk.next()
+            except StopIteration:
+                break
+            finally:
+                wall = time.time() - start
+                self.elapsed += wall
+                METRICS.add_time('walk', wall, time.clock() - cpu)
+            self.dirs += 1
+            self.files += len(files)
+            yield (root, files)
+
+    def _walk(self, path):
+        """
+        Does the actual walking. Must be implemented by subclasses.
+
+        :Parameters:
+           - `path`: the directory to start walking from.
+        """
+        raise NotImplementedError('Walkers must implement _walk')
+
+    def __rate(self, count):
+        """
+        Returns count per second of walking.
+
+        :Parameters:
+           - `count`: number of items seen
+        """
+        if not self.elapsed:
+            return 0.0
+        return count / self.elapsed
+
+    # Read-only properties
+    dirs_per_second = property(lambda s: s.__rate(s.dirs))
+    files_per_second = property(lambda s: s.__rate(s.files))
+
+
+class OSWalker(Walker):
+    """
+    Walks a tree with os.walk in the calling thread.
+    """
+
+    def _walk(self, path):
+        """
+        Walks the path with os.walk.
+
+        :Parameters:
+           - `path`: the directory to start walking from.
+        """
+        for root, dirs, files in os.walk(path):
+            yield (root, files)
+
+
+def _list_dir(path):
+    """
+    Lists a directory with scandir returning a tuple of (path, subdirs,
+    files, error), both lists sorted. Symlinks to directories are neither
+    descended into nor reported as files, same as os.walk. Errors reading
+    the directory are ignored, also like os.walk, but anything unexpected is
+    handed back to the caller.
+
+    :Parameters:
+       - `path`: the directory to list.
+    """
+    dirs = []
+    files = []
+    try:
+        # d_type lets us classify most entries without a stat call
+        for entry in scandir(path):
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    dirs.append(entry.name)
+            else:
+                files.append(entry.name)
+    except OSError:
+        pass
+    except Exception:
+        return (path, [], [], sys.exc_info())
+    return (path, sorted(dirs), sorted(files), None)
+
+
+class ThreadedWalker(Walker):
+    """
+    Walks a tree listing many directories at once in a thread pool. Useful
+    on network filesystems where each listing waits on the server.
+    Directories are yielded breadth first with names sorted, whatever order
+    their listings finish in. Needs scandir (os.scandir or the scandir
+    package), as telling directories from files after os.listdir costs more
+    stat calls than os.walk makes, so without it the tree is walked with
+    os.walk instead.
+    """
+
+    def __init__(self, threads=DEFAULT_THREADS):
+        """
+        Creates the walker.
+
+        :Parameters:
+           - `threads`: number of directories listed at once.
+        """
+        Walker.__init__(self)
+        self.threads = int(threads)
+
+    def _walk(self, path):
+        """
+        Walks the path with a pool of threads.
+
+        :Parameters:
+           - `path`: the directory to start walking from.
+        """
+        if scandir is None:
+            for root, files in OSWalker()._walk(path):
+                yield (root, files)
+            return
+        # multiprocessing is slow to import and most runs use os.walk
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(self.threads)
+        limit = self.threads * LISTINGS_PER_THREAD
+        try:
+            # Listings run ahead in the pool, up to limit at a time, and
+            # are handed out in the order they were started
+            queued = collections.deque([path])
+            pending = collections.deque()
+            while queued or pending:
+                while queued and len(pending) < limit:
+                    pending.append(pool.apply_async(
+                        _list_dir, (queued.popleft(),)))
+                listing = pending.popleft()
+                while not listing.ready():
+                    # A timeout keeps the wait interruptible with ctrl-c
+                    listing.wait(1)
+                root, dirs, files, error = listing.get()
+                if error:
+                    raise error[0], error[1], error[2]
+                queued.extend(os.path.join(root, name) for name in dirs)
+                yield (root, files)
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+#: Walkers by the names used on the command line
+WALKERS = {
+    'os': OSWalker,
+    'threaded': ThreadedWalker,
+}
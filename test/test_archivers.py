@@ -0,0 +1,364 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Unittest for archivers.
+"""
+
+import bz2
+import os
+import shutil
+import struct
+import sys
+import tarfile
+import tempfile
+import unittest
+import zipfile
+import zlib
+
+from StringIO import StringIO
+
+from victims import HashGenerator, PackageFinder
+from victims.archivers import Archive, RPMArchive
+from victims.archivers.cpio import iter_cpio
+from victims.archivers.sniff import kind_from_name, sniff
+from victims.archivers.rpm import RPMError, open_payload
+
+
+def make_cpio(entries):
+    """
+    Returns a newc cpio archive holding entries.
+
+    :Parameters:
+       - `entries`: list of (name, mode, data)
+    """
+    out = ''
+    for ino, (name, mode, data) in enumerate(
+            entries + [('TRAILER!!!', 0, '')]):
+        name += '\0'
+        header = '070701' + ''.join('%08x' % x for x in (
+            ino, mode, 0, 0, 1, 0, len(data), 0, 0, 0, 0, len(name), 0))
+        out += header + name
+        out += '\0' * ((4 - len(out) % 4) % 4)
+        out += data
+        out += '\0' * ((4 - len(out) % 4) % 4)
+    return out
+
+
+def make_header(tags):
+    """
+    Returns an rpm header structure holding string tags.
+
+    :Parameters:
+       - `tags`: dict of tag number to string value
+    """
+    index = ''
+    store = ''
+    for tag, value in sorted(tags.items()):
+        index += struct.pack('>iiii', tag, 6, len(store), 1)
+        store += value + '\0'
+    return ('\x8e\xad\xe8\x01\0\0\0\0' +
+            struct.pack('>II', len(tags), len(store)) + index + store)
+
+
+def make_rpm(payload, compressor):
+    """
+    Returns a minimal rpm with a cpio payload.
+
+    :Parameters:
+       - `payload`: the uncompressed cpio archive
+       - `compressor`: gzip, bzip2 or any name to leave it uncompressed
+    """
+    lead = '\xed\xab\xee\xdb' + '\0' * 92
+    signature = make_header({})
+    signature += '\0' * ((8 - len(signature) % 8) % 8)
+    if compressor == 'gzip':
+        gz = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        payload = gz.compress(payload) + gz.flush()
+    elif compressor == 'bzip2':
+        payload = bz2.compress(payload)
+    return lead + signature + make_header({
+        1124: 'cpio', 1125: compressor}) + payload
+
+
+class TestArchivers(unittest.TestCase):
+    """
+    Unittests for the archivers.
+    """
+
+    entries = [
+        ('./usr', 040755, ''),
+        ('./usr/share/java/a.jar', 0100644, 'jar a' * 1000),
+        ('./usr/share/doc/README', 0100644, 'readme'),
+        ('./usr/share/java/b.jar', 0100644, 'jar b'),
+        ('./usr/share/java/c.jar', 0120777, 'a.jar'),
+    ]
+
+    def setUp(self):
+        """
+        Write a cpio archive which stands in for an rpm. The rpm2cpio
+        command is swapped for cat so no rpm tools are needed.
+        """
+        self.root = tempfile.mkdtemp()
+        self.rpm = os.path.join(self.root, 'test.rpm')
+        open(self.rpm, 'wb').write(make_cpio(self.entries))
+        self.rpm2cpio = RPMArchive.RPM2CPIO
+        RPMArchive.RPM2CPIO = 'cat'
+
+    def tearDown(self):
+        """
+        Restore rpm2cpio and remove the temporary directory.
+        """
+        RPMArchive.RPM2CPIO = self.rpm2cpio
+        shutil.rmtree(self.root)
+
+    def test_iter_cpio(self):
+        """
+        Verify only regular, matching members are yielded and unread data
+        is kept or skipped as the stream moves on.
+        """
+        members = list(iter_cpio(StringIO(make_cpio(self.entries))))
+        assert [x[0] for x in members] == [
+            './usr/share/java/a.jar', './usr/share/doc/README',
+            './usr/share/java/b.jar']
+        # Open members were kept when the stream moved on
+        assert members[0][1].read() == 'jar a' * 1000
+
+        found = []
+        for name, member in iter_cpio(
+                StringIO(make_cpio(self.entries)),
+                lambda x: x.endswith('.jar')):
+            found.append((name, member.read(3)))
+            member.close()
+        assert found == [
+            ('./usr/share/java/a.jar', 'jar'),
+            ('./usr/share/java/b.jar', 'jar')]
+
+        self.assertRaises(
+            IOError, list, iter_cpio(StringIO(make_cpio(self.entries)[:200])))
+
+    def test_rpm_archive(self):
+        """
+        Make sure rpms are read through the streaming archive.
+        """
+        archive = Archive(self.rpm)
+        assert archive.handleable
+        assert len(archive.file_list) == 3
+        assert archive.open('./usr/share/java/b.jar').read() == 'jar b'
+        self.assertRaises(Exception, archive.open, 'missing')
+
+        data, formats = PackageFinder(look_inside=True)(self.rpm)
+        assert [x.name for x in data] == [
+            self.rpm, './usr/share/java/a.jar', './usr/share/java/b.jar']
+        assert HashGenerator()(data[1].path) == HashGenerator()(
+            StringIO('jar a' * 1000))
+
+    def test_native_rpm(self):
+        """
+        Verify rpm payloads are read in process without rpm2cpio.
+        """
+        RPMArchive.RPM2CPIO = 'false'
+        for compressor in ('gzip', 'bzip2'):
+            open(self.rpm, 'wb').write(make_rpm(
+                make_cpio(self.entries), compressor))
+            payload = open_payload(self.rpm)
+            assert [x[0] for x in iter_cpio(payload)] == [
+                './usr/share/java/a.jar', './usr/share/doc/README',
+                './usr/share/java/b.jar']
+            payload.close()
+
+            archive = Archive(self.rpm)
+            assert len(archive.file_list) == 3
+            assert archive.open('./usr/share/java/a.jar').read() == (
+                'jar a' * 1000)
+
+        open(self.rpm, 'wb').write(make_rpm(make_cpio(self.entries), 'foo'))
+        self.assertRaises(RPMError, open_payload, self.rpm)
+        open(self.rpm, 'wb').write('not an rpm at all')
+        self.assertRaises(RPMError, open_payload, self.rpm)
+
+    def test_rpm2cpio_fallback(self):
+        """
+        Make sure rpm2cpio is used when the payload can not be read.
+        """
+        open(self.rpm, 'wb').write(make_rpm(make_cpio(self.entries), 'foo'))
+        # cat hands back the rpm itself, which is not a cpio archive
+        self.assertRaises(IOError, Archive(self.rpm).open, 'x')
+        RPMArchive.NATIVE = False
+        try:
+            open(self.rpm, 'wb').write(make_rpm(
+                make_cpio(self.entries), 'gzip'))
+            self.assertRaises(IOError, Archive(self.rpm).open, 'x')
+        finally:
+            RPMArchive.NATIVE = True
+
+    def test_zip_infos(self):
+        """
+        Verify zip members are listed from the central directory and only
+        opened when read.
+        """
+        path = os.path.join(self.root, 'test.jar')
+        jar = zipfile.ZipFile(path, 'w')
+        jar.writestr('lib/', '')
+        jar.writestr('lib/a.jar', 'jar a')
+        jar.writestr('README', 'readme')
+        jar.close()
+
+        archive = Archive(path)
+        infos = list(archive.infos())
+        assert [x.name for x in infos] == ['lib/a.jar', 'README']
+        assert infos[0].size == 5
+        assert infos[0].crc == zlib.crc32('jar a') & 0xffffffff
+        assert [x.name for x in archive.infos(
+            lambda x: x.endswith('.jar'))] == ['lib/a.jar']
+
+        opened = []
+        original = zipfile.ZipFile.open
+
+        def tracking_open(zip_obj, name, *args):
+            opened.append(name)
+            return original(zip_obj, name, *args)
+
+        zipfile.ZipFile.open = tracking_open
+        try:
+            members = list(Archive(path).members())
+            assert opened == []
+            assert members[0][1].read() == 'jar a'
+            assert opened == ['lib/a.jar']
+            members[0][1].close()
+            self.assertRaises(ValueError, members[0][1].read)
+
+            hashes = dict(Archive(path).hash_members(
+                HashGenerator(), lambda x: x.endswith('.jar')))
+            assert hashes == {'lib/a.jar': HashGenerator()(StringIO('jar a'))}
+            assert opened == ['lib/a.jar', 'lib/a.jar']
+        finally:
+            zipfile.ZipFile.open = original
+
+    def test_rpm_infos(self):
+        """
+        Make sure rpm members are listed with their sizes.
+        """
+        infos = list(Archive(self.rpm).infos())
+        assert [(x.name, x.size) for x in infos] == [
+            ('./usr/share/java/a.jar', 5000),
+            ('./usr/share/doc/README', 6),
+            ('./usr/share/java/b.jar', 5)]
+
+    def test_tarballs(self):
+        """
+        Verify compressed tarballs are read in a single pass.
+        """
+        for suffix, mode in (
+                ('.tar.gz', 'w:gz'), ('.tgz', 'w:gz'),
+                ('.tar.bz2', 'w:bz2'), ('.tar', 'w')):
+            path = os.path.join(self.root, 'test' + suffix)
+            tar = tarfile.open(path, mode)
+            for name, data in (
+                    ('lib/a.jar', 'jar a' * 1000), ('README', 'readme'),
+                    ('lib/b.jar', 'jar b')):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, StringIO(data))
+            tar.close()
+
+            archive = Archive(path)
+            assert archive.handleable
+            assert archive.file_list == ['lib/a.jar', 'README', 'lib/b.jar']
+            assert [(x.name, x.size) for x in archive.infos()] == [
+                ('lib/a.jar', 5000), ('README', 6), ('lib/b.jar', 5)]
+            assert archive.open('lib/b.jar').read() == 'jar b'
+
+            members = list(archive.members(lambda x: x.endswith('.jar')))
+            assert [x[0] for x in members] == ['lib/a.jar', 'lib/b.jar']
+            # Members stay readable after the stream has moved past them
+            assert members[0][1].read() == 'jar a' * 1000
+
+            nested = Archive(path, StringIO(open(path, 'rb').read()))
+            assert nested.file_list == ['lib/a.jar', 'README', 'lib/b.jar']
+
+            if suffix == '.tar':
+                # Plain tarballs aren't looked for by default
+                continue
+            data, formats = PackageFinder(look_inside=True)(path)
+            assert [x.name for x in data][1:] == ['lib/a.jar', 'lib/b.jar']
+            assert HashGenerator()(data[2].path) == HashGenerator()(
+                StringIO('jar b'))
+
+    def test_missing_decompressor(self):
+        """
+        Make sure tarballs whose compression needs a missing module are
+        skipped without ending the scan.
+        """
+        modules = dict((x, sys.modules.get(x)) for x in (
+            'lzma', 'backports'))
+        # None in sys.modules makes importing it fail
+        sys.modules.update(dict.fromkeys(modules))
+        try:
+            path = os.path.join(self.root, 'app.tar.xz')
+            open(path, 'wb').write('\xfd7zXZ\x00')
+            finder = PackageFinder(look_inside=True)
+            data, formats = finder(self.root)
+            assert 'test.rpm' in [x.name for x in data]
+            assert finder.skipped == [(path, 'xz needs the lzma module')]
+        finally:
+            for name, module in modules.items():
+                if module is None:
+                    del sys.modules[name]
+                else:
+                    sys.modules[name] = module
+
+    def test_sniff(self):
+        """
+        Verify archives are recognized by their content when their names
+        don't say what they are.
+        """
+        ear = os.path.join(self.root, 'app.ear')
+        jar = zipfile.ZipFile(ear, 'w')
+        jar.writestr('lib/a.jar', 'jar a')
+        jar.close()
+        blob = os.path.join(self.root, 'blob')
+        tar = tarfile.open(blob, 'w:gz')
+        info = tarfile.TarInfo('b.jar')
+        info.size = 5
+        tar.addfile(info, StringIO('jar b'))
+        tar.close()
+        text = os.path.join(self.root, 'notes.txt')
+        open(text, 'w').write('just text')
+
+        assert kind_from_name('A.JAR') == 'zip'
+        assert kind_from_name('a.egg') == 'zip'
+        assert kind_from_name('a.ear') == 'zip'
+        assert kind_from_name('a.tgz') == 'tar.gz'
+        assert kind_from_name('blob') is None
+        assert sniff(ear) == 'zip'
+        assert sniff(blob) == 'tar.gz'
+        assert sniff(self.rpm) is None
+        open(self.rpm, 'wb').write(make_rpm(make_cpio(self.entries), 'gzip'))
+        assert sniff(self.rpm) == 'rpm'
+        assert sniff(text) is None
+        assert sniff(os.path.join(self.root, 'missing')) is None
+        f_obj = StringIO(open(blob, 'rb').read())
+        assert sniff(f_obj) == 'tar.gz'
+        assert f_obj.tell() == 0
+
+        assert Archive(ear).file_list == ['lib/a.jar']
+        assert Archive(blob).file_list == ['b.jar']
+        assert not Archive(text).handleable
+
+        data, formats = PackageFinder(look_inside=True)(self.root)
+        assert 'app.ear' not in [x.name for x in data]
+        data, formats = PackageFinder(look_inside=True, sniff=True)(
+            self.root)
+        assert set(x.name for x in data) == set([
+            'app.ear', 'lib/a.jar', 'blob', 'b.jar', 'test.rpm',
+            './usr/share/java/a.jar', './usr/share/java/b.jar'])
+        assert 'JAR' in formats and 'TAR.GZ' in formats
+        # A sniffed zip could be an egg as well as a jar
+        assert 'EGG' in formats
@@ -0,0 +1,116 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Unittest for the benchmark suite and its corpora.
+"""
+
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+BENCHMARKS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'benchmarks')
+
+
+class TestBenchmarks(unittest.TestCase):
+    """
+    Unittests for the benchmark suite.
+    """
+
+    def setUp(self):
+        """
+        Import the suite and build the tiny corpus.
+        """
+        sys.path.insert(0, BENCHMARKS)
+        try:
+            import bench_suite
+            import corpus
+        finally:
+            sys.path.remove(BENCHMARKS)
+        self.suite = bench_suite
+        self.corpus = corpus
+        self.root = tempfile.mkdtemp()
+        self.description = corpus.build(self.root, 'tiny')
+
+    def tearDown(self):
+        """
+        Remove the corpus.
+        """
+        shutil.rmtree(self.root)
+
+    def digest(self, path):
+        """
+        Returns the sha1 of a file.
+        """
+        return hashlib.sha1(open(path, 'rb').read()).hexdigest()
+
+    def test_corpus(self):
+        """
+        Verify corpora come out the same every time and are reused.
+        """
+        description = self.description
+        params = self.corpus.SCALES['tiny']
+        assert description['tree_files'] == params['files_per_dir'] * 7
+        assert description['tree_packages'] > 0
+        other = tempfile.mkdtemp()
+        try:
+            again = self.corpus.build(other, 'tiny')
+            for key in ('jar', 'war', 'tarball'):
+                assert self.digest(description[key]) == self.digest(
+                    again[key])
+        finally:
+            shutil.rmtree(other)
+
+        mtime = os.path.getmtime(description['war'])
+        assert self.corpus.build(self.root, 'tiny') == description
+        assert os.path.getmtime(description['war']) == mtime
+
+    def test_cases(self):
+        """
+        Make sure the cases measure what the corpus holds.
+        """
+        description = self.description
+        params = description['params']
+        find = self.suite.case_find(description)
+        assert find['packages'] == description['tree_packages']
+        members = self.suite.case_members(description)
+        assert members['members'] == params['jar_members'] + 1
+        nested = self.suite.case_nested(description)
+        # The war and the jars inside of it, classes are not packages
+        assert nested['packages'] == 1 + params['war_jars']
+        lookups = self.suite.case_lookup_lite(description)
+        assert lookups['lookups'] == params['lookups'] * 2
+        assert lookups['found'] == params['lookups'] + params['cvemap_rows']
+        assert lookups['p99_ms'] >= lookups['p50_ms'] > 0
+
+    def test_compare(self):
+        """
+        Verify only metrics getting worse past the threshold regress.
+        """
+        baseline = {'cases': {'hash': {
+            'mb_per_sec': 100.0, 'seconds': 1.0, 'peak_rss_kb': 1000,
+            'members': 5}}}
+        current = {'cases': {
+            'hash': {'mb_per_sec': 85.0, 'seconds': 0.95,
+                     'peak_rss_kb': 1050, 'members': 7},
+            'new': {'seconds': 1.0}}}
+        rows = dict(((x[0], x[1]), x[4:]) for x in self.suite.compare(
+            baseline, current, 10.0))
+        assert sorted(rows) == [
+            ('hash', 'mb_per_sec'), ('hash', 'peak_rss_kb'),
+            ('hash', 'seconds')]
+        assert rows[('hash', 'mb_per_sec')] == (-15.0, True)
+        assert rows[('hash', 'peak_rss_kb')] == (-5.0, False)
+        assert round(rows[('hash', 'seconds')][0], 6) == 5.0
+        assert not rows[('hash', 'seconds')][1]
@@ -0,0 +1,164 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Unittest for the hash cache.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import sqlalchemy.event
+
+from StringIO import StringIO
+
+from victims.cache import HashCache, fingerprint
+from victims.db import CVEMap, CachedHash, Connection
+from victims.scanner import Scanner
+
+
+class CountingHasher(object):
+    """
+    Hasher which records how many times it was called.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, input):
+        self.calls += 1
+        if not getattr(input, 'read', False):
+            input = open(input, 'rb')
+        return hashlib.sha512(input.read()).hexdigest()
+
+
+class TestCache(unittest.TestCase):
+    """
+    Unittests for the HashCache.
+    """
+
+    def setUp(self):
+        """
+        Create an in-memory database and an old file for each test.
+        """
+        self.connection = Connection({
+            'database': {'url': 'sqlite://'},
+        })
+        self.hasher = CountingHasher()
+        self.paths = []
+        for x in range(3):
+            fd, path = tempfile.mkstemp()
+            os.write(fd, 'data%d' % x)
+            os.close(fd)
+            # Make the files look old enough to be cached
+            os.utime(path, (1000000000, 1000000000 + x))
+            self.paths.append(path)
+
+    def tearDown(self):
+        """
+        Remove the temporary files.
+        """
+        for path in self.paths:
+            os.unlink(path)
+        del self.connection
+
+    def test_hits_skip_hashing(self):
+        """
+        Verify unchanged files are only hashed once, even across instances.
+        """
+        cache = HashCache(self.connection, self.hasher)
+        expected = hashlib.sha512('data0').hexdigest()
+        assert cache(self.paths[0]) == expected
+        assert cache(self.paths[0]) == expected
+        assert self.hasher.calls == 1
+        cache.flush()
+
+        cache = HashCache(self.connection, self.hasher)
+        assert cache(self.paths[0]) == expected
+        assert self.hasher.calls == 1
+        assert (cache.hits, cache.misses) == (1, 0)
+
+        # File objects are always hashed
+        cache(StringIO('data0'))
+        assert self.hasher.calls == 2
+
+    def test_changed_file_is_rehashed(self):
+        """
+        Make sure a change to the fingerprint invalidates the digest.
+        """
+        cache = HashCache(self.connection, self.hasher)
+        cache(self.paths[0])
+        cache.flush()
+        open(self.paths[0], 'wb').write('changed')
+        os.utime(self.paths[0], (1000000000, 1000000100))
+        assert cache(self.paths[0]) == hashlib.sha512('changed').hexdigest()
+        assert self.hasher.calls == 2
+
+    def test_recent_files_are_not_cached(self):
+        """
+        Files modified within the mtime resolution are never trusted.
+        """
+        os.utime(self.paths[0], None)
+        cache = HashCache(self.connection, self.hasher)
+        cache(self.paths[0])
+        cache(self.paths[0])
+        assert self.hasher.calls == 2
+
+    def test_read_only_database(self):
+        """
+        Make sure scans against a database which can not be written to
+        still report their findings, warning once that nothing is cached.
+        """
+        root = tempfile.mkdtemp()
+        try:
+            conf = {'database': {
+                'url': 'sqlite:///' + os.path.join(root, 'test.db')}}
+            connection = Connection(conf)
+            bad = hashlib.sha512('data1').hexdigest()
+            connection.session.add(CVEMap(
+                bad, 'bad', '1.0', 'vendor', 'CVE-1-1', 1, 'JAR'))
+            connection.session.flush()
+            for x, path in enumerate(self.paths):
+                shutil.copy(path, os.path.join(root, '%d.jar' % x))
+                os.utime(os.path.join(root, '%d.jar' % x), (
+                    1000000000, 1000000000))
+
+            def read_only(dbapi_connection, record):
+                dbapi_connection.execute('PRAGMA query_only = 1')
+
+            sqlalchemy.event.listen(connection.engine, 'connect', read_only)
+            scanner = Scanner(conf, connection)
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                for x in range(2):
+                    found = list(scanner.scan([root], scanner.finder()))
+                    assert [y[1].hash for y in found] == [bad]
+            assert len(caught) == 1
+            assert 'can not be written' in str(caught[0].message)
+        finally:
+            shutil.rmtree(root)
+
+    def test_eviction_and_clear(self):
+        """
+        Verify the cache is bounded and can be cleared.
+        """
+        query = self.connection.session.query(CachedHash)
+        cache = HashCache(self.connection, self.hasher, max_entries=2)
+        for path in self.paths:
+            cache(path)
+            cache.flush()
+        assert query.count() == 2
+        assert query.filter(
+            CachedHash.inode == fingerprint(self.paths[0])[1]).count() == 0
+        cache.clear()
+        assert query.count() == 0
@@ -58,3 +58,5 @@ class TestConfig(unittest.TestCase):
             'http://victi.ms/service/v1/update/')
         assert conf['service']['removeurl'] == (
             'http://victi.ms/service/v1/remove/')
+
+        assert conf['scan']['chunk_size'] == '65536'
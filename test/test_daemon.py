@@ -0,0 +1,185 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Unittest for the scan daemon.
+"""
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from argparse import Namespace
+from StringIO import StringIO
+
+from victims import HashGenerator
+from victims.daemon import (
+    DEFAULT_TIMEOUT, DaemonError, ScanServer, ping, request, scan, stats)
+from victims.db import CVEMap
+from victims.report import REPORTERS
+from victims.scanner import Scanner
+from victims.scripts import _get_daemon_timeout
+from victims.scripts.scan_packages import _scan_with_daemon
+
+
+class TestDaemon(unittest.TestCase):
+    """
+    Unittests for the daemon and its client.
+    """
+
+    def setUp(self):
+        """
+        Start a daemon on a temporary socket with a database holding one
+        vulnerable package.
+        """
+        self.root = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.root, 'daemon.sock')
+        self.conf = {
+            'database': {
+                'url': 'sqlite:///' + os.path.join(self.root, 'test.db'),
+            },
+            'scan': {'batch_size': '2'},
+        }
+        self.scanner = Scanner(self.conf)
+
+        self.packages = os.path.join(self.root, 'packages')
+        os.mkdir(self.packages)
+        for name in ('bad.jar', 'good.jar', 'copy.jar'):
+            open(os.path.join(self.packages, name), 'wb').write(
+                name.startswith('good') and 'good' or 'bad')
+        self.bad_hash = HashGenerator()(
+            os.path.join(self.packages, 'bad.jar'))
+        session = self.scanner.connection.session
+        session.add(CVEMap(
+            self.bad_hash, 'bad', '1.0', 'vendor', 'CVE-1-1,CVE-2-2', 1,
+            'JAR'))
+        session.flush()
+
+        self.server = ScanServer(self.socket_path, self.scanner)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        """
+        Stop the daemon and remove the temporary directory.
+        """
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.root)
+
+    def test_scan(self):
+        """
+        Verify scans are answered over the socket.
+        """
+        assert ping(self.socket_path)
+        response = scan(self.socket_path, [self.packages])
+        assert response['scanned'] == 3
+        assert response['skipped'] == []
+        assert sorted(x['package'] for x in response['matches']) == [
+            os.path.join(self.packages, 'bad.jar'),
+            os.path.join(self.packages, 'copy.jar')]
+        for match in response['matches']:
+            assert match['hash'] == self.bad_hash
+            assert match['cves'] == ['CVE-1-1', 'CVE-2-2']
+        # The cache made by the first scan is used by the next
+        response = scan(self.socket_path, [self.packages])
+        assert response['scanned'] == 3
+        assert len(response['matches']) == 2
+
+    def test_stats(self):
+        """
+        Verify scans report their metrics and the daemon keeps a total.
+        """
+        stats(self.socket_path, reset=True)
+        response = scan(self.socket_path, [self.packages])
+        first = response['metrics']
+        assert first['counters']['packages_scanned'] == 3
+        # Just written files are never cached
+        assert first['counters']['cache_misses'] == 3
+        assert first['phases']['hash']['calls'] == 3
+        scan(self.socket_path, [self.packages])
+        total = stats(self.socket_path, reset=True)
+        assert total['counters']['packages_scanned'] == 6
+        assert total['phases']['db_lookup']['calls'] == (
+            2 * first['phases']['db_lookup']['calls'])
+        assert total['counters']['db_queries'] == (
+            2 * first['counters']['db_queries'])
+        assert stats(self.socket_path)['counters'] == {}
+
+    def test_errors(self):
+        """
+        Make sure bad requests are reported without stopping the daemon.
+        """
+        self.assertRaises(
+            DaemonError, request, self.socket_path, {'command': 'nope'})
+        self.assertRaises(
+            DaemonError, request, self.socket_path,
+            {'command': 'scan', 'paths': [self.packages], 'walker': 'nope'})
+        assert ping(self.socket_path)
+        missing = os.path.join(self.root, 'missing.sock')
+        assert not ping(missing)
+        self.assertRaises(DaemonError, scan, missing, [self.packages])
+
+    def test_timeout(self):
+        """
+        Make sure a daemon which takes requests but never answers gives up
+        with a DaemonError.
+        """
+        stuck = os.path.join(self.root, 'stuck.sock')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(stuck)
+            # Connections are queued but never accepted
+            sock.listen(1)
+            self.assertRaises(
+                DaemonError, scan, stuck, [self.packages], timeout=0.1)
+            assert not ping(stuck, timeout=0.1)
+            # victims-scan then scans by itself
+            args = Namespace(
+                socket=stuck, paths=[self.packages], look_inside=False,
+                depth=1, sniff=False, walker='os', no_dedup=False)
+            conf = {'daemon': {'timeout': '0.1'}}
+            assert _scan_with_daemon(
+                args, conf, REPORTERS['json'](StringIO(), conf)) is None
+        finally:
+            sock.close()
+        assert _get_daemon_timeout(conf) == 0.1
+        assert _get_daemon_timeout({}) == DEFAULT_TIMEOUT
+
+    def test_socket(self):
+        """
+        Verify a live or busy socket is never replaced but a stale one is.
+        """
+        self.assertRaises(
+            DaemonError, ScanServer, self.socket_path, self.scanner)
+        assert oct(os.stat(self.socket_path).st_mode & 0777) == '0600'
+
+        # A daemon busy with a scan takes connections but does not answer
+        busy = os.path.join(self.root, 'busy.sock')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(busy)
+            sock.listen(1)
+            assert not ping(busy, timeout=0.1)
+            self.assertRaises(DaemonError, ScanServer, busy, self.scanner)
+            assert os.path.exists(busy)
+        finally:
+            sock.close()
+
+        stale = os.path.join(self.root, 'stale.sock')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(stale)
+        sock.close()
+        server = ScanServer(stale, self.scanner)
+        server.server_close()
+        assert not os.path.exists(stale)
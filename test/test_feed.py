@@ -0,0 +1,69 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Unittest for reading update feeds.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from StringIO import StringIO
+
+from victims.feed import iter_fields, iter_records
+
+
+class TestFeed(unittest.TestCase):
+    """
+    Unittests for the feed reader.
+    """
+
+    records = [{
+        'pk': x,
+        'model': 'hashes.hash',
+        'fields': {
+            'hash': 'hash%d' % x,
+            'name': u'n\u00e4me, with [brackets] and {braces}',
+            'cves': 'CVE-1969-000%d' % x,
+        },
+    } for x in range(20)]
+
+    def test_iter_records(self):
+        """
+        Verify records are parsed the same no matter how data arrives.
+        """
+        data = json.dumps(self.records, indent=1)
+        for chunk_size in (1, 2, 7, 100, len(data)):
+            assert list(iter_records(StringIO(data), chunk_size)) == (
+                self.records)
+        assert list(iter_records(StringIO(' [ ] '))) == []
+
+    def test_bad_feeds(self):
+        """
+        Make sure broken feeds raise instead of silently stopping.
+        """
+        for data in ('', '{"a": 1}', '[{"a": 1}', '[{"a": 1},', '[{"a": }]'):
+            self.assertRaises(
+                ValueError, list, iter_records(StringIO(data), 3))
+
+    def test_iter_fields(self):
+        """
+        Verify local files are accepted as a feed source.
+        """
+        fd, path = tempfile.mkstemp()
+        os.write(fd, json.dumps(self.records))
+        os.close(fd)
+        try:
+            expected = [x['fields'] for x in self.records]
+            assert list(iter_fields(path)) == expected
+            assert list(iter_fields('file://' + path)) == expected
+        finally:
+            os.unlink(path)
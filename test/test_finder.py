@@ -0,0 +1,222 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Unittest for finding packages.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import types
+import unittest
+import zipfile
+
+from StringIO import StringIO
+
+from victims import PackageFinder
+from victims.metrics import METRICS
+
+
+class TestPackageFinder(unittest.TestCase):
+    """
+    Unittests for the PackageFinder.
+    """
+
+    def setUp(self):
+        """
+        Create a directory with a jar, an rpm and a war holding a jar.
+        """
+        self.root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root, 'lib'))
+        jar = zipfile.ZipFile(os.path.join(self.root, 'lib', 'a.jar'), 'w')
+        jar.writestr('META-INF/MANIFEST.MF', 'a')
+        jar.close()
+        war = zipfile.ZipFile(os.path.join(self.root, 'app.war'), 'w')
+        war.writestr('WEB-INF/lib/b.jar', 'b')
+        war.writestr('index.html', 'hello')
+        war.close()
+        open(os.path.join(self.root, 'notes.txt'), 'w').close()
+
+    def tearDown(self):
+        """
+        Remove the temporary directory.
+        """
+        shutil.rmtree(self.root)
+
+    def test_call(self):
+        """
+        Verify calling the finder returns every package and their formats.
+        """
+        data, formats = PackageFinder(look_inside=True)(self.root)
+        assert sorted(str(x) for x in data) == sorted([
+            os.path.join(os.path.realpath(self.root), 'lib', 'a.jar'),
+            os.path.join(os.path.realpath(self.root), 'app.war'),
+            'WEB-INF/lib/b.jar (inside %s)' % os.path.join(
+                os.path.realpath(self.root), 'app.war')])
+        assert sorted(formats) == ['JAR', 'WAR']
+
+        data, formats = PackageFinder()(
+            os.path.join(self.root, 'lib', 'a.jar'))
+        assert len(data) == 1
+        assert formats == ['JAR']
+
+    def test_iter(self):
+        """
+        Make sure iter is lazy and collects formats as it goes.
+        """
+        finder = PackageFinder(look_inside=True)
+        packages = finder.iter(self.root)
+        assert isinstance(packages, types.GeneratorType)
+        assert finder.formats == []
+        found = list(packages)
+        assert len(found) == 3
+        assert finder.formats == ['JAR', 'WAR']
+
+    def _nested(self):
+        """
+        Writes a zip holding a war holding a jar and returns its path.
+        """
+        inner = StringIO()
+        jar = zipfile.ZipFile(inner, 'w')
+        jar.writestr('META-INF/MANIFEST.MF', 'inner')
+        jar.close()
+        middle = StringIO()
+        war = zipfile.ZipFile(middle, 'w')
+        war.writestr('WEB-INF/lib/inner.jar', inner.getvalue())
+        war.close()
+        path = os.path.join(self.root, 'bundle.zip')
+        outer = zipfile.ZipFile(path, 'w')
+        outer.writestr('app.war', middle.getvalue())
+        outer.close()
+        return (path, middle.getvalue(), inner.getvalue())
+
+    def test_depth(self):
+        """
+        Verify nested packages are found and hashed down to the depth.
+        """
+        path, war, jar = self._nested()
+        data, formats = PackageFinder(look_inside=True)(path)
+        assert [x.name for x in data] == [path, 'app.war']
+        assert data[1].digests is None
+
+        finder = PackageFinder(look_inside=True, depth=3)
+        data, formats = finder(path)
+        assert [str(x) for x in data] == [
+            path, 'app.war (inside %s)' % path,
+            'WEB-INF/lib/inner.jar (inside %s!/app.war)' % path]
+        assert data[1].digests.sha512 == hashlib.sha512(war).hexdigest()
+        assert data[2].digests.sha512 == hashlib.sha512(jar).hexdigest()
+        assert finder.skipped == []
+
+        data, formats = PackageFinder(look_inside=True, depth=2)(path)
+        assert len(data) == 3
+
+    def test_limits(self):
+        """
+        Make sure size and ratio limits stop looking inside of packages.
+        """
+        path, war, jar = self._nested()
+        finder = PackageFinder(look_inside=True, depth=3, max_member_size=10)
+        data, formats = finder(path)
+        assert len(data) == 2
+        assert data[1].digests.sha512 == hashlib.sha512(war).hexdigest()
+        assert finder.skipped == [(path + '!/app.war', (
+            'too large to look inside of'))]
+
+        bomb = os.path.join(self.root, 'bomb.zip')
+        archive = zipfile.ZipFile(bomb, 'w', zipfile.ZIP_DEFLATED)
+        archive.writestr('big.jar', '\0' * 10 * 1024 * 1024)
+        archive.close()
+        finder = PackageFinder(look_inside=True, depth=2, max_ratio=10)
+        data, formats = finder(bomb)
+        assert len(data) == 1
+        assert len(finder.skipped) == 1
+        assert finder.skipped[0][0] == bomb
+
+    def test_chunk_size(self):
+        """
+        Verify packages inside of packages are read chunk_size bytes at a
+        time.
+        """
+        reads = []
+
+        class Member(StringIO):
+            def read(self, size=-1):
+                reads.append(size)
+                return StringIO.read(self, size)
+
+        finder = PackageFinder(chunk_size=1000)
+        assert finder.chunk_size == 1000
+        digests, data = finder._read_member(
+            Member('x' * 2500), 'a.war', 'b.jar', True, [10000])
+        assert data == 'x' * 2500
+        assert digests.sha512 == hashlib.sha512(data).hexdigest()
+        assert reads == [1000, 1000, 1000, 1000]
+
+    def _found(self, finder, path):
+        """
+        Returns the sorted (package, digest) of everything finder finds.
+        """
+        return sorted(
+            (str(x), x.digests and x.digests.sha512) for x in finder.iter(
+                path) if x.internal)
+
+    def test_dedup(self):
+        """
+        Verify copies of archives reuse what was found inside of the first
+        copy and find the same packages as looking inside of each one.
+        """
+        path, war, jar = self._nested()
+        shutil.copy(path, os.path.join(self.root, 'copy.zip'))
+        # The same war one level up is looked into one level further
+        shutil.copy(path, os.path.join(self.root, 'lib', 'again.zip'))
+        top = zipfile.ZipFile(os.path.join(self.root, 'top.zip'), 'w')
+        top.writestr('bundle.zip', open(path, 'rb').read())
+        top.writestr('app.war', war)
+        top.close()
+
+        for depth in (1, 2, 3):
+            expected = self._found(
+                PackageFinder(look_inside=True, depth=max(depth, 2)),
+                self.root)
+            if depth == 1:
+                expected = [x for x in expected if x[0].count('!/') == 0]
+            METRICS.reset()
+            finder = PackageFinder(look_inside=True, depth=depth, dedup=True)
+            assert self._found(finder, self.root) == expected
+            # bundle.zip, copy.zip and again.zip have the same contents
+            assert METRICS.counters['copies_reused'] >= 2
+            assert finder.skipped == []
+
+        # What was not looked inside of is reported for every copy
+        METRICS.reset()
+        expected = PackageFinder(
+            look_inside=True, depth=3, max_member_size=200)
+        list(expected.iter(self.root))
+        finder = PackageFinder(
+            look_inside=True, depth=3, dedup=True, max_member_size=200)
+        list(finder.iter(self.root))
+        assert len(finder.skipped) == 5
+        assert sorted(finder.skipped) == sorted(expected.skipped)
+        METRICS.reset()
+
+    def test_dedup_memo_size(self):
+        """
+        Make sure no more archives are remembered than memo_size.
+        """
+        path, war, jar = self._nested()
+        shutil.copy(path, os.path.join(self.root, 'copy.zip'))
+        METRICS.reset()
+        finder = PackageFinder(
+            look_inside=True, depth=3, dedup=True, memo_size=0)
+        list(finder.iter(self.root))
+        assert 'copies_reused' not in METRICS.counters
+        METRICS.reset()
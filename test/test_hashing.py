@@ -0,0 +1,116 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Unittest for hashing.
+"""
+
+import hashlib
+import os
+import tempfile
+import unittest
+
+from StringIO import StringIO
+
+from victims import (
+    HashGenerator, MultiHashGenerator, Digests, read_chunks)
+from victims.scanner import Scanner
+
+
+class TestHashing(unittest.TestCase):
+    """
+    Unittests for the HashGenerator.
+    """
+
+    data = os.urandom(100000)
+
+    def setUp(self):
+        """
+        Write the test data out to a temporary file.
+        """
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, self.data)
+        os.close(fd)
+
+    def tearDown(self):
+        """
+        Remove the temporary file.
+        """
+        os.unlink(self.path)
+
+    def test_hash_path_and_file_obj(self):
+        """
+        Verify paths and file like objects hash to the same digest.
+        """
+        expected = hashlib.sha512(self.data).hexdigest()
+        assert HashGenerator()(self.path) == expected
+        assert HashGenerator()(StringIO(self.data)) == expected
+        assert HashGenerator()(open(self.path, 'rb')) == expected
+
+    def test_chunk_sizes(self):
+        """
+        Make sure the chunk size does not change the digest.
+        """
+        expected = hashlib.md5(self.data).hexdigest()
+        for chunk_size in (1, 7, 4096, len(self.data), len(self.data) * 2):
+            hasher = HashGenerator(hashlib.md5, chunk_size)
+            assert hasher.chunk_size == chunk_size
+            assert hasher(self.path) == expected
+            assert hasher(StringIO(self.data)) == expected
+
+    def test_bad_chunk_sizes(self):
+        """
+        Make sure chunk sizes which would read nothing are refused.
+        """
+        for chunk_size in (0, -1):
+            self.assertRaises(
+                ValueError, HashGenerator, hashlib.md5, chunk_size)
+            self.assertRaises(
+                ValueError, MultiHashGenerator, ('md5', ), chunk_size)
+            self.assertRaises(
+                ValueError, list, read_chunks(StringIO(self.data), chunk_size))
+        conf = {'database': {'url': 'sqlite://'}, 'scan': {'chunk_size': '0'}}
+        try:
+            Scanner(conf, cache=False)
+        except ValueError, ve:
+            assert str(ve) == '[scan] chunk_size must be at least 1, not 0'
+        else:
+            self.fail('chunk_size 0 was accepted')
+
+    def test_read_chunks(self):
+        """
+        Verify chunks are bounded in size and cover all of the data.
+        """
+        for f_obj in (StringIO(self.data), open(self.path, 'rb')):
+            sizes = []
+            data = ''
+            for chunk in read_chunks(f_obj, 4096):
+                sizes.append(len(chunk))
+                data += chunk.tobytes() if hasattr(chunk, 'tobytes') else chunk
+            f_obj.close()
+            assert max(sizes) == 4096
+            assert data == self.data
+
+    def test_multi_hash(self):
+        """
+        Verify every digest is produced from one pass over the data.
+        """
+        hasher = MultiHashGenerator(chunk_size=1000)
+        assert hasher.algorithms == ('sha512', 'sha1', 'md5')
+        for input in (self.path, StringIO(self.data)):
+            digests = hasher(input)
+            assert isinstance(digests, Digests)
+            assert sorted(digests.keys()) == ['md5', 'sha1', 'sha512']
+            for name in hasher.algorithms:
+                expected = hashlib.new(name, self.data).hexdigest()
+                assert digests[name] == expected
+                assert getattr(digests, name) == expected
+        assert digests.sha512 == HashGenerator()(self.path)
+        self.assertRaises(AttributeError, getattr, digests, 'sha256')
+        self.assertRaises(ValueError, MultiHashGenerator, ['nothere'])
@@ -0,0 +1,136 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Unittest for the hash index.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from victims.db import CVEMap, Connection
+from victims.index import HEADER_SIZE, HashIndex
+from victims.scripts import _get_default_index_loc
+
+
+class TestHashIndex(unittest.TestCase):
+    """
+    Unittests for the HashIndex.
+    """
+
+    def setUp(self):
+        """
+        Create an in-memory database with a few hashes.
+        """
+        self.connection = Connection({'database': {'url': 'sqlite://'}})
+        self.hashes = [hashlib.sha512(str(x)).hexdigest() for x in range(50)]
+        for x, hash in enumerate(self.hashes):
+            self.connection.session.add(CVEMap(
+                hash, 'name', '1.0', 'vendor', 'CVE-1969-0000', x % 3,
+                x % 2 and 'JAR' or 'WAR'))
+        # Not a sha512, can never match
+        self.connection.session.add(CVEMap(
+            '1234', 'name', '1.0', 'vendor', 'CVE-1969-0000', 1, 'JAR'))
+        self.connection.session.flush()
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        Remove the temporary directory.
+        """
+        shutil.rmtree(self.tmp)
+
+    def test_load(self):
+        """
+        Verify membership tests against an index built from the database.
+        """
+        index = HashIndex.load(self.connection)
+        assert len(index) == 50
+        assert index.db_state == (2, 51)
+        for hash in self.hashes:
+            assert hash in index
+            assert hash.upper() in index
+        missing = hashlib.sha512('missing').hexdigest()
+        assert missing not in index
+        assert '1234' not in index
+        assert 'not hex' not in index
+        assert list(index.filter([missing, self.hashes[3]])) == [
+            self.hashes[3]]
+
+        index = HashIndex.load(self.connection, ['JAR'])
+        assert len(index) == 25
+        assert self.hashes[1] in index
+        assert self.hashes[0] not in index
+
+    def test_save_and_cached(self):
+        """
+        Make sure saved indexes are mapped back and rebuilt when stale.
+        """
+        path = os.path.join(self.tmp, 'cvemap.idx')
+        index = HashIndex.cached(self.connection, path)
+        assert os.path.isfile(path)
+        assert os.path.getsize(path) == HEADER_SIZE + 50 * 64
+
+        index = HashIndex.open(path)
+        assert len(index) == 50
+        assert all(hash in index for hash in self.hashes)
+
+        new_hash = hashlib.sha512('new').hexdigest()
+        self.connection.session.add(CVEMap(
+            new_hash, 'name', '1.0', 'vendor', 'CVE-1969-0000', 3, 'JAR'))
+        self.connection.session.flush()
+        index = HashIndex.cached(self.connection, path)
+        assert new_hash in index
+        assert HashIndex.open(path).db_state == (3, 52)
+
+        open(path, 'wb').write('garbage')
+        self.assertRaises(ValueError, HashIndex.open, path)
+        assert len(HashIndex.cached(self.connection, path)) == 51
+
+    def test_stale(self):
+        """
+        Verify an index is stale for another database in the same state and
+        after rows are replaced without changing the count or the newest
+        update.
+        """
+        path = os.path.join(self.tmp, 'cvemap.idx')
+        index = HashIndex.cached(self.connection, path)
+        assert not index.stale(self.connection)
+
+        url = 'sqlite:///' + os.path.join(self.tmp, 'other.db')
+        other = Connection({'database': {'url': url}})
+        for x, hash in enumerate(self.hashes):
+            other.session.add(CVEMap(
+                hashlib.sha512(hash).hexdigest(), 'name', '1.0', 'vendor',
+                'CVE-1969-0000', x % 3, 'JAR'))
+        other.session.add(CVEMap(
+            '1234', 'name', '1.0', 'vendor', 'CVE-1969-0000', 1, 'JAR'))
+        other.session.flush()
+        assert other.db_state() == self.connection.db_state()
+        assert index.stale(other)
+        assert self.hashes[0] not in HashIndex.cached(other, path)
+
+        # An update replacing a row of update 0 with one of update 1
+        self.connection.remove_hashes([self.hashes[0]])
+        self.connection.session.add(CVEMap(
+            hashlib.sha512('new').hexdigest(), 'name', '1.0', 'vendor',
+            'CVE-1969-0000', 1, 'JAR'))
+        self.connection.session.flush()
+        assert self.connection.db_state() == index.db_state
+        assert index.stale(self.connection)
+
+        # Each database gets its own index by default
+        assert _get_default_index_loc(url) != _get_default_index_loc(
+            'sqlite://')
+        assert _get_default_index_loc(url) == _get_default_index_loc(
+            'sqlite:///' + os.path.relpath(
+                os.path.join(self.tmp, 'other.db')))
@@ -0,0 +1,277 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Unittest for incremental scans.
+"""
+
+import os
+import shutil
+import tempfile
+import json
+import time
+import unittest
+import warnings
+import zipfile
+
+from victims import HashGenerator, Package
+from victims.manifest import Manifest
+from victims.metrics import METRICS
+from victims.scanner import Scanner
+
+
+class TestManifest(unittest.TestCase):
+    """
+    Unittests for scans reusing the manifest of an earlier scan.
+    """
+
+    def setUp(self):
+        """
+        Create packages old enough to be remembered and a database with a
+        row for one of them.
+        """
+        self.root = tempfile.mkdtemp()
+        self.state = os.path.join(self.root, 'state.json')
+        self.conf = {
+            'database': {
+                'url': 'sqlite:///' + os.path.join(self.root, 'test.db'),
+            },
+        }
+        self.packages = os.path.join(self.root, 'packages')
+        os.mkdir(self.packages)
+        self.write('bad.jar', 'bad')
+        self.write('good.jar', 'good')
+        outer = zipfile.ZipFile(self.path('outer.jar'), 'w')
+        outer.writestr('lib/inner.jar', 'inner')
+        outer.close()
+        self.age('outer.jar')
+        hasher = HashGenerator()
+        self.bad_hash = hasher(self.path('bad.jar'))
+        self.good_hash = hasher(self.path('good.jar'))
+        inner = os.path.join(self.root, 'inner.jar')
+        open(inner, 'wb').write('inner')
+        self.inner_hash = hasher(inner)
+        self.scanner = Scanner(self.conf, cache=False)
+        self.update(self.bad_hash, 1)
+
+    def tearDown(self):
+        """
+        Remove the temporary directory.
+        """
+        shutil.rmtree(self.root)
+
+    def path(self, name):
+        """
+        Returns the path of a package.
+        """
+        return os.path.join(self.packages, name)
+
+    def age(self, name):
+        """
+        Makes a package look modified long ago.
+        """
+        old = time.time() - 3600
+        os.utime(self.path(name), (old, old))
+
+    def write(self, name, data):
+        """
+        Writes a package holding data, modified long ago.
+        """
+        package = zipfile.ZipFile(self.path(name), 'w')
+        package.writestr(zipfile.ZipInfo('data', (2013, 1, 1, 0, 0, 0)), data)
+        package.close()
+        self.age(name)
+
+    def update(self, hash, db_version, cves='CVE-1-1'):
+        """
+        Writes a cvemap row as an update of the database would.
+        """
+        self.scanner.connection.update_cvemap([{
+            'hash': hash, 'name': 'pkg', 'version': '1.0',
+            'vendor': 'vendor', 'cves': cves, 'db_version': db_version,
+            'format': 'JAR'}])
+
+    def scan(self, scanner=None):
+        """
+        Scans the packages with the saved manifest, saving it again.
+        Returns ({(path, hash)}, counters of the scan).
+        """
+        scanner = scanner or self.scanner
+        METRICS.reset()
+        manifest = Manifest(self.state, {'look_inside': True})
+        finder = scanner.finder(look_inside=True, manifest=manifest)
+        found = set(
+            (x.path or x.parent, y.hash) for x, y in scanner.scan(
+                [self.packages], finder, manifest))
+        manifest.save()
+        return (found, METRICS.counters)
+
+    def test_unchanged(self):
+        """
+        Verify unchanged packages are neither hashed nor looked up again
+        while every finding is still reported.
+        """
+        first, counters = self.scan()
+        assert first == set([(self.path('bad.jar'), self.bad_hash)])
+        # The jar inside of outer.jar is hashed too
+        assert counters['files_hashed'] == 4
+        assert 'files_unchanged' not in counters
+        again, counters = self.scan()
+        assert again == first
+        assert counters['files_unchanged'] == 3
+        assert 'files_hashed' not in counters
+        assert 'db_queries' not in counters
+
+    def test_parallel(self):
+        """
+        Verify new and changed packages are hashed in the worker pool.
+        """
+        scanner = Scanner(self.conf, cache=False, jobs=2)
+        first, counters = self.scan(scanner)
+        assert first == set([(self.path('bad.jar'), self.bad_hash)])
+        # A task per file on disk and one for the jar in outer.jar
+        assert counters['pool_tasks'] == 4
+        self.write('good.jar', 'bad')
+        found, counters = self.scan(scanner)
+        assert found == set([
+            (self.path('bad.jar'), self.bad_hash),
+            (self.path('good.jar'), self.bad_hash)])
+        assert counters['pool_tasks'] == 1
+        assert counters['files_unchanged'] == 2
+        # What the pool hashed was saved as well
+        again, counters = self.scan(scanner)
+        assert again == found
+        assert counters['files_unchanged'] == 3
+        assert 'pool_tasks' not in counters
+        state = Manifest(self.state, {'look_inside': True})
+        assert state.checked(self.inner_hash)
+
+    def test_changed(self):
+        """
+        Verify new and changed packages are hashed and removed ones drop
+        out of the manifest.
+        """
+        self.scan()
+        self.write('good.jar', 'bad')
+        self.write('new.jar', 'new')
+        os.remove(self.path('outer.jar'))
+        found, counters = self.scan()
+        assert found == set([
+            (self.path('bad.jar'), self.bad_hash),
+            (self.path('good.jar'), self.bad_hash)])
+        assert counters['files_hashed'] == 2
+        assert counters['files_unchanged'] == 1
+        state = Manifest(self.state, {'look_inside': True})
+        assert state.known(self.path('outer.jar'), (0, 0, 0, 0)) is None
+        assert state.checked(self.bad_hash)
+        assert not state.checked(self.inner_hash)
+
+    def test_database_updated(self):
+        """
+        Verify rows written by an update match unchanged packages.
+        """
+        self.scan()
+        self.update(self.inner_hash, 2)
+        self.update(self.good_hash, 2, cves='CVE-3-3')
+        found, counters = self.scan()
+        assert found == set([
+            (self.path('bad.jar'), self.bad_hash),
+            (self.path('good.jar'), self.good_hash),
+            (self.path('outer.jar'), self.inner_hash)])
+        assert 'files_hashed' not in counters
+        # The rows written since and the hashes which matched before
+        assert counters['db_queries'] == 2
+
+    def test_database_rows_removed(self):
+        """
+        Verify removed rows no longer match unchanged packages.
+        """
+        self.update(self.good_hash, 1)
+        first, counters = self.scan()
+        assert len(first) == 2
+        self.scanner.connection.remove_hashes([self.good_hash])
+        found, counters = self.scan()
+        assert found == set([(self.path('bad.jar'), self.bad_hash)])
+        assert 'files_hashed' not in counters
+
+    def test_hashed(self):
+        """
+        Verify digests handed in after the finder moved on are recorded
+        with the package on disk holding them.
+        """
+        manifest = Manifest(self.state)
+        path = self.path('outer.jar')
+        old = (1, 2, 3, time.time() - 3600)
+        manifest.seen(path, old)
+        manifest.seen(self.path('new.jar'), (1, 3, 3, time.time()))
+        manifest.seen(self.path('lost.jar'), old)
+        manifest.hashed(Package('outer.jar', path), 'outer')
+        manifest.hashed(Package('a.war', None, path), 'war')
+        manifest.hashed(Package('b.jar', None, path + '!/a.war'), 'jar')
+        manifest.hashed(Package('new.jar', self.path('new.jar')), 'new')
+        manifest.skipped(path, [('!/a.war!/c.jar', 'too large')])
+        manifest.save()
+        manifest = Manifest(self.state)
+        assert manifest.known(path, old) == ('outer', [
+            ['a.war', '', 'war'], ['b.jar', '!/a.war', 'jar']], [
+            ['!/a.war!/c.jar', 'too large']])
+        # Just modified and never hashed packages are read next time
+        assert manifest.known(self.path('new.jar'), old) is None
+        assert manifest.known(self.path('lost.jar'), old) is None
+
+    def test_broken(self):
+        """
+        Verify a manifest which can not be used is ignored with a warning.
+        """
+        self.scan()
+        good = json.load(open(self.state))
+        broken = [
+            'not json',
+            [],
+            dict(good, files=None),
+            dict(good, files={self.path('bad.jar'): [[0, 0], 'x', [], []]}),
+            dict(good, findings={'x': [[1, 2]]}),
+        ]
+        del good['files']
+        broken.append(good)
+        for state in broken:
+            with open(self.state, 'w') as out:
+                if isinstance(state, str):
+                    out.write(state)
+                else:
+                    json.dump(state, out)
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                manifest = Manifest(self.state, {'look_inside': True})
+            assert len(caught) == 1
+            assert 'manifest' in str(caught[0].message)
+            assert manifest.previous_db_state is None
+            assert not manifest.checked(self.bad_hash)
+        # Without a state file there is simply nothing to reuse
+        os.remove(self.state)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            found, counters = self.scan()
+        assert not caught
+        assert found == set([(self.path('bad.jar'), self.bad_hash)])
+
+    def test_options_changed(self):
+        """
+        Verify a manifest made with other options is not used.
+        """
+        self.scan()
+        manifest = Manifest(self.state, {'look_inside': False})
+        assert manifest.previous_db_state is None
+        assert manifest.known(
+            self.path('bad.jar'), os.stat(self.path('bad.jar'))) is None
+        assert not manifest.checked(self.bad_hash)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Unittest for scan metrics.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import zipfile
+
+from StringIO import StringIO
+
+from victims import PackageFinder, HashGenerator, update_hashes
+from victims.metrics import METRICS, Metrics, report
+from victims.parallel import ParallelHasher
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Unittests for the metrics and what scanning records into them.
+    """
+
+    def setUp(self):
+        """
+        Create a zip holding a jar and start counting from nothing.
+        """
+        self.root = tempfile.mkdtemp()
+        self.zip_path = os.path.join(self.root, 'outer.zip')
+        zf = zipfile.ZipFile(self.zip_path, 'w')
+        zf.writestr('lib/inner.jar', 'x' * 100)
+        zf.writestr('README', 'readme')
+        zf.close()
+        METRICS.reset()
+
+    def tearDown(self):
+        """
+        Remove the temporary directory.
+        """
+        shutil.rmtree(self.root)
+        METRICS.reset()
+
+    def test_metrics(self):
+        """
+        Verify counting, timing, merging and differences of snapshots.
+        """
+        metrics = Metrics()
+        metrics.count('files_hashed')
+        metrics.count('bytes_hashed', 10)
+        with metrics.phase('hash'):
+            pass
+        try:
+            with metrics.phase('hash'):
+                raise ValueError('timed anyway')
+        except ValueError:
+            pass
+        before = metrics.snapshot()
+        assert before['counters'] == {'files_hashed': 1, 'bytes_hashed': 10}
+        assert before['phases']['hash']['calls'] == 2
+        assert before['phases']['hash']['wall'] >= 0
+
+        metrics.merge(before)
+        metrics.count('db_queries')
+        assert metrics.counters['bytes_hashed'] == 20
+        assert metrics.since(before) == {
+            'counters': {'files_hashed': 1, 'bytes_hashed': 10,
+                         'db_queries': 1},
+            'phases': {'hash': metrics.since(before)['phases']['hash']}}
+        assert metrics.since(before)['phases']['hash']['calls'] == 2
+
+        lines = metrics.report()
+        assert lines[0].split() == ['files_hashed', '2']
+        assert lines[1].split() == ['bytes_hashed', '20']
+        assert lines[-1].split()[:2] == ['hash', '4']
+        assert report(metrics.snapshot()) == lines
+
+        metrics.reset()
+        assert metrics.snapshot() == {'counters': {}, 'phases': {}}
+
+    def test_scan(self):
+        """
+        Make sure looking inside of and hashing packages is recorded.
+        """
+        finder = PackageFinder(look_inside=True, depth=2)
+        hasher = HashGenerator()
+        for package in finder.iter(self.root):
+            if package.digests is None:
+                hasher(package.path)
+        counters = METRICS.counters
+        assert counters['archives_opened'] == 1
+        assert counters['members_visited'] == 1
+        assert counters['files_hashed'] == 2
+        assert counters['bytes_hashed'] == (
+            100 + os.path.getsize(self.zip_path))
+        phases = METRICS.snapshot()['phases']
+        assert phases['hash']['calls'] == 2
+        assert phases['walk']['calls'] >= 1
+        # Reading the jar out of the zip
+        assert phases['archive_read']['calls'] == 1
+
+    def test_archive_read(self):
+        """
+        Verify reading a member of an archive, such as decompressing the
+        payload of an rpm, is not timed as hashing.
+        """
+        class SlowMember(StringIO):
+            def read(self, size=-1):
+                time.sleep(0.05)
+                return StringIO.read(self, size)
+
+        update_hashes(SlowMember('x' * 10), [hashlib.sha1()], 4)
+        phases = METRICS.snapshot()['phases']
+        # Three chunks and the empty read ending them
+        assert phases['archive_read']['wall'] >= 0.2
+        assert phases['hash']['wall'] < 0.05
+        assert phases['archive_read']['calls'] == 1
+        assert phases['hash']['calls'] == 1
+
+    def test_parallel(self):
+        """
+        Verify what worker processes record reaches the parent.
+        """
+        finder = PackageFinder(look_inside=True)
+        list(ParallelHasher(2)(finder.iter(self.root)))
+        counters = METRICS.counters
+        assert counters['files_hashed'] == 2
+        assert counters['bytes_hashed'] == (
+            100 + os.path.getsize(self.zip_path))
+        # Opened once to find the member and once by the worker
+        assert counters['archives_opened'] == 2
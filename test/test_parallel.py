@@ -0,0 +1,136 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Unittest for parallel hashing.
+"""
+
+import os
+import shutil
+import signal
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from StringIO import StringIO
+
+from victims import HashGenerator, PackageFinder
+from victims.metrics import METRICS
+from victims import parallel
+from victims.parallel import ParallelHasher
+from victims.scanner import Scanner
+
+
+class TestParallel(unittest.TestCase):
+    """
+    Unittests for the ParallelHasher.
+    """
+
+    def setUp(self):
+        """
+        Create a directory with plain packages and a war with jars inside.
+        """
+        self.root = tempfile.mkdtemp()
+        for x in range(4):
+            jar = zipfile.ZipFile(os.path.join(self.root, '%d.jar' % x), 'w')
+            jar.writestr('META-INF/MANIFEST.MF', 'jar%d' % x)
+            jar.close()
+        war = zipfile.ZipFile(os.path.join(self.root, 'app.war'), 'w')
+        for x in range(3):
+            war.writestr('WEB-INF/lib/inner%d.jar' % x, 'inner%d' % x)
+        war.close()
+
+    def tearDown(self):
+        """
+        Remove the temporary directory.
+        """
+        shutil.rmtree(self.root)
+
+    def test_matches_serial_hashing(self):
+        """
+        Verify the pool produces the same digests as hashing in process.
+        """
+        data, formats = PackageFinder(look_inside=True)(self.root)
+        assert len(data) == 8
+        hashes = {}
+        for package, hash in ParallelHasher(3)(data):
+            hashes[id(package)] = hash
+        assert len(hashes) == len(data)
+
+        data, formats = PackageFinder(look_inside=True)(self.root)
+        expected = sorted(HashGenerator()(x.path) for x in data)
+        assert sorted(hashes.values()) == expected
+
+    def test_scanner_uses_pool(self):
+        """
+        Make sure scans looking inside of packages hash in the pool.
+        """
+        conf = {'database': {
+            'url': 'sqlite:///' + os.path.join(self.root, 'test.db')}}
+        scanner = Scanner(conf, cache=False, jobs=2)
+        METRICS.reset()
+        list(scanner.scan([self.root], scanner.finder(look_inside=True)))
+        assert scanner.scanned == 8
+        # A task per file on disk and one for the jars in the war
+        assert METRICS.counters['pool_tasks'] == 6
+        METRICS.reset()
+
+    def test_streamed_members(self):
+        """
+        Verify members of tarballs are hashed in the pass reading the
+        tarball rather than by workers reading it again.
+        """
+        path = os.path.join(self.root, 'lib.tar.gz')
+        tar = tarfile.open(path, 'w:gz')
+        for x in range(3):
+            info = tarfile.TarInfo('lib/inner%d.jar' % x)
+            info.size = 6
+            tar.addfile(info, StringIO('inner%d' % x))
+        tar.close()
+        METRICS.reset()
+        hashed = list(ParallelHasher(2)(
+            PackageFinder(look_inside=True).iter(path)))
+        assert [x[0].name for x in hashed][1:] == [
+            'lib/inner0.jar', 'lib/inner1.jar', 'lib/inner2.jar']
+        assert [x[1] for x in hashed][1:] == [
+            HashGenerator()(StringIO('inner%d' % x)) for x in range(3)]
+        # Only the tarball itself went to the pool
+        assert METRICS.counters['pool_tasks'] == 1
+        METRICS.reset()
+
+    def test_dead_worker(self):
+        """
+        Make sure a worker killed in the middle of a task ends the hashing
+        instead of waiting on it forever.
+        """
+        def killed(task):
+            os.kill(os.getpid(), signal.SIGKILL)
+
+        parallel._WORKERS['file'] = killed
+        try:
+            data = list(PackageFinder().iter(self.root))
+            try:
+                list(ParallelHasher(2)(data))
+            except Exception, ex:
+                assert 'worker process died' in str(ex)
+            else:
+                self.fail('Hashing went on without a worker')
+        finally:
+            parallel._WORKERS['file'] = parallel._hash_file
+
+    def test_streams_in_order(self):
+        """
+        Make sure packages come back in the order they went in.
+        """
+        finder = PackageFinder(look_inside=True)
+        data = list(finder.iter(self.root))
+        names = [str(x) for x in data]
+        hashed = ParallelHasher(2)(iter(data))
+        assert [str(package) for package, hash in hashed] == names
@@ -0,0 +1,152 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Unittest for scan reports.
+"""
+
+import json
+import unittest
+
+from StringIO import StringIO
+
+from victims import Package
+from victims.lite import CVERow
+from victims.report import (
+    GroupingReporter, JSONLinesReporter, JSONReporter, SARIFReporter,
+    TextReporter, finding, group_copies)
+
+
+class TestReport(unittest.TestCase):
+    """
+    Unittests for the report writers.
+    """
+
+    def setUp(self):
+        """
+        Make a finding on disk and one inside of a package.
+        """
+        self.records = [
+            finding(Package('a.jar', '/tmp/a b/a.jar'), CVERow(
+                'hash1', 'a', '1.0', 'vendor', 'CVE-1,CVE-2', 1, 'JAR')),
+            finding(Package('lib/b.jar', StringIO(), '/tmp/c.war!/x.jar'),
+                    CVERow('hash2', 'b', '2.0', 'vendor', 'CVE-2', 1, 'JAR')),
+        ]
+
+    def report(self, cls, records):
+        """
+        Returns what a reporter writes for records.
+
+        :Parameters:
+           - `cls`: the reporter class
+           - `records`: the findings to write
+        """
+        out = StringIO()
+        reporter = cls(out, {'cveurls': {'nvd': 'https://nvd/%s'}})
+        for record in records:
+            reporter.write(record)
+        reporter.finish(3, [('z.war', 'too large')])
+        return out.getvalue()
+
+    def test_finding(self):
+        """
+        Verify findings say where the package is and what affects it.
+        """
+        record = self.records[0]
+        assert record['path'] == '/tmp/a b/a.jar'
+        assert record['parent'] is None
+        assert record['cves'] == ['CVE-1', 'CVE-2']
+        assert (record['project'], record['version']) == ('a', '1.0')
+        record = self.records[1]
+        assert record['path'] == 'lib/b.jar'
+        assert record['parent'] == '/tmp/c.war!/x.jar'
+        assert record['package'] == 'lib/b.jar (inside /tmp/c.war!/x.jar)'
+        assert json.loads(json.dumps(record)) == record
+
+    def test_text(self):
+        """
+        Make sure the text report keeps the old layout.
+        """
+        assert self.report(TextReporter, self.records) == (
+            '/tmp/a b/a.jar: CVE-1,CVE-2\n'
+            '- nvd: https://nvd/CVE-1\n'
+            '- nvd: https://nvd/CVE-2\n'
+            'lib/b.jar (inside /tmp/c.war!/x.jar): CVE-2\n'
+            '- nvd: https://nvd/CVE-2\n'
+            'Scanned 3 packages\n')
+
+    def test_json(self):
+        """
+        Verify the json formats hold every finding.
+        """
+        lines = self.report(JSONLinesReporter, self.records).splitlines()
+        assert [json.loads(x) for x in lines] == self.records
+
+        for records in (self.records, []):
+            data = json.loads(self.report(JSONReporter, records))
+            assert data['findings'] == records
+            assert data['scanned'] == 3
+            assert data['skipped'] == [['z.war', 'too large']]
+
+    def test_sarif(self):
+        """
+        Make sure SARIF logs have a result per CVE of each finding.
+        """
+        data = json.loads(self.report(SARIFReporter, self.records))
+        assert data['version'] == '2.1.0'
+        run = data['runs'][0]
+        assert run['tool']['driver']['name'] == 'victims'
+        assert [x['ruleId'] for x in run['results']] == [
+            'CVE-1', 'CVE-2', 'CVE-2']
+        location = run['results'][0]['locations'][0]
+        assert location['physicalLocation']['artifactLocation'][
+            'uri'] == 'file:///tmp/a%20b/a.jar'
+        location = run['results'][2]['locations'][0]
+        assert location['physicalLocation']['artifactLocation'][
+            'uri'] == 'file:///tmp/c.war'
+        assert location['logicalLocations'][0]['fullyQualifiedName'] == (
+            '/tmp/c.war!/x.jar!/lib/b.jar')
+        assert run['properties']['scanned'] == 3
+
+        empty = dict(self.records[0], cves=[])
+        for records, results in (
+                ([], 0), ([empty], 0), ([empty, self.records[1]], 1)):
+            data = json.loads(self.report(SARIFReporter, records))
+            assert len(data['runs'][0]['results']) == results
+
+    def test_group_copies(self):
+        """
+        Verify copies of a package are reported once with the first.
+        """
+        copy = finding(Package('a.jar', '/tmp/d/a.jar'), CVERow(
+            'hash1', 'a', '1.0', 'vendor', 'CVE-1,CVE-2', 1, 'JAR'))
+        records = [self.records[0], self.records[1], copy]
+        grouped = group_copies(records)
+        assert [x['hash'] for x in grouped] == ['hash1', 'hash2']
+        assert grouped[0]['copies'] == ['/tmp/d/a.jar']
+        assert grouped[1]['copies'] == []
+        assert 'copies' not in self.records[0]
+
+        text = self.report(
+            lambda out, conf: GroupingReporter(TextReporter(out, conf)),
+            records)
+        assert text.startswith(
+            '/tmp/a b/a.jar: CVE-1,CVE-2\n'
+            '  copy: /tmp/d/a.jar\n'
+            '- nvd: https://nvd/CVE-1\n')
+        document = json.loads(self.report(
+            lambda out, conf: GroupingReporter(JSONReporter(out, conf)),
+            records))
+        assert document['findings'] == grouped
+        log = json.loads(self.report(
+            lambda out, conf: GroupingReporter(SARIFReporter(out, conf)),
+            records))
+        results = log['runs'][0]['results']
+        assert len(results) == 3
+        assert results[0]['properties']['copies'] == ['/tmp/d/a.jar']
@@ -0,0 +1,183 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Unittest for start up cost and the light weight read path.
+"""
+
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from StringIO import StringIO
+
+from victims.db import Base, Connection
+from victims.lite import (
+    CVERow, LiteConnection, SCHEMA_VERSION, open_reader, sqlite_path)
+from victims.scripts.version_check import _read_pairs
+
+BENCHMARKS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'benchmarks')
+
+
+class TestStartup(unittest.TestCase):
+    """
+    Unittests for start up cost and the sqlite3 read path.
+    """
+
+    def setUp(self):
+        """
+        Create a sqlite database file with a few rows.
+        """
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'test.db')
+        self.conf = {'database': {'url': 'sqlite:///' + self.path}}
+        connection = Connection(self.conf)
+        connection.update_cvemap([{
+            'hash': 'hash%d' % x, 'name': 'name%d' % (x % 2),
+            'version': '1.0', 'vendor': 'vendor', 'cves': 'CVE-%d' % x,
+            'db_version': x, 'format': x and 'JAR' or 'WAR'}
+            for x in range(5)])
+
+    def tearDown(self):
+        """
+        Remove the temporary directory.
+        """
+        shutil.rmtree(self.root)
+
+    def test_light_imports(self):
+        """
+        Make sure the command line entry points which can work without
+        SQLAlchemy don't import it.
+        """
+        p = subprocess.Popen([sys.executable, '-c', (
+            'import sys\n'
+            'import victims, victims.daemon\n'
+            'import victims.scripts.scan_packages\n'
+            'import victims.scripts.version_check\n'
+            'print(sorted(x for x in ("sqlalchemy", "victims.archivers", '
+            '"multiprocessing") if x in sys.modules))')],
+            stdout=subprocess.PIPE)
+        assert p.communicate()[0].strip() == '[]'
+        assert p.returncode == 0
+
+    def test_importtime_benchmark(self):
+        """
+        Verify the start up benchmark reports where import time goes.
+        """
+        sys.path.insert(0, BENCHMARKS)
+        try:
+            import bench_startup
+        finally:
+            sys.path.remove(BENCHMARKS)
+        report = bench_startup.import_time('victims.scripts.version_check')
+        assert report.startswith('import time: self [us] | cumulative')
+        assert 'victims.lite' in report
+        assert 'sqlalchemy' not in report
+        seconds, import_seconds, modules, sqlalchemy = bench_startup.measure(
+            'victims.db')
+        assert seconds >= import_seconds > 0
+        assert sqlalchemy
+
+    def test_lite_connection(self):
+        """
+        Verify the sqlite3 read path gives the same rows as SQLAlchemy.
+        """
+        assert sqlite_path('sqlite:////tmp/x.db') == '/tmp/x.db'
+        assert sqlite_path('sqlite:///x.db') == 'x.db'
+        assert sqlite_path('sqlite://') is None
+        assert sqlite_path('sqlite:///:memory:') is None
+        assert sqlite_path('postgresql://host/db') is None
+
+        reader = open_reader(self.conf)
+        assert isinstance(reader, LiteConnection)
+        assert reader.schema_version() == SCHEMA_VERSION
+        connection = Connection(self.conf)
+        hashes = ['hash%d' % x for x in range(6)]
+        for formats in (None, ['JAR'], ['WAR', 'JAR'], []):
+            expected = sorted(
+                CVERow(*[getattr(x, y) for y in CVERow._fields])
+                for x in connection.lookup(hashes, formats))
+            assert sorted(reader.lookup(hashes, formats, 3)) == expected
+        assert [x.hash for x in reader.find('name1', '1.0')] == [
+            'hash1', 'hash3']
+        assert reader.find('name1', '2.0') == []
+        assert [(x, y.hash) for x, y in reader.affected(
+            ['CVE-1', 'CVE-3', 'CVE-9'])] == [
+                ('CVE-1', 'hash1'), ('CVE-3', 'hash3')]
+
+        pairs = [('name0', '1.0'), ('name1', '2.0'), ('name1', '1.0')] * 3
+        found = sorted(x.hash for x in reader.find_many(pairs, 2))
+        assert found == ['hash%d' % x for x in range(5)]
+        assert sorted(x.hash for x in connection.find_many(pairs, 2)) == (
+            found)
+        assert list(reader.find_many([('name0', '2.0')])) == []
+        assert 'ix_cvemap_name_version' in ' '.join(reader.query_plan(
+            'SELECT hash FROM cvemap WHERE name IN (?, ?) AND version IN (?)',
+            ('name0', 'name1', '1.0')))
+        reader.close()
+
+        assert list(_read_pairs(StringIO(
+            '# name version\na 1.0\n\nb,2.0\n c , 3 \n'))) == [
+                ('a', '1.0'), ('b', '2.0'), ('c', '3')]
+        self.assertRaises(ValueError, list, _read_pairs(StringIO('a\n')))
+
+        assert isinstance(
+            open_reader({'database': {'url': 'sqlite://'}}), Connection)
+
+    def test_schema_version(self):
+        """
+        Make sure tables are only created when the schema is out of date.
+        """
+        created = []
+        create_all = Base.metadata.create_all
+        Base.metadata.create_all = lambda *args, **kwargs: (
+            created.append(args), create_all(*args, **kwargs))
+        try:
+            connection = Connection(self.conf)
+            assert created == []
+            assert connection.schema_version() == SCHEMA_VERSION
+
+            old = os.path.join(self.root, 'old.db')
+            db = sqlite3.connect(old)
+            # The layout from before the schema was versioned
+            db.execute(
+                'CREATE TABLE cvemap (hash VARCHAR(512) PRIMARY KEY, '
+                'name VARCHAR, version VARCHAR, vendor VARCHAR, '
+                'cves VARCHAR, db_version INTEGER, format VARCHAR(10))')
+            db.execute('CREATE INDEX ix_cvemap_format ON cvemap (format)')
+            db.execute(
+                "INSERT INTO cvemap VALUES ('h', 'n', '1', 'v', "
+                "'CVE-1,CVE-2', 1, 'JAR')")
+            db.commit()
+            db.close()
+            old_conf = {'database': {'url': 'sqlite:///' + old}}
+            assert isinstance(open_reader(old_conf), Connection)
+            assert len(created) == 1
+            reader = LiteConnection(old)
+            assert reader.schema_version() == SCHEMA_VERSION
+            assert 'ix_cvemap_name_version' in ' '.join(reader.query_plan(
+                'SELECT hash FROM cvemap WHERE name = ? AND version = ?',
+                ('a', '1')))
+            assert sorted(x[0] for x in reader.affected(
+                ['CVE-1', 'CVE-2'])) == ['CVE-1', 'CVE-2']
+            assert 'ix_cvemap_db_version' in ' '.join(reader.query_plan(
+                'SELECT hash FROM cvemap WHERE db_version > ?', (0,)))
+            assert reader.db_state() == (1, 1)
+            assert [x.hash for x in reader.since(0)] == ['h']
+            assert list(reader.since(1)) == []
+            Connection(old_conf)
+            assert len(created) == 1
+        finally:
+            Base.metadata.create_all = create_all
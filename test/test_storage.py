@@ -13,7 +13,11 @@ Unittest for configuration.
 
 import unittest
 
-from victims.db import CVEMap, Connection
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+
+from victims.db import CVEMap, Connection, HashCVE, _pg_upsert
+from victims.lite import split_cves
 
 
 class TestStorage(unittest.TestCase):
@@ -78,3 +82,129 @@ class TestStorage(unittest.TestCase):
         result = results[0]
         for key, value in kwargs.items():
             assert getattr(result, key) == value
+
+    def test_lookup(self):
+        """
+        Verify lookups are batched and filtered by format.
+        """
+        for x in range(25):
+            self.connection.session.add(CVEMap(
+                'hash%d' % x, 'name', '1.0', 'vendor', 'CVE-1969-0000', 1,
+                x % 2 and 'JAR' or 'WAR'))
+        self.connection.session.flush()
+
+        wanted = ['hash%d' % x for x in range(30)]
+        found = list(self.connection.lookup(wanted, batch_size=4))
+        assert sorted(x.hash for x in found) == sorted(wanted[:25])
+
+        found = list(self.connection.lookup(
+            iter(wanted), ['JAR'], batch_size=4))
+        assert sorted(x.hash for x in found) == sorted(
+            'hash%d' % x for x in range(1, 25, 2))
+
+        assert list(self.connection.lookup(wanted, [])) == []
+        assert list(self.connection.lookup([])) == []
+
+    def test_update_and_remove(self):
+        """
+        Verify updates insert, replace and delete rows in batches.
+        """
+        rows = [{
+            'hash': 'hash%d' % x,
+            'name': 'name',
+            'version': '1.0',
+            'vendor': 'vendor',
+            'cves': 'CVE-1969-0000',
+            'db_version': 1,
+            'format': 'JAR',
+        } for x in range(10)]
+        assert self.connection.update_cvemap(rows, batch_size=3) == 10
+        query = self.connection.session.query(CVEMap)
+        assert query.count() == 10
+
+        rows[0]['cves'] = 'CVE-1969-0001'
+        rows[0]['db_version'] = 2
+        assert self.connection.update_cvemap(rows[:1]) == 1
+        assert query.count() == 10
+        result = query.filter(CVEMap.hash == 'hash0').one()
+        assert (result.cves, result.db_version) == ('CVE-1969-0001', 2)
+
+        assert self.connection.remove_hashes(
+            ['hash%d' % x for x in range(5)] + ['missing'],
+            batch_size=2) == 5
+        assert query.count() == 5
+
+    def test_remove_batches(self):
+        """
+        Verify removals commit every batch_size hashes, even batches
+        larger than a single query binds.
+        """
+        rows = [{
+            'hash': 'hash%d' % x,
+            'name': 'name',
+            'version': '1.0',
+            'vendor': 'vendor',
+            'cves': 'CVE-1969-0000',
+            'db_version': 1,
+            'format': 'JAR',
+        } for x in range(1200)]
+        self.connection.update_cvemap(rows)
+        commits = []
+        event.listen(
+            self.connection.engine, 'commit', lambda x: commits.append(x))
+        assert self.connection.remove_hashes(
+            ['hash%d' % x for x in range(1100)], batch_size=1000) == 1100
+        assert len(commits) == 2
+        assert self.connection.session.query(CVEMap).count() == 100
+
+    def test_pg_upsert(self):
+        """
+        Verify the PostgreSQL upsert builds for tables with and without
+        columns outside of the primary key.
+        """
+        dialect = postgresql.dialect()
+        sql = str(_pg_upsert(CVEMap.__table__).compile(dialect=dialect))
+        assert 'ON CONFLICT (hash) DO UPDATE SET' in sql
+        assert 'db_version = excluded.db_version' in sql
+        # Every hashcve column is part of its key
+        sql = str(_pg_upsert(HashCVE.__table__).compile(dialect=dialect))
+        assert sql.endswith('ON CONFLICT (hash, cve) DO NOTHING')
+
+    def test_cve_lookup(self):
+        """
+        Make sure cves are kept in hashcve and hashes can be found by CVE.
+        """
+        rows = [{
+            'hash': 'hash%d' % x,
+            'name': 'name%d' % x,
+            'version': '1.0',
+            'vendor': 'vendor',
+            'cves': x % 2 and 'CVE-1, CVE-2,CVE-1' or 'CVE-2',
+            'db_version': 1,
+            'format': 'JAR',
+        } for x in range(6)]
+        assert self.connection.update_cvemap(rows, batch_size=4) == 6
+        query = self.connection.session.query(HashCVE)
+        assert query.count() == 9
+
+        def affected(cves):
+            return sorted(
+                (x, y.hash) for x, y in self.connection.affected(cves, 1))
+
+        assert affected(['CVE-1']) == [
+            ('CVE-1', 'hash1'), ('CVE-1', 'hash3'), ('CVE-1', 'hash5')]
+        assert len(affected(['CVE-2', 'CVE-2', 'CVE-3'])) == 6
+
+        rows[1]['cves'] = 'CVE-3'
+        self.connection.update_cvemap(rows[1:2])
+        assert affected(['CVE-3']) == [('CVE-3', 'hash1')]
+        assert ('CVE-1', 'hash1') not in affected(['CVE-1'])
+
+        assert self.connection.remove_hashes(
+            ['hash1', 'hash2', 'missing']) == 2
+        assert affected(['CVE-1', 'CVE-2', 'CVE-3']) == [
+            ('CVE-1', 'hash3'), ('CVE-1', 'hash5'), ('CVE-2', 'hash0'),
+            ('CVE-2', 'hash3'), ('CVE-2', 'hash4'), ('CVE-2', 'hash5')]
+
+        assert split_cves(' CVE-1,,CVE-2 ,CVE-1') == ['CVE-1', 'CVE-2']
+        assert split_cves(None) == []
@@ -0,0 +1,155 @@
+# Copyright 2010-2013,
+# Steve 'Ashcrow' Milner <stevem@gnulinux.net>
+#
+# This software may be freely redistributed under the terms of the GNU
+# general public license.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+"""
+Unittest for directory walkers.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from victims import PackageFinder
+from victims import walkers
+from victims.walkers import OSWalker, ThreadedWalker
+
+
+class Entry(object):
+    """
+    Directory entry like the ones scandir yields.
+    """
+
+    def __init__(self, root, name):
+        self.name = name
+        self.path = os.path.join(root, name)
+
+    def is_dir(self):
+        return os.path.isdir(self.path)
+
+    def is_symlink(self):
+        return os.path.islink(self.path)
+
+
+def fake_scandir(path):
+    """
+    Stands in for scandir where neither os.scandir nor the scandir package
+    are there.
+    """
+    return [Entry(path, x) for x in os.listdir(path)]
+
+
+class TestWalkers(unittest.TestCase):
+    """
+    Unittests for the walkers.
+    """
+
+    def setUp(self):
+        """
+        Create a small tree of directories and files.
+        """
+        self.root = tempfile.mkdtemp()
+        for x in range(3):
+            for y in range(3):
+                path = os.path.join(self.root, 'd%d' % x, 'e%d' % y)
+                os.makedirs(path)
+                open(os.path.join(path, 'f%d.jar' % y), 'w').close()
+                open(os.path.join(path, 'readme'), 'w').close()
+        os.symlink(
+            os.path.join(self.root, 'd0'), os.path.join(self.root, 'link'))
+        self.scandir = walkers.scandir
+        if self.scandir is None:
+            walkers.scandir = fake_scandir
+
+    def tearDown(self):
+        """
+        Remove the temporary tree.
+        """
+        walkers.scandir = self.scandir
+        shutil.rmtree(self.root)
+
+    def _walk(self, walker):
+        """
+        Returns a sorted list of (root, sorted files) from walker.
+        """
+        return sorted((root, sorted(files)) for root, files in walker(
+            self.root))
+
+    def test_threaded_matches_os(self):
+        """
+        Verify the threaded walker sees the same tree as os.walk.
+        """
+        threaded = ThreadedWalker(4)
+        expected = self._walk(OSWalker())
+        assert self._walk(threaded) == expected
+        assert threaded.dirs == 13
+        assert threaded.files == 18
+        assert threaded.elapsed > 0
+        assert threaded.files_per_second > 0
+
+    def test_threaded_order(self):
+        """
+        Verify the threaded walker yields the tree breadth first in sorted
+        order however long listings take.
+        """
+        expected = [(self.root, [])] + [
+            (os.path.join(self.root, 'd%d' % x), []) for x in range(3)] + [
+            (os.path.join(self.root, 'd%d' % x, 'e%d' % y),
+             ['f%d.jar' % y, 'readme']) for x in range(3) for y in range(3)]
+        # The symlink to d0 is neither walked nor a file
+        assert list(ThreadedWalker(4)(self.root)) == expected
+        assert list(ThreadedWalker(1)(self.root)) == expected
+
+    def test_threaded_run_ahead(self):
+        """
+        Make sure the threaded walker only lists a few directories ahead
+        of its caller.
+        """
+        wide = os.path.join(self.root, 'wide')
+        for x in range(20):
+            os.makedirs(os.path.join(wide, 'w%d' % x))
+        listed = []
+        list_dir = walkers._list_dir
+
+        def counting(path):
+            listed.append(path)
+            return list_dir(path)
+
+        walkers._list_dir = counting
+        try:
+            walk = ThreadedWalker(1)(wide)
+            assert walk.next() == (wide, [])
+            time.sleep(0.2)
+            # The listing handed out and at most two more
+            assert len(listed) <= 3
+            assert len(list(walk)) == 20
+        finally:
+            walkers._list_dir = list_dir
+
+    def test_threaded_without_scandir(self):
+        """
+        Make sure the threaded walker uses os.walk without scandir.
+        """
+        walkers.scandir = None
+        threaded = ThreadedWalker(4)
+        assert self._walk(threaded) == self._walk(OSWalker())
+        assert threaded.dirs == 13
+
+    def test_package_finder_walker(self):
+        """
+        Make sure PackageFinder finds the same packages with either walker.
+        """
+        for walker in ('os', 'threaded', ThreadedWalker(2)):
+            finder = PackageFinder(walker=walker)
+            data, formats = finder(self.root)
+            assert sorted(x.name for x in data) == sorted(
+                ['f0.jar', 'f1.jar', 'f2.jar'] * 3)
+            assert formats == ['JAR']
+            assert finder.walker.dirs == 13